@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('./venv/Lib/site-packages/rasterio', 'rasterio'), ('data/standard_mesh.shx', 'data'), ('data/standard_mesh.shp', 'data'), ('data/standard_mesh.prj', 'data'), ('data/standard_mesh.dbf', 'data'), ('data/standard_mesh.cpg', 'data')],
-    hiddenimports=['rasterio._shim', 'rasterio.sample'],
+    hiddenimports=['rasterio._shim', 'rasterio.sample', 'src.make_shp.mesh_gen_gui', 'src.make_shp.elev_assigner_gui', 'src.mesh_dominant_module.mesh_dominant_gui', 'src.shp_to_asc.gui', 'src.make_shp.mesh_generator', 'src.make_shp.elevation_assigner', 'src.mesh_dominant_module.mesh_dominant', 'src.shp_to_asc.core'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
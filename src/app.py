@@ -1,26 +1,28 @@
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sys
 import os
+import sys
 
 # プロジェクトのルートディレクトリをパスに追加
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-try:
-    from src.shp_to_asc.gui import ShpToAscApp
-    from src.make_shp.mesh_elev_gui import MeshElevApp
-    from src.mesh_dominant_module.mesh_dominant_gui import MeshDominantApp
-except ImportError as e:
-    # モジュールが見つからない場合のエラーメッセージ
-    import traceback
-    print(f"エラー: GUIモジュールのインポートに失敗しました。 {e}")
-    print("トレースバック:")
-    traceback.print_exc()
-    print("\nPythonパス:", sys.path)
-    print("\nカレントディレクトリ:", os.getcwd())
-    print("\n'src' ディレクトリが存在し、必要なスクリプトが含まれていることを確認してください。")
+from src.common.lazy_import import load_class, start_warm_up
+from src.common.worker import start_worker, stop_worker
+
+# 各ツールの GUI クラス（モジュール名, クラス名, ウィンドウタイトル）
+# geopandas / rasterio などの重いモジュールを読み込むため、起動時にはインポートせず
+# ボタンが押されたとき（またはウィンドウ表示後のバックグラウンド読み込み）に読み込む
+TOOLS = {
+    'mesh_elev': ('src.make_shp.mesh_elev_gui', 'MeshElevApp', "メッシュ生成と標高付与ツール"),
+    'shp_to_asc': ('src.shp_to_asc.gui', 'ShpToAscApp', "Shapefile → ASCII 変換ツール"),
+    'mesh_dominant': ('src.mesh_dominant_module.mesh_dominant_gui', 'MeshDominantApp', "メッシュ属性代表値付与ツール"),
+}
+
+# ウィンドウ表示後、バックグラウンド読み込みを始めるまでの待ち時間（ms）
+WARMUP_DELAY_MS = 200
 
 
 class MainLauncher:
@@ -64,9 +66,39 @@ class MainLauncher:
             command=self.open_mesh_dominant,
             style="Launcher.TButton"  # カスタムスタイルを適用
         ).pack(pady=5, fill='x')
-        
-        
 
+        # ウィンドウ表示後に各ツールのモジュールを裏で読み込み、ワーカープロセスを起動しておく
+        master.after(WARMUP_DELAY_MS, self._start_warm_up)
+        master.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _start_warm_up(self):
+        start_warm_up(module_name for module_name, _, _ in TOOLS.values())
+        # 各ツールの処理は常駐ワーカープロセスで実行する（UI を止めず、読み込んだデータを再利用する）
+        try:
+            start_worker()
+        except Exception as e:
+            # 起動できなければ各ツールはスレッドで処理を実行する
+            print(f"ワーカープロセスを起動できませんでした: {e}")
+
+    def _on_close(self):
+        stop_worker()
+        self.master.destroy()
+
+    def open_tool(self, key):
+        """ツールのモジュールを読み込み、新しいウィンドウで起動します。"""
+        module_name, class_name, title = TOOLS[key]
+        self.master.config(cursor="watch")
+        self.master.update_idletasks()
+        try:
+            app_class = load_class(module_name, class_name)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            messagebox.showerror("エラー", f"GUIモジュールのインポートに失敗しました: {e}")
+            return
+        finally:
+            self.master.config(cursor="")
+        self.open_new_window(app_class, title)
 
     def open_new_window(self, app_class, title):
         """指定されたアプリケーションクラスの新しいトップレベルウィンドウを開きます。"""
@@ -87,17 +119,19 @@ class MainLauncher:
 
     def open_shp_to_asc(self):
         """ShapefileからASCIIへの変換ツールを起動します。"""
-        self.open_new_window(ShpToAscApp, "Shapefile → ASCII 変換ツール")
+        self.open_tool('shp_to_asc')
 
     def open_mesh_elev(self):
         """メッシュ生成と標高付与ツールを起動します。"""
-        self.open_new_window(MeshElevApp, "メッシュ生成と標高付与ツール")
+        self.open_tool('mesh_elev')
 
     def open_mesh_dominant(self):
         """代表属性値を基準メッシュに付与ツールを起動します。"""
-        self.open_new_window(MeshDominantApp, "メッシュ属性代表値付与ツール")
+        self.open_tool('mesh_dominant')
 
 if __name__ == "__main__":
+    # PyInstaller で exe 化した場合にワーカープロセスを起動できるようにする
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = MainLauncher(root)
     root.mainloop()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+compare.py
+ベンチマークの結果を基準（ベースライン）の JSON と比べ、性能の劣化を検出する
+
+基準ファイルと同じ規模・シードで主要な処理を計測し（または --current の結果を使い）、
+処理ごとの所要時間とメモリのピークを表で表示する。どれかが許容範囲を超えて
+悪化していれば終了コード 1 を返すため、リリース前の確認や CI に使える。
+
+使用方法:
+    # 計測して基準と比較する
+    python -m src.benchmark.compare
+    # 許容範囲を変える（時間は 50%、メモリは 20% まで）
+    python -m src.benchmark.compare --tolerance 0.5 --memory-tolerance 0.2
+    # 基準を計測し直して保存する
+    python -m src.benchmark.compare --update
+"""
+import argparse
+import os
+import sys
+
+from src.benchmark.suite import SCALES, load_report, run_suite, save_report
+
+# プロジェクトのルートディレクトリ
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# 既定の基準ファイル
+DEFAULT_BASELINE = os.path.join(project_root, 'benchmarks', 'baseline.json')
+
+# 比較の対象にする処理
+GATED_BENCHMARKS = ('build_grid', 'add_elevation', 'assign_dominant_values', 'shp_to_ascii',
+                    'extract_cells')
+
+# 既定の許容範囲（基準に対する増加率）
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MEMORY_TOLERANCE = 0.25
+
+# 計測のばらつきで失敗しないよう、これ未満の増加は劣化とみなさない
+DEFAULT_MIN_SECONDS = 0.05
+DEFAULT_MIN_MB = 1.0
+
+
+def _regressed(base, current, tolerance, minimum):
+    """current が base より許容範囲を超えて大きければ True"""
+    return current - base > max(base * tolerance, minimum)
+
+
+def compare_reports(baseline, current, tolerance=DEFAULT_TOLERANCE,
+                    memory_tolerance=DEFAULT_MEMORY_TOLERANCE,
+                    min_seconds=DEFAULT_MIN_SECONDS, min_mb=DEFAULT_MIN_MB):
+    """
+    基準の結果と今回の結果を処理ごとに比べる
+
+    Returns:
+        list: 処理ごとの辞書のリスト。各辞書は以下のキーを持つ
+            - 'scale', 'name': 規模と処理名
+            - 'base_seconds', 'seconds': 所要時間（最小値）
+            - 'base_peak', 'peak': メモリのピーク（バイト。記録が無ければ None）
+            - 'status': 'ok' / 'slower'（時間の劣化）/ 'memory'（メモリの劣化）/
+              'slower+memory' / 'missing'（今回の結果に無い）
+    """
+    rows = []
+    for scale, base_scale in baseline['results'].items():
+        current_scale = current['results'].get(scale, {}).get('benchmarks', {})
+        for name, base in base_scale['benchmarks'].items():
+            entry = current_scale.get(name)
+            row = {
+                'scale': scale,
+                'name': name,
+                'base_seconds': base['seconds'],
+                'seconds': None,
+                'base_peak': base.get('peak_bytes'),
+                'peak': None,
+                'status': 'missing',
+            }
+            if entry is not None:
+                row['seconds'] = entry['seconds']
+                row['peak'] = entry.get('peak_bytes')
+                problems = []
+                if _regressed(base['seconds'], entry['seconds'], tolerance, min_seconds):
+                    problems.append('slower')
+                if row['base_peak'] is not None and row['peak'] is not None and _regressed(
+                        row['base_peak'], row['peak'], memory_tolerance, min_mb * 1024 ** 2):
+                    problems.append('memory')
+                row['status'] = '+'.join(problems) or 'ok'
+            rows.append(row)
+    return rows
+
+
+def format_table(rows):
+    """compare_reports の結果を表の文字列にする"""
+    def seconds(value):
+        return '-' if value is None else f"{value:.3f}"
+
+    def megabytes(value):
+        return '-' if value is None else f"{value / 1024 ** 2:.1f}"
+
+    def ratio(base, value):
+        return '-' if not base or value is None else f"{value / base:.2f}x"
+
+    header = ('規模', '処理', '基準(s)', '今回(s)', '比', '基準(MB)', '今回(MB)', '比', '判定')
+    lines = [header]
+    for row in rows:
+        lines.append((
+            row['scale'], row['name'],
+            seconds(row['base_seconds']), seconds(row['seconds']),
+            ratio(row['base_seconds'], row['seconds']),
+            megabytes(row['base_peak']), megabytes(row['peak']),
+            ratio(row['base_peak'], row['peak']),
+            row['status'],
+        ))
+    widths = [max(_display_width(line[i]) for line in lines) for i in range(len(header))]
+    return '\n'.join(
+        '  '.join(_pad(cell, width, i >= 2 and i < len(header) - 1)
+                  for i, (cell, width) in enumerate(zip(line, widths))).rstrip()
+        for line in lines
+    )
+
+
+def _display_width(text):
+    """全角文字を 2 桁として数えた表示幅"""
+    return sum(2 if ord(ch) > 0x2E7F else 1 for ch in text)
+
+
+def _pad(text, width, right):
+    space = ' ' * (width - _display_width(text))
+    return space + text if right else text + space
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="ベンチマーク結果を基準と比較し、性能の劣化を検出")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE, help="基準の結果 (JSON)")
+    ap.add_argument("--current", default=None,
+                    help="比較する結果 (JSON)。省略時は基準と同じ規模・シードで計測する")
+    ap.add_argument("--output", default=None, help="今回の計測結果を保存する JSON ファイル")
+    ap.add_argument("--update", action="store_true", help="計測し直して基準ファイルを上書きする")
+    ap.add_argument("--scales", nargs='+', choices=list(SCALES), default=['small'],
+                    help="--update で計測する規模（既定: small）")
+    ap.add_argument("--repeat", type=int, default=3, help="各処理の実行回数（既定: 3）")
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                    help=f"所要時間の許容増加率（既定: {DEFAULT_TOLERANCE}）")
+    ap.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE,
+                    help=f"メモリのピークの許容増加率（既定: {DEFAULT_MEMORY_TOLERANCE}）")
+    ap.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS,
+                    help=f"劣化とみなす最小の増加時間（秒, 既定: {DEFAULT_MIN_SECONDS}）")
+    ap.add_argument("--min-mb", type=float, default=DEFAULT_MIN_MB,
+                    help=f"劣化とみなす最小のメモリ増加 (MB, 既定: {DEFAULT_MIN_MB})")
+    args = ap.parse_args(argv)
+    if args.repeat < 1:
+        ap.error("--repeat は 1 以上を指定してください")
+
+    if args.update:
+        report = run_suite(args.scales, args.repeat, names=GATED_BENCHMARKS)
+        save_report(report, args.baseline)
+        print(f"基準を保存しました: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"基準ファイルがありません: {args.baseline}（--update で作成できます）", file=sys.stderr)
+        return 2
+    baseline = load_report(args.baseline)
+
+    if args.current:
+        current = load_report(args.current)
+    else:
+        scales = list(baseline['results'])
+        for scale in scales:
+            if baseline['results'][scale]['params'] != SCALES.get(scale):
+                print(f"[WARNING] 規模 {scale} のデータの大きさが基準の計測時と異なります", file=sys.stderr)
+        names = sorted({name for scale in baseline['results'].values() for name in scale['benchmarks']},
+                       key=lambda name: GATED_BENCHMARKS.index(name)
+                       if name in GATED_BENCHMARKS else len(GATED_BENCHMARKS))
+        current = run_suite([s for s in scales if s in SCALES], args.repeat,
+                            seed=baseline.get('seed', 0), names=names)
+    if args.output:
+        save_report(current, args.output)
+
+    base_commit = (baseline.get('environment') or {}).get('commit')
+    print(f"\n基準: {args.baseline}" + (f"（コミット {base_commit[:12]}）" if base_commit else ''))
+    rows = compare_reports(baseline, current, args.tolerance, args.memory_tolerance,
+                           args.min_seconds, args.min_mb)
+    print(format_table(rows))
+
+    failed = [row for row in rows if row['status'] != 'ok']
+    if failed:
+        print(f"\n性能の劣化を検出しました（{len(failed)} 件）: "
+              + ', '.join(f"{row['scale']}/{row['name']} ({row['status']})" for row in failed))
+        return 1
+    print("\n性能の劣化はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+suite.py
+主要な処理の実行時間を合成データで計測し、結果を JSON に書き出すベンチマーク
+
+規模（small / medium / large）ごとに src.benchmark.synthetic でデータを作り、
+各処理を repeat 回実行して所要時間を記録する。データは seed から決まるため、
+同じ引数で計測した JSON 同士はリリース間で比較できる。
+
+使用方法:
+    python -m src.benchmark.suite --scales small medium --repeat 3 --output bench.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from src.benchmark.synthetic import DEFAULT_CRS, DEFAULT_EXTENT, generate_dataset
+
+# 結果 JSON の形式
+RESULT_FORMAT = 1
+
+# 規模ごとのデータの大きさ（generate_dataset の引数）
+SCALES = {
+    'small': {'cells': 50, 'n_points': 50_000, 'n_classes': 5, 'n_landuse': 200,
+              'basin_vertices': 64},
+    'medium': {'cells': 200, 'n_points': 1_000_000, 'n_classes': 10, 'n_landuse': 2_000,
+               'basin_vertices': 512},
+    'large': {'cells': 500, 'n_points': 5_000_000, 'n_classes': 20, 'n_landuse': 20_000,
+              'basin_vertices': 4_096},
+}
+
+# 環境情報に記録するパッケージ
+PACKAGES = ('numpy', 'pandas', 'geopandas', 'shapely', 'pyogrio', 'fiona', 'pyproj')
+
+
+def _bench_build_grid(paths, params, work_dir):
+    from src.make_shp.generate_mesh import build_grid
+
+    def run():
+        build_grid(DEFAULT_EXTENT, params['cells'], params['cells'], DEFAULT_CRS)
+    return None, run
+
+
+def _bench_generate_mesh(paths, params, work_dir):
+    from src.make_shp.generate_mesh import main as generate_main
+
+    out_dir = os.path.join(work_dir, 'generate_mesh')
+
+    def run():
+        generate_main(paths['domain'], paths['basin'], params['cells'], params['cells'], out_dir)
+    return None, run
+
+
+def _bench_add_elevation(paths, params, work_dir):
+    from src.make_shp.add_elevation import main as elevation_main
+    from src.make_shp.generate_mesh import main as generate_main
+
+    mesh_dir = os.path.join(work_dir, 'add_elevation_mesh')
+    out_dir = os.path.join(work_dir, 'add_elevation')
+
+    def setup():
+        # 入力のメッシュは計測の対象外
+        if not os.path.exists(os.path.join(mesh_dir, 'basin_mesh.shp')):
+            generate_main(paths['domain'], paths['basin'], params['cells'], params['cells'], mesh_dir)
+
+    def run():
+        elevation_main(os.path.join(mesh_dir, 'basin_mesh.shp'),
+                       os.path.join(mesh_dir, 'domain_mesh.shp'),
+                       paths['points'], out_dir, zcol='elevation')
+    return setup, run
+
+
+def _bench_extract_cells(paths, params, work_dir):
+    from src.make_shp.extract_standard_mesh import extract_cells
+
+    output = os.path.join(work_dir, 'extract_cells', 'domain_standard_mesh.shp')
+
+    def run():
+        extract_cells(paths['standard_mesh'], paths['domain'], output, 'mesh_id')
+    return None, run
+
+
+def _bench_assign_dominant_values(paths, params, work_dir):
+    from src.mesh_dominant_module.mesh_dominant import assign_dominant_values
+
+    output = os.path.join(work_dir, 'assign_dominant_values', 'mesh_landuse.shp')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    def run():
+        assign_dominant_values(paths['mesh'], paths['landuse'], 'landuse', output_path=output)
+    return None, run
+
+
+def _bench_shp_to_ascii(paths, params, work_dir):
+    from src.shp_to_asc import core
+
+    output = os.path.join(work_dir, 'shp_to_ascii', 'mesh.asc')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    def setup():
+        # 格子構造の解析結果のキャッシュを使わずに計測する
+        core._analyze_grid_cached.cache_clear()
+
+    def run():
+        core.shp_to_ascii(paths['mesh'], 'mesh_id', output)
+    return setup, run
+
+
+# ベンチマーク名 -> (入力ファイル, 規模, 作業フォルダ) から (setup, run) を返す関数
+BENCHMARKS = {
+    'build_grid': _bench_build_grid,
+    'generate_mesh': _bench_generate_mesh,
+    'add_elevation': _bench_add_elevation,
+    'extract_cells': _bench_extract_cells,
+    'assign_dominant_values': _bench_assign_dominant_values,
+    'shp_to_ascii': _bench_shp_to_ascii,
+}
+
+
+def environment_info():
+    """Python・OS・主要パッケージのバージョンと git のコミットを辞書で返す"""
+    from importlib import metadata
+
+    packages = {}
+    for name in PACKAGES:
+        try:
+            packages[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            packages[name] = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'packages': packages,
+        'commit': commit,
+    }
+
+
+def time_benchmark(setup, run, repeat=3, quiet=True):
+    """setup（計測しない）と run を repeat 回実行し、run の所要時間（秒）のリストを返す"""
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def measure_peak_memory(setup, run, quiet=True):
+    """
+    run を 1 回実行し、その間に確保されたメモリのピーク（バイト）を返す
+    tracemalloc で計測するため、Python と NumPy が確保したメモリが対象（GDAL などの内部の確保は含まない）。
+    計測中は遅くなるため、時間の計測とは別に実行する
+    """
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            run()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def run_suite(scales=('small',), repeat=3, seed=0, names=None, work_dir=None, verbose=False,
+              memory=True):
+    """
+    ベンチマークを実行し、結果の辞書を返す
+
+    Args:
+        scales: 計測する規模（SCALES のキー）
+        repeat: 各処理の実行回数
+        seed: 合成データの乱数シード
+        names: 計測する処理（BENCHMARKS のキー。省略時はすべて）
+        work_dir: データと出力を置くフォルダ（省略時は一時フォルダを作り、終了後に削除する）
+        verbose: True なら処理の標準出力を表示する
+        memory: True なら時間とは別に 1 回実行してメモリのピークも記録する（'peak_bytes'）
+    """
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"未知のベンチマークです: {unknown}（選択肢: {list(BENCHMARKS)}）")
+
+    owns_work_dir = work_dir is None
+    if owns_work_dir:
+        work_dir = tempfile.mkdtemp(prefix='geomesh_bench_')
+    results = {}
+    try:
+        for scale in scales:
+            params = SCALES[scale]
+            scale_dir = os.path.join(work_dir, scale)
+            print(f"=== {scale}: データ作成 {params} ===")
+            start = time.perf_counter()
+            paths = generate_dataset(os.path.join(scale_dir, 'data'), seed=seed, **params)
+            print(f"  データ作成 {time.perf_counter() - start:.2f}s")
+
+            benchmarks = {}
+            for name in names:
+                setup, run = BENCHMARKS[name](paths, params, scale_dir)
+                times = time_benchmark(setup, run, repeat, quiet=not verbose)
+                benchmarks[name] = {
+                    'seconds': min(times),
+                    'median': statistics.median(times),
+                    'times': times,
+                }
+                line = f"  {name:<24} 最小 {min(times):8.3f}s  中央値 {statistics.median(times):8.3f}s"
+                if memory:
+                    peak = measure_peak_memory(setup, run, quiet=not verbose)
+                    benchmarks[name]['peak_bytes'] = peak
+                    line += f"  メモリ {peak / 1024 ** 2:8.1f}MB"
+                print(line)
+            results[scale] = {'params': params, 'benchmarks': benchmarks}
+    finally:
+        if owns_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'format': RESULT_FORMAT,
+        'created': datetime.datetime.now().astimezone().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def save_report(report, path):
+    """結果の辞書を JSON ファイルに保存する"""
+    out_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(out_dir, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def load_report(path):
+    """save_report で保存した結果を読み込む"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="合成データによるベンチマーク（結果を JSON に出力）")
+    ap.add_argument("--scales", nargs='+', choices=list(SCALES), default=['small'],
+                    help="計測する規模（既定: small）")
+    ap.add_argument("--only", nargs='+', choices=list(BENCHMARKS), default=None,
+                    help="計測する処理（既定: すべて）")
+    ap.add_argument("--repeat", type=int, default=3, help="各処理の実行回数（既定: 3）")
+    ap.add_argument("--seed", type=int, default=0, help="合成データの乱数シード（既定: 0）")
+    ap.add_argument("--output", default="benchmark_results.json", help="結果の JSON ファイル")
+    ap.add_argument("--workdir", default=None, help="データと出力を残すフォルダ（省略時は一時フォルダ）")
+    ap.add_argument("--no-memory", action="store_true", help="メモリのピークを計測しない")
+    ap.add_argument("--verbose", action="store_true", help="各処理の標準出力を表示")
+    args = ap.parse_args(argv)
+    if args.repeat < 1:
+        ap.error("--repeat は 1 以上を指定してください")
+
+    report = run_suite(args.scales, args.repeat, args.seed, args.only, args.workdir, args.verbose,
+                       memory=not args.no_memory)
+    save_report(report, args.output)
+    print(f"結果を保存しました: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
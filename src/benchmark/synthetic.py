@@ -0,0 +1,149 @@
+"""
+synthetic.py
+ベンチマーク用の合成データ（計算領域・流域界・規則メッシュ・点群・土地利用）を作成する
+
+同じ seed からは常に同じデータを作るため、リリース間で計測結果を比較できる。
+座標は平面直角座標系（メートル）で、範囲は (0, 0) から extent までとする。
+
+Usage:
+    from src.benchmark.synthetic import generate_dataset
+
+    paths = generate_dataset('./bench_data', cells=100, n_points=200_000, n_classes=8)
+    print(paths['domain'], paths['points'])
+"""
+import os
+
+import numpy as np
+
+# 合成データの座標参照系（JGD2011 平面直角座標系 第 IX 系）
+DEFAULT_CRS = 'EPSG:6677'
+
+# 既定の範囲（メートル）
+DEFAULT_EXTENT = (0.0, 0.0, 10_000.0, 10_000.0)
+
+
+def make_domain(extent=DEFAULT_EXTENT, n_features=1, crs=DEFAULT_CRS):
+    """
+    範囲を横方向に n_features 個の矩形に分けた計算領域ポリゴンを返す
+    （generate_mesh はフィーチャごとにメッシュを作るため、フィーチャ数で負荷を変えられる）
+    """
+    import geopandas as gpd
+    import shapely
+
+    minx, miny, maxx, maxy = extent
+    xs = np.linspace(minx, maxx, n_features + 1)
+    polys = shapely.box(xs[:-1], miny, xs[1:], maxy)
+    return gpd.GeoDataFrame({'id': np.arange(1, n_features + 1)}, geometry=polys, crs=crs)
+
+
+def make_basin(extent=DEFAULT_EXTENT, n_vertices=64, roughness=0.3, seed=0, crs=DEFAULT_CRS):
+    """
+    範囲の中央に星形の流域界ポリゴンを作る
+
+    Args:
+        n_vertices: 頂点数（境界の複雑さ。クリップや空間結合の負荷が変わる）
+        roughness: 半径のゆらぎの大きさ（0 で円、大きいほど入り組んだ境界）
+    """
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = extent
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    base = 0.4 * min(maxx - minx, maxy - miny)
+
+    theta = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    # 低周波のうねりと頂点ごとの乱れを重ねる
+    radius = np.ones(n_vertices)
+    for k in range(2, 7):
+        radius += roughness / k * np.sin(k * theta + rng.uniform(0, 2 * np.pi))
+    radius += roughness * 0.3 * rng.uniform(-1, 1, n_vertices)
+    radius = base * np.clip(radius / radius.max(), 0.2, 1.0)
+
+    coords = np.column_stack([cx + radius * np.cos(theta), cy + radius * np.sin(theta)])
+    polygon = shapely.make_valid(shapely.Polygon(coords))
+    return gpd.GeoDataFrame({'id': [1]}, geometry=[polygon], crs=crs)
+
+
+def make_regular_mesh(extent=DEFAULT_EXTENT, ncols=100, nrows=100, crs=DEFAULT_CRS, id_col='mesh_id'):
+    """範囲を ncols x nrows に分けた規則メッシュを返す（id_col に 1 始まりの通し番号を付ける）"""
+    from src.make_shp.generate_mesh import build_grid
+
+    mesh = build_grid(extent, ncols, nrows, crs)
+    mesh.insert(0, id_col, np.arange(1, len(mesh) + 1))
+    return mesh
+
+
+def make_points(extent=DEFAULT_EXTENT, n_points=100_000, seed=0, nan_fraction=0.0):
+    """
+    範囲内に一様に分布する点群を x, y, elevation 列の DataFrame で返す
+    標高はなだらかな地形に小さなノイズを加えたもの。nan_fraction の割合で標高を欠損にする
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = extent
+    x = rng.uniform(minx, maxx, n_points)
+    y = rng.uniform(miny, maxy, n_points)
+    u = (x - minx) / (maxx - minx)
+    v = (y - miny) / (maxy - miny)
+    z = 100 + 400 * u * v + 50 * np.sin(6 * u) * np.cos(4 * v) + rng.normal(0, 1, n_points)
+    if nan_fraction > 0:
+        z[rng.random(n_points) < nan_fraction] = np.nan
+    return pd.DataFrame({'x': x, 'y': y, 'elevation': z})
+
+
+def make_landuse(extent=DEFAULT_EXTENT, n_polygons=500, n_classes=5, seed=0, crs=DEFAULT_CRS,
+                 field='landuse'):
+    """
+    範囲をボロノイ分割した土地利用ポリゴンを返す（field に 1〜n_classes の分類を付ける）
+    """
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = extent
+    seeds = shapely.points(rng.uniform(minx, maxx, n_polygons), rng.uniform(miny, maxy, n_polygons))
+    frame = shapely.box(minx, miny, maxx, maxy)
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(seeds), extend_to=frame))
+    cells = shapely.intersection(cells, frame)
+    cells = cells[~shapely.is_empty(cells)]
+    classes = rng.integers(1, n_classes + 1, len(cells))
+    return gpd.GeoDataFrame({field: classes}, geometry=cells, crs=crs)
+
+
+def generate_dataset(out_dir, cells=100, n_points=100_000, n_classes=5, n_landuse=500,
+                     basin_vertices=64, n_domain_features=1, seed=0, extent=DEFAULT_EXTENT,
+                     crs=DEFAULT_CRS):
+    """
+    ベンチマーク用のデータ一式を out_dir に書き出し、ファイルパスの辞書を返す
+
+    Returns:
+        dict: 以下のキーを持つ辞書
+            - 'domain': 計算領域ポリゴン (.shp)
+            - 'basin': 流域界ポリゴン (.shp)
+            - 'mesh': 計算領域を cells x cells に分けた規則メッシュ (.shp)
+            - 'standard_mesh': 計算領域より広い範囲の規則メッシュ（標準メッシュ抽出用, .shp）
+            - 'points': 点群 (.csv)
+            - 'landuse': 土地利用ポリゴン (.shp)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        'domain': os.path.join(out_dir, 'domain.shp'),
+        'basin': os.path.join(out_dir, 'basin.shp'),
+        'mesh': os.path.join(out_dir, 'mesh.shp'),
+        'standard_mesh': os.path.join(out_dir, 'standard_mesh.shp'),
+        'points': os.path.join(out_dir, 'points.csv'),
+        'landuse': os.path.join(out_dir, 'landuse.shp'),
+    }
+    minx, miny, maxx, maxy = extent
+    pad_x, pad_y = (maxx - minx) / 2, (maxy - miny) / 2
+    wide = (minx - pad_x, miny - pad_y, maxx + pad_x, maxy + pad_y)
+
+    make_domain(extent, n_domain_features, crs).to_file(paths['domain'])
+    make_basin(extent, basin_vertices, seed=seed, crs=crs).to_file(paths['basin'])
+    make_regular_mesh(extent, cells, cells, crs).to_file(paths['mesh'])
+    make_regular_mesh(wide, cells * 2, cells * 2, crs).to_file(paths['standard_mesh'])
+    make_points(extent, n_points, seed).to_csv(paths['points'], index=False)
+    make_landuse(extent, n_landuse, n_classes, seed, crs).to_file(paths['landuse'])
+    return paths
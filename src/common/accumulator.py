@@ -0,0 +1,279 @@
+"""
+accumulator.py
+セルごとの集計値（合計・点数・面積など）を足し込む配列を、メモリ上またはディスク上に作る
+
+数億セルのメッシュでは、集計用の配列（セル数 x 8 バイトが数本）だけでメモリが足りなくなる。
+directory を指定すると配列を一時ファイルの np.memmap として作り、OS のページキャッシュに
+任せて必要な部分だけをメモリに載せる。
+
+add_at は足し込むセル番号を安定ソートしてから加算するため、ファイルへのアクセスは
+チャンクごとに先頭から末尾への一方向になる（同じセルへの加算順は入力順のまま変わらないので、
+np.bincount で一括集計した場合と結果は一致する）。最小・最大は minimum_at / maximum_at で
+同じように求め、分位点（中央値など）は QuantileSketch で値の分布を区間ごとの個数として集計する。
+セルごと・属性値ごとの合計のように組の種類が多い集計は、密な配列の代わりに PairSums で
+値のある (セル, キー) の組だけを持つ。
+
+Usage:
+    with accumulator_arrays({'sum': (n, 'float64'), 'count': (n, 'int64')}, 'D:/work') as acc:
+        for cells, values in chunks:
+            add_at(acc['sum'], cells, values)
+            add_at(acc['count'], cells)
+        mean = divide_blocks(acc['sum'], acc['count'])
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# divide_blocks などで一度に処理するセル数（memmap を読むときのメモリの上限になる）
+BLOCK_CELLS = 4_000_000
+
+
+@contextlib.contextmanager
+def accumulator_arrays(specs, directory=None):
+    """
+    0 で初期化した集計用の配列を作るコンテキストマネージャ
+
+    Args:
+        specs: 名前 -> (shape, dtype) の辞書
+        directory: 指定するとこのフォルダ内の一時フォルダに np.memmap として作る
+            （抜けるときに一時フォルダごと削除する。省略時はメモリ上の np.ndarray）
+
+    Yields:
+        dict: 名前 -> 配列
+    """
+    if directory is None:
+        yield {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in specs.items()}
+        return
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.accumulator-', dir=directory)
+    arrays = {}
+    try:
+        for name, (shape, dtype) in specs.items():
+            # w+ で作ったファイルは 0 で埋まっている（疎なファイルになるため作成は一瞬）
+            arrays[name] = np.memmap(os.path.join(tmp_dir, f'{name}.bin'), dtype=dtype,
+                                     mode='w+', shape=shape)
+        yield arrays
+    finally:
+        for array in arrays.values():
+            mm = getattr(array, '_mmap', None)
+            if mm is not None:
+                try:
+                    mm.close()
+                except BufferError:
+                    # 呼び出し側がビューを持っている場合は閉じられない（削除は OS に任せる）
+                    pass
+        arrays.clear()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def add_at(target, index, values=None):
+    """
+    target[index] に values を足し込む（values を省略すると 1 ずつ数える）
+    index を安定ソートしてから加算し、target へのアクセスを先頭からの一方向にする
+    （index が既に昇順なら並べ替えを省く。同じ index で何度も足し込む場合は呼び出し側で
+    1 回だけ並べ替えておくと速い）
+
+    Args:
+        target: 1 次元の集計配列（np.memmap でもよい）
+        index: 足し込む位置の整数配列
+        values: 足し込む値（index と同じ長さ）
+    """
+    index = np.asarray(index)
+    if len(index) == 0:
+        return
+    if values is not None:
+        values = np.asarray(values)
+    if (np.diff(index) < 0).any():
+        order = np.argsort(index, kind='stable')
+        index = index[order]
+        values = None if values is None else values[order]
+    if values is None:
+        cells, counts = np.unique(index, return_counts=True)
+        target[cells] += counts
+    else:
+        np.add.at(target, index, values)
+
+
+def _ufunc_at(ufunc, target, index, values):
+    """ufunc.at(target, index, values) を index の昇順で行う（add_at と同じ並べ替え）"""
+    index = np.asarray(index)
+    if len(index) == 0:
+        return
+    values = np.asarray(values)
+    if (np.diff(index) < 0).any():
+        order = np.argsort(index, kind='stable')
+        index, values = index[order], values[order]
+    ufunc.at(target, index, values)
+
+
+def minimum_at(target, index, values):
+    """target[index] を values との小さい方にする（target は +inf で初期化しておく）"""
+    _ufunc_at(np.minimum, target, index, values)
+
+
+def maximum_at(target, index, values):
+    """target[index] を values との大きい方にする（target は -inf で初期化しておく）"""
+    _ufunc_at(np.maximum, target, index, values)
+
+
+def divide_blocks(numerator, denominator, out=None):
+    """
+    numerator / denominator を BLOCK_CELLS ずつ計算する（0 / 0 は NaN）
+    memmap の集計配列から平均などを求めるときに、一時配列をブロックの大きさに抑える
+    """
+    if out is None:
+        out = np.empty(len(numerator), dtype='float64')
+    for start in range(0, len(numerator), BLOCK_CELLS):
+        stop = start + BLOCK_CELLS
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[start:stop] = numerator[start:stop] / denominator[start:stop]
+    return out
+
+
+class PairSums:
+    """
+    (セル, キー) の組ごとの値の合計を、値のある組だけの疎な配列で集計する
+
+    セル数 x キーの種類数の密な配列と違い、保持する行数は実際に現れた組の数で抑えられる。
+    組は (セル, キー) の昇順の配列で持ち、追加分がたまったらまとめて並べ替えて集約する。
+
+    Args:
+        cells, keys, values: 保存しておいた内容（arrays の戻り値）から作り直す場合に指定
+        dtype: 値の型
+    """
+
+    def __init__(self, cells=None, keys=None, values=None, dtype='float64'):
+        empty = np.array([], dtype=np.int64)
+        self.cells = empty if cells is None else np.asarray(cells, dtype=np.int64)
+        self.keys = empty if keys is None else np.asarray(keys, dtype=np.int64)
+        self.values = np.array([], dtype=dtype) if values is None else np.asarray(values, dtype=dtype)
+        self._pending = []
+        self._pending_rows = 0
+
+    @staticmethod
+    def _reduce(cells, keys, values):
+        """(セル, キー) が同じ行の値を合計し、昇順に並べる"""
+        if len(cells) == 0:
+            return cells, keys, values
+        order = np.lexsort((keys, cells))
+        cells, keys, values = cells[order], keys[order], values[order]
+        starts = np.flatnonzero(np.r_[True, (cells[1:] != cells[:-1]) | (keys[1:] != keys[:-1])])
+        return cells[starts], keys[starts], np.add.reduceat(values, starts)
+
+    def add(self, cells, keys, values):
+        """セル番号 cells・キー keys の組に values を足す"""
+        cells = np.asarray(cells, dtype=np.int64)
+        if len(cells) == 0:
+            return
+        reduced = self._reduce(cells, np.asarray(keys, dtype=np.int64),
+                               np.asarray(values, dtype=self.values.dtype))
+        self._pending.append(reduced)
+        self._pending_rows += len(reduced[0])
+        # 追加分が集約済みの行数を超えたら集約する（集約の回数を対数回に抑える）
+        if self._pending_rows > max(len(self.cells), 1_000_000):
+            self._compact()
+
+    def merge(self, other):
+        """別の集計の内容を加える"""
+        other._compact()
+        self._pending.append((other.cells, other.keys, other.values))
+        self._pending_rows += len(other.cells)
+        self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = [(self.cells, self.keys, self.values)] + self._pending
+        self.cells, self.keys, self.values = self._reduce(
+            *(np.concatenate([part[i] for part in parts]) for i in range(3)))
+        self._pending = []
+        self._pending_rows = 0
+
+    def arrays(self):
+        """保存用の (cells, keys, values) を返す"""
+        self._compact()
+        return self.cells, self.keys, self.values
+
+    def argmax(self, n):
+        """
+        セル 0..n-1 ごとに合計が最大のキーを返す（同じ合計ならキーの小さい方。
+        正の合計を持つ組の無いセルは -1）
+        """
+        self._compact()
+        best = np.full(n, -1, dtype=np.int64)
+        if len(self.cells) == 0:
+            return best
+        starts = np.flatnonzero(np.r_[True, self.cells[1:] != self.cells[:-1]])
+        peaks = np.maximum.reduceat(self.values, starts)
+        sizes = np.diff(np.r_[starts, len(self.cells)])
+        is_peak = (self.values == np.repeat(peaks, sizes)) & (self.values > 0)
+        # 各セルの最大の組のうち先頭（キーの昇順なので最小のキー）
+        rows = np.flatnonzero(is_peak)
+        _, first = np.unique(self.cells[rows], return_index=True)
+        rows = rows[first]
+        best[self.cells[rows]] = self.keys[rows]
+        return best
+
+
+class QuantileSketch(PairSums):
+    """
+    セルごとの値の分布を、幅 resolution の区間ごとの個数で表すスケッチ（分位点の近似に使う）
+
+    値を 1 回ずつ add するだけで分位点が求まり、誤差は resolution / 2 以内になる。
+    保持する区間の数はセルごとに「値の範囲 / resolution」と点数の小さい方で抑えられる。
+    区間は (セル, 区間番号) ごとの個数として PairSums で集計する。
+
+    Args:
+        resolution: 区間の幅（値と同じ単位）
+        cells, bins, counts: 保存しておいたスケッチ（arrays の戻り値）から作り直す場合に指定
+    """
+
+    def __init__(self, resolution, cells=None, bins=None, counts=None):
+        if not resolution > 0:
+            raise ValueError("分位点の分解能には正の値を指定してください")
+        self.resolution = float(resolution)
+        super().__init__(cells, bins, counts, dtype=np.int64)
+
+    @property
+    def bins(self):
+        return self.keys
+
+    @property
+    def counts(self):
+        return self.values
+
+    def add(self, cells, values):
+        """セル番号 cells の値 values を加える（NaN を含めないこと）"""
+        bins = np.floor(np.asarray(values, dtype='float64') / self.resolution).astype(np.int64)
+        super().add(cells, bins, np.ones(len(bins), dtype=np.int64))
+
+    def merge(self, other):
+        """別のスケッチ（同じ resolution）の内容を加える"""
+        if other.resolution != self.resolution:
+            raise ValueError("分解能の異なるスケッチは合わせられません")
+        super().merge(other)
+
+    def quantile(self, q, n):
+        """
+        セル 0..n-1 の分位点 q（0〜1）の近似値を返す（値の無いセルは NaN）
+        順位 q * (個数 - 1) の前後の値が入る区間の中央を、np.quantile（linear）と同じく順位の端数で
+        内挿する。前後の値の誤差がそれぞれ resolution / 2 以内なので、結果の誤差も resolution / 2 以内
+        """
+        self._compact()
+        result = np.full(n, np.nan)
+        if len(self.cells) == 0:
+            return result
+        starts = np.flatnonzero(np.r_[True, self.cells[1:] != self.cells[:-1]])
+        cells = self.cells[starts]
+        totals = np.add.reduceat(self.counts, starts)
+        cumulative = np.cumsum(self.counts)
+        before = cumulative[starts] - self.counts[starts]
+        rank = q * (totals - 1)
+        centers = (self.bins + 0.5) * self.resolution
+        lower = centers[np.searchsorted(cumulative, before + np.floor(rank), side='right')]
+        upper = centers[np.searchsorted(cumulative, before + np.ceil(rank), side='right')]
+        result[cells] = lower + (rank - np.floor(rank)) * (upper - lower)
+        return result
@@ -0,0 +1,41 @@
+"""
+cancel.py
+長時間処理の協調的キャンセル
+
+GUI などの呼び出し側が CancelToken を作って処理関数に渡し、cancel() を呼ぶと、
+処理側はチャンクや段階の区切りで check() を呼んだときに JobCancelled を送出して中断する。
+"""
+import threading
+
+
+class JobCancelled(Exception):
+    """処理がキャンセルされたことを表す例外"""
+
+    def __init__(self, message="処理がキャンセルされました"):
+        super().__init__(message)
+
+
+class CancelToken:
+    """スレッド間で共有するキャンセル要求フラグ"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """キャンセルを要求する（どのスレッドからでも呼べる）"""
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """キャンセルが要求されていれば JobCancelled を送出する"""
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+def check_cancel(cancel):
+    """cancel が None でなければ check() を呼ぶ（キャンセル引数を省略可能にするための補助関数）"""
+    if cancel is not None:
+        cancel.check()
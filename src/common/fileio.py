@@ -0,0 +1,65 @@
+"""
+fileio.py
+出力ファイルの書き出し補助
+
+シェープファイルやグリッドは .shx / .dbf / .prj / .hdr などの付属ファイルを伴うため、
+一時的な名前で書き出してから付属ファイルごと正式な名前へ置き換える。
+途中で失敗・キャンセルした場合は一時ファイルを削除し、書きかけの出力を残さない。
+
+入力ファイルの変更検出に使うフィンガープリント（構成ファイルの更新時刻・サイズ）もここで求める。
+"""
+import contextlib
+import glob
+import os
+import uuid
+
+# フィンガープリントに含めるシェープファイルの構成ファイル
+SHP_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+
+def _sidecars(base):
+    """base と同じ名前（拡張子違い）のファイルを返す"""
+    return glob.glob(glob.escape(base) + '.*')
+
+
+@contextlib.contextmanager
+def atomic_output(output_path):
+    """
+    一時パスを渡し、with ブロックが正常終了したら付属ファイルごと output_path へ置き換える
+
+    Usage:
+        with atomic_output("out/mesh.shp") as tmp_path:
+            gdf.to_file(tmp_path)
+
+    例外（キャンセルを含む）で抜けた場合は一時ファイルを削除して例外を再送出する。
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+    final_base, ext = os.path.splitext(os.path.abspath(output_path))
+    tmp_base = os.path.join(out_dir, f".{os.path.basename(final_base)}.tmp-{uuid.uuid4().hex[:8]}")
+    try:
+        yield tmp_base + ext
+    except BaseException:
+        for path in _sidecars(tmp_base):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        raise
+
+    for path in _sidecars(tmp_base):
+        os.replace(path, final_base + path[len(tmp_base):])
+
+
+def file_fingerprint(path):
+    """
+    ファイルの (拡張子, 更新時刻, サイズ) のタプルを返す
+    シェープファイルは .dbf などの構成ファイルも含める。ファイルが無ければ None
+    """
+    base, ext = os.path.splitext(os.path.abspath(path))
+    parts = SHP_PARTS if ext.lower() == '.shp' else (ext,)
+    stats = []
+    for part in parts:
+        part_path = base + part
+        if os.path.exists(part_path):
+            stat = os.stat(part_path)
+            stats.append((part.lower(), stat.st_mtime_ns, stat.st_size))
+    return tuple(stats) or None
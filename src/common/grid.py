@@ -0,0 +1,164 @@
+"""
+grid.py
+軸に平行な等間隔メッシュ（規則格子）の判定と、セル番号の計算
+
+各フィーチャのバウンディングボックスだけから判定するため、
+どの入力に対しても毎回実行できる程度に軽い。
+"""
+import numpy as np
+import shapely
+
+# セルサイズに対する相対許容誤差
+DEFAULT_TOLERANCE = 1e-4
+
+# 点が格子線上（セル境界上）にあるとみなす、格子線からの距離（セルサイズに対する比）
+EDGE_TOLERANCE = 1e-9
+
+
+def detect_regular_grid(bounds, geometries=None, tol=DEFAULT_TOLERANCE):
+    """
+    フィーチャ群が規則格子（同じ大きさの矩形セルが重複なく格子状に並ぶ）かを判定する
+
+    Args:
+        bounds: (N, 4) の配列 [minx, miny, maxx, maxy]
+        geometries: ジオメトリの配列（指定すると各セルが矩形かも面積で確認する）
+        tol: セルサイズに対する相対許容誤差
+
+    Returns:
+        dict | None: 規則格子でなければ None。規則格子の場合は以下のキーを持つ辞書
+            - 'origin': 左下隅の座標 (x0, y0)
+            - 'dx', 'dy': セルサイズ
+            - 'ncols', 'nrows': 格子の列数・行数
+            - 'extent': 格子の範囲 (minx, miny, maxx, maxy)
+            - 'rows': 各フィーチャの行番号（上端が 0、ラスタと同じ向き）
+            - 'cols': 各フィーチャの列番号（左端が 0）
+    """
+    bounds = np.asarray(bounds, dtype='float64')
+    if bounds.ndim != 2 or bounds.shape[1] != 4 or len(bounds) == 0:
+        return None
+    if not np.isfinite(bounds).all():
+        return None
+
+    minxs, minys, maxxs, maxys = bounds.T
+    widths = maxxs - minxs
+    heights = maxys - minys
+
+    dx = float(np.median(widths))
+    dy = float(np.median(heights))
+    if dx <= 0 or dy <= 0:
+        return None
+    if np.abs(widths - dx).max() > tol * dx or np.abs(heights - dy).max() > tol * dy:
+        return None
+
+    x0, y0 = float(minxs.min()), float(minys.min())
+    x1, y1 = float(maxxs.max()), float(maxys.max())
+    ncols = int(round((x1 - x0) / dx))
+    nrows = int(round((y1 - y0) / dy))
+    if ncols <= 0 or nrows <= 0:
+        return None
+    # 全体範囲からセルサイズを求め直して丸め誤差を抑える
+    dx = (x1 - x0) / ncols
+    dy = (y1 - y0) / nrows
+
+    # 各セルの左下隅が格子点上にあるか
+    fx = (minxs - x0) / dx
+    fy = (minys - y0) / dy
+    cols = np.rint(fx).astype(np.int64)
+    rows_from_bottom = np.rint(fy).astype(np.int64)
+    if np.abs(fx - cols).max() > tol or np.abs(fy - rows_from_bottom).max() > tol:
+        return None
+
+    # 同じセルに複数のフィーチャがあれば規則格子とはみなさない
+    rows = nrows - 1 - rows_from_bottom
+    cell_index = rows * ncols + cols
+    if len(np.unique(cell_index)) != len(cell_index):
+        return None
+
+    # 矩形でないセル（bbox は同じでも面積が小さい）を除外
+    if geometries is not None:
+        areas = shapely.area(np.asarray(geometries))
+        if np.abs(areas - dx * dy).max() > 2 * tol * dx * dy:
+            return None
+
+    return {
+        'origin': (x0, y0),
+        'dx': dx,
+        'dy': dy,
+        'ncols': ncols,
+        'nrows': nrows,
+        'extent': (x0, y0, x1, y1),
+        'rows': rows,
+        'cols': cols,
+    }
+
+
+def detect_layer_grid(gdf, tol=DEFAULT_TOLERANCE):
+    """GeoDataFrame を対象に detect_regular_grid を実行する"""
+    if gdf.empty:
+        return None
+    return detect_regular_grid(gdf.geometry.bounds.to_numpy(), gdf.geometry.values, tol)
+
+
+def _grid_coords(grid, x, y):
+    """点の座標を、格子の左下隅を原点としたセル単位の座標にする"""
+    x0, y0 = grid['origin']
+    return ((np.asarray(x, dtype='float64') - x0) / grid['dx'],
+            (np.asarray(y, dtype='float64') - y0) / grid['dy'])
+
+
+def _on_edge(fx, fy, tol):
+    return (np.abs(fx - np.rint(fx)) <= tol) | (np.abs(fy - np.rint(fy)) <= tol)
+
+
+def on_cell_edge(grid, x, y, tol=EDGE_TOLERANCE):
+    """点が格子線上（セル境界上。格子線からセルサイズの tol 倍以内）にあれば True"""
+    return _on_edge(*_grid_coords(grid, x, y), tol)
+
+
+def point_cells(grid, x, y, tol=EDGE_TOLERANCE):
+    """
+    点の座標から格子の行・列番号を求める
+
+    gpd.sjoin(predicate='within') と同じく、セル境界上の点（on_cell_edge）はどのセルにも含めない
+    （ポリゴンの境界上の点は内側とみなされない）。境界上の点と格子の外側の点は行・列とも -1 になる。
+
+    Returns:
+        tuple: (rows, cols) の int64 配列（行は上端が 0）
+    """
+    fx, fy = _grid_coords(grid, x, y)
+    cols = np.floor(fx)
+    rows_from_bottom = np.floor(fy)
+    inside = (
+        (cols >= 0) & (cols < grid['ncols'])
+        & (rows_from_bottom >= 0) & (rows_from_bottom < grid['nrows'])
+        & ~_on_edge(fx, fy, tol)
+    )
+    rows = np.where(inside, grid['nrows'] - 1 - rows_from_bottom, -1).astype(np.int64)
+    cols = np.where(inside, cols, -1).astype(np.int64)
+    return rows, cols
+
+
+def cell_lookup(grid, out=None):
+    """
+    格子の通し番号（rows * ncols + cols）から、フィーチャの位置を引く配列を返す
+    フィーチャの無いセルは -1。out（長さ nrows * ncols の int64 配列、np.memmap でもよい）を
+    渡すとそこに書き込む
+    """
+    if out is None:
+        lookup = np.full(grid['nrows'] * grid['ncols'], -1, dtype=np.int64)
+    else:
+        lookup = out
+        lookup[:] = -1
+    lookup[grid['rows'] * grid['ncols'] + grid['cols']] = np.arange(len(grid['rows']))
+    return lookup
+
+
+def locate_points(grid, x, y, lookup=None):
+    """
+    点が含まれるフィーチャの位置（0 始まり）を返す。どのフィーチャにも含まれない点は -1
+    """
+    if lookup is None:
+        lookup = cell_lookup(grid)
+    rows, cols = point_cells(grid, x, y)
+    inside = rows >= 0
+    return np.where(inside, lookup[np.where(inside, rows * grid['ncols'] + cols, 0)], -1)
@@ -0,0 +1,170 @@
+"""
+layer_cache.py
+読み込んだベクタレイヤ・CSV のプロセス内キャッシュ
+
+ランチャーのワーカープロセス（src.common.worker）で enable() を呼ぶと、
+同じ入力ファイルを使う 2 回目以降の実行では読み込みを省略する。
+キャッシュが無効なとき（CLI やスタンドアロンの GUI）はそのまま読み込むだけなので、
+処理関数は常に read_layer / read_csv を使ってよい。
+
+キャッシュキーはパスと読み込み引数、構成ファイル（.shp / .dbf など）の更新時刻・サイズで、
+ファイルが更新されれば自動的に読み込み直す。呼び出し側が変更しても影響しないよう、
+返す DataFrame は常にコピーにする。
+"""
+import contextlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.common.fileio import file_fingerprint
+
+# キャッシュを有効にしたときの既定の上限
+DEFAULT_MAX_ENTRIES = 8
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# ジオメトリのメモリの見積もり（GEOS の座標 1 点あたりと、ジオメトリ 1 つあたりの概算。実測から）
+GEOMETRY_COORD_BYTES = 40
+GEOMETRY_OVERHEAD_BYTES = 550
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_limits = None  # (max_entries, max_bytes)。None ならキャッシュ無効
+_stats = {'hits': 0, 'misses': 0}
+
+
+def enable(max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+    """キャッシュを有効にする"""
+    global _limits
+    with _lock:
+        _limits = (max_entries, max_bytes)
+        _evict()
+
+
+def disable():
+    """キャッシュを無効にし、保持しているデータを解放する"""
+    global _limits
+    with _lock:
+        _limits = None
+        _entries.clear()
+
+
+@contextlib.contextmanager
+def session(max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    with ブロックの間だけキャッシュを有効にする（すでに有効なら設定を変えない）
+    ブロックを抜けるとき、このブロックで有効にした場合は無効に戻してデータを解放する
+    """
+    with _lock:
+        was_enabled = _limits is not None
+    if not was_enabled:
+        enable(max_entries, max_bytes)
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+
+
+def clear():
+    """保持しているデータを解放する（キャッシュの有効・無効は変えない）"""
+    with _lock:
+        _entries.clear()
+
+
+def info():
+    """キャッシュの状態を辞書で返す（enabled, entries, bytes, hits, misses）"""
+    with _lock:
+        return {
+            'enabled': _limits is not None,
+            'entries': len(_entries),
+            'bytes': sum(size for _, size in _entries.values()),
+            **_stats,
+        }
+
+
+def read_layer(path, **kwargs):
+    """geopandas.read_file と同じ引数でベクタレイヤを読み込む（キャッシュが有効なら再利用する）"""
+    def load():
+        import geopandas as gpd
+        return gpd.read_file(path, **kwargs)
+    return _cached('layer', path, kwargs, load)
+
+
+def read_csv(path, **kwargs):
+    """pandas.read_csv と同じ引数で CSV を読み込む（キャッシュが有効なら再利用する）"""
+    def load():
+        import pandas as pd
+        return pd.read_csv(path, **kwargs)
+    return _cached('csv', path, kwargs, load)
+
+
+def _file_key(path):
+    """パスと構成ファイルの (拡張子, 更新時刻, サイズ) を返す"""
+    fingerprint = file_fingerprint(path)
+    if fingerprint is None:
+        # 存在しないファイルは読み込み側のエラーに任せる
+        return None
+    return os.path.abspath(path), fingerprint
+
+
+def _cached(kind, path, kwargs, load):
+    with _lock:
+        enabled = _limits is not None
+    file_key = _file_key(path) if enabled else None
+    if file_key is None:
+        return load()
+
+    key = (kind, file_key, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[0].copy()
+        _stats['misses'] += 1
+
+    df = load()
+    size = _frame_bytes(df)
+    with _lock:
+        if _limits is not None and size <= _limits[1]:
+            # 同じファイルの古い版は不要なので捨てる
+            stale = [k for k in _entries
+                     if k[0] == kind and k[1][0] == file_key[0] and k[1] != file_key]
+            for old_key in stale:
+                del _entries[old_key]
+            _entries[key] = (df, size)
+            _evict()
+    return df.copy()
+
+
+def _frame_bytes(df):
+    """
+    DataFrame のメモリ使用量の見積もり
+    memory_usage(deep=False) はジオメトリ・文字列の列をポインタの大きさでしか数えないため、
+    ジオメトリは座標数から、それ以外のオブジェクト列は deep=True で数える
+    """
+    size = int(df.memory_usage(index=True, deep=False).sum())
+    for i, dtype in enumerate(df.dtypes):
+        if dtype.name == 'geometry':
+            import shapely
+
+            geoms = np.asarray(df.iloc[:, i].values)
+            size += (int(shapely.get_num_coordinates(geoms).sum()) * GEOMETRY_COORD_BYTES
+                     + len(geoms) * GEOMETRY_OVERHEAD_BYTES)
+        elif dtype == object:
+            column = df.iloc[:, i]
+            size += int(column.memory_usage(index=False, deep=True)
+                        - column.memory_usage(index=False, deep=False))
+    return size
+
+
+def _evict():
+    """上限を超えた分を古いものから捨てる（_lock を保持して呼ぶ）"""
+    if _limits is None:
+        return
+    max_entries, max_bytes = _limits
+    total = sum(size for _, size in _entries.values())
+    while _entries and (len(_entries) > max_entries or total > max_bytes):
+        _, (_, size) = _entries.popitem(last=False)
+        total -= size
@@ -0,0 +1,35 @@
+"""
+lazy_import.py
+ランチャーから各ツールの GUI を遅延読み込みするための補助関数
+
+各ツールの GUI モジュールは geopandas / rasterio / fiona / pyproj などの重いモジュールを
+読み込むため、ランチャーの起動時にはインポートせず、ボタンが押されたときに読み込む。
+ウィンドウ表示後にバックグラウンドスレッドで事前に読み込んでおくこともできる。
+"""
+import importlib
+import threading
+
+
+def load_class(module_name, class_name):
+    """モジュールを読み込み（読み込み済みなら sys.modules のものを使う）、クラスを返す"""
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def warm_up(module_names):
+    """
+    モジュールを順に読み込む（バックグラウンドスレッドから呼ばれる）
+    失敗しても、ボタン押下時に改めて読み込んでエラーを表示するためここでは無視する
+    """
+    for module_name in module_names:
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            pass
+
+
+def start_warm_up(module_names):
+    """warm_up をデーモンスレッドで開始し、スレッドを返す"""
+    thread = threading.Thread(target=warm_up, args=(list(module_names),), daemon=True)
+    thread.start()
+    return thread
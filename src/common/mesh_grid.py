@@ -0,0 +1,290 @@
+"""
+mesh_grid.py
+規則格子メッシュを、属性ごとの 2 次元配列と格子の情報で表すデータモデル
+
+メッシュの属性（標高・点数・代表値など）は格子上の値なので、GeoDataFrame のポリゴンではなく
+(nrows, ncols) の NumPy 配列として持ち、属性の計算を配列演算で行えるようにする。
+配列の先頭行が北端で、ラスタ・detect_regular_grid の rows と同じ向き。
+一部のセルだけのメッシュ（流域メッシュなど）は mask でセルの有無を表す。
+
+ポリゴンは to_geodataframe を呼んだときに初めて作る（from_geodataframe・read は
+バウンディングボックスと属性だけを使う）。window は配列をコピーしないビューを返す。
+
+Usage:
+    from src.common.mesh_grid import MeshGrid
+
+    mesh = MeshGrid.read('outputs/domain_mesh_elev.shp', fields=['elevation'])
+    high = mesh['elevation'] > 500
+    sub = mesh.window(slice(0, 100), slice(0, 100))  # 北西の 100 x 100 セル（ビュー）
+    gdf = mesh.to_geodataframe()
+"""
+import numpy as np
+
+from src.common.grid import DEFAULT_TOLERANCE, detect_regular_grid, point_cells
+
+
+class MeshGrid:
+    """
+    規則格子メッシュ（格子線 xs, ys と、属性名 -> (nrows, ncols) 配列の辞書）
+
+    Args:
+        xs, ys: 格子線の座標（昇順、長さは列数 + 1・行数 + 1）
+        crs: 座標参照系
+        mask: セルがあるかどうかの bool 配列 (nrows, ncols)（省略時はすべてのセル）
+        values: 属性名 -> (nrows, ncols) 配列の辞書
+    """
+
+    def __init__(self, xs, ys, crs=None, mask=None, values=None):
+        self.xs = np.asarray(xs, dtype='float64')
+        self.ys = np.asarray(ys, dtype='float64')
+        if self.xs.ndim != 1 or self.ys.ndim != 1 or len(self.xs) < 2 or len(self.ys) < 2:
+            raise ValueError("格子線 xs, ys には 2 つ以上の座標を指定してください")
+        self.crs = crs
+        self.mask = None if mask is None else self._check_shape('mask', np.asarray(mask, dtype=bool))
+        self.values = {}
+        for name, array in (values or {}).items():
+            self[name] = array
+
+    # --- 作成 ---
+
+    @classmethod
+    def from_bounds(cls, bounds, ncols, nrows, crs=None):
+        """範囲 (minx, miny, maxx, maxy) を ncols x nrows に分けたメッシュ（generate_mesh.build_grid と同じ格子線）"""
+        minx, miny, maxx, maxy = bounds
+        return cls(np.linspace(minx, maxx, ncols + 1), np.linspace(miny, maxy, nrows + 1), crs)
+
+    @classmethod
+    def from_grid(cls, grid, crs=None):
+        """detect_regular_grid の戻り値から、フィーチャのあるセルを mask にしたメッシュを作る"""
+        mesh = cls.from_bounds(grid['extent'], grid['ncols'], grid['nrows'], crs)
+        mask = np.zeros(mesh.shape, dtype=bool)
+        mask[grid['rows'], grid['cols']] = True
+        mesh.mask = None if mask.all() else mask
+        return mesh
+
+    @classmethod
+    def from_geodataframe(cls, gdf, fields=None, tol=DEFAULT_TOLERANCE):
+        """
+        規則格子の GeoDataFrame から作る（ジオメトリはバウンディングボックスだけを使う）
+
+        Args:
+            fields: 配列にする属性（省略時は geometry 以外のすべての列）
+
+        Raises:
+            ValueError: 規則格子でない場合
+        """
+        grid = detect_regular_grid(gdf.geometry.bounds.to_numpy(), gdf.geometry.values, tol)
+        if grid is None:
+            raise ValueError("メッシュが規則格子ではありません")
+        columns = [c for c in gdf.columns if c != gdf.geometry.name] if fields is None else fields
+        return cls._from_table(grid, gdf, columns, gdf.crs)
+
+    @classmethod
+    def read(cls, shp_path, fields=None, tol=DEFAULT_TOLERANCE):
+        """
+        規則格子のシェープファイルを読む
+        ポリゴンは作らず、.shx/.shp のレコードヘッダの bbox と属性（.dbf）だけを読む
+
+        Raises:
+            ValueError: 規則格子でない場合
+        """
+        import geopandas as gpd
+        from pyproj import CRS
+
+        from src.common.metadata import probe_layer_summary
+        from src.shp_to_asc.utils import read_shp_bounds
+
+        bounds = read_shp_bounds(shp_path)
+        grid = detect_regular_grid(bounds, tol=tol)
+        if grid is None:
+            raise ValueError(f"メッシュが規則格子ではありません: {shp_path}")
+        table, columns = None, []
+        if fields is None or fields:
+            # 属性を読まない（fields=[]）場合は .dbf を開かない
+            table = gpd.read_file(shp_path, ignore_geometry=True, columns=fields)
+            if len(table) != len(bounds):
+                raise ValueError(f"ジオメトリの無いフィーチャがあります: {shp_path}")
+            columns = list(table.columns) if fields is None else fields
+        crs = probe_layer_summary(shp_path)['crs']
+        return cls._from_table(grid, table, columns, None if crs is None else CRS.from_user_input(crs))
+
+    @classmethod
+    def _from_table(cls, grid, table, columns, crs):
+        mesh = cls.from_grid(grid, crs)
+        for name in columns:
+            mesh.values[name] = _scatter(table[name].to_numpy(), grid['rows'], grid['cols'], mesh.shape)
+        return mesh
+
+    # --- 格子の情報 ---
+
+    @property
+    def ncols(self):
+        return len(self.xs) - 1
+
+    @property
+    def nrows(self):
+        return len(self.ys) - 1
+
+    @property
+    def shape(self):
+        """配列の形状 (nrows, ncols)"""
+        return self.nrows, self.ncols
+
+    @property
+    def dx(self):
+        return (self.xs[-1] - self.xs[0]) / self.ncols
+
+    @property
+    def dy(self):
+        return (self.ys[-1] - self.ys[0]) / self.nrows
+
+    @property
+    def bounds(self):
+        """範囲 (minx, miny, maxx, maxy)"""
+        return float(self.xs[0]), float(self.ys[0]), float(self.xs[-1]), float(self.ys[-1])
+
+    @property
+    def cell_mask(self):
+        """セルがあるかどうかの bool 配列（mask が無ければすべて True）"""
+        return np.ones(self.shape, dtype=bool) if self.mask is None else self.mask
+
+    @property
+    def grid(self):
+        """src.common.grid の関数に渡せる格子の辞書（rows, cols はセルのある位置）"""
+        rows, cols = np.nonzero(self.cell_mask)
+        return {
+            'origin': (float(self.xs[0]), float(self.ys[0])),
+            'dx': self.dx,
+            'dy': self.dy,
+            'ncols': self.ncols,
+            'nrows': self.nrows,
+            'extent': self.bounds,
+            'rows': rows,
+            'cols': cols,
+        }
+
+    def point_cells(self, x, y):
+        """点の座標から行・列番号を求める（src.common.grid.point_cells と同じ規則。格子の外は -1）"""
+        return point_cells(self.grid, x, y)
+
+    # --- 属性 ---
+
+    def _check_shape(self, name, array):
+        if array.shape != self.shape:
+            raise ValueError(f"{name} の形状 {array.shape} がメッシュ {self.shape} と一致しません")
+        return array
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __setitem__(self, name, array):
+        """属性を設定する（スカラーはすべてのセルに同じ値を入れる）"""
+        array = np.asarray(array)
+        if array.ndim == 0:
+            array = np.full(self.shape, array)
+        self.values[name] = self._check_shape(name, array)
+
+    def __contains__(self, name):
+        return name in self.values
+
+    @property
+    def fields(self):
+        return list(self.values)
+
+    def copy(self):
+        """配列をコピーしたメッシュ"""
+        return MeshGrid(self.xs.copy(), self.ys.copy(), self.crs,
+                        None if self.mask is None else self.mask.copy(),
+                        {name: array.copy() for name, array in self.values.items()})
+
+    # --- 部分領域 ---
+
+    def window(self, rows, cols):
+        """
+        行・列の範囲（slice、行は北端が 0）の部分メッシュを返す
+        属性と mask はコピーしないビューなので、書き換えると元のメッシュにも反映される
+        """
+        r0, r1, _ = rows.indices(self.nrows)
+        c0, c1, _ = cols.indices(self.ncols)
+        if r1 <= r0 or c1 <= c0:
+            raise ValueError("部分領域にセルがありません")
+        sub = MeshGrid.__new__(MeshGrid)
+        sub.xs = self.xs[c0:c1 + 1]
+        sub.ys = self.ys[self.nrows - r1:self.nrows - r0 + 1]
+        sub.crs = self.crs
+        sub.mask = None if self.mask is None else self.mask[r0:r1, c0:c1]
+        sub.values = {name: array[r0:r1, c0:c1] for name, array in self.values.items()}
+        return sub
+
+    def window_bounds(self, bounds):
+        """範囲 (minx, miny, maxx, maxy) と重なるセルの部分メッシュ（ビュー）を返す"""
+        minx, miny, maxx, maxy = bounds
+        c0 = max(int(np.searchsorted(self.xs, minx, side='right')) - 1, 0)
+        c1 = min(int(np.searchsorted(self.xs, maxx, side='left')), self.ncols)
+        b0 = max(int(np.searchsorted(self.ys, miny, side='right')) - 1, 0)
+        b1 = min(int(np.searchsorted(self.ys, maxy, side='left')), self.nrows)
+        return self.window(slice(self.nrows - b1, self.nrows - b0), slice(c0, c1))
+
+    # --- 変換 ---
+
+    def cell_order(self):
+        """
+        セルのある位置の (rows, cols) を generate_mesh.build_grid と同じ順
+        （X 方向が外側、Y 方向が下から上の内側）で返す
+        """
+        cols, rows_from_bottom = np.nonzero(self.cell_mask[::-1].T)
+        return self.nrows - 1 - rows_from_bottom, cols
+
+    def cell_boxes(self, rows, cols):
+        """行・列番号（行は北端が 0）のセルの矩形ポリゴンの配列"""
+        import shapely
+
+        iy = self.nrows - 1 - np.asarray(rows)
+        cols = np.asarray(cols)
+        return shapely.box(self.xs[cols], self.ys[iy], self.xs[cols + 1], self.ys[iy + 1])
+
+    def to_geodataframe(self, fields=None):
+        """
+        セルのある位置をポリゴンにした GeoDataFrame を返す（並びは generate_mesh.build_grid と同じ）
+
+        Args:
+            fields: 列にする属性（省略時はすべて）
+        """
+        import geopandas as gpd
+
+        rows, cols = self.cell_order()
+        polys = self.cell_boxes(rows, cols)
+        names = self.fields if fields is None else fields
+        return gpd.GeoDataFrame({name: self.values[name][rows, cols] for name in names},
+                                geometry=polys, crs=self.crs)
+
+    def write(self, shp_path, fields=None):
+        """to_geodataframe の結果をシェープファイルに書き出す（一時ファイルから置き換える）"""
+        from src.common.fileio import atomic_output
+
+        with atomic_output(shp_path) as tmp_path:
+            self.to_geodataframe(fields).to_file(tmp_path)
+        return shp_path
+
+    def __repr__(self):
+        cells = self.ncols * self.nrows if self.mask is None else int(self.mask.sum())
+        return (f"MeshGrid({self.ncols} x {self.nrows}, cells={cells}, "
+                f"bounds={self.bounds}, fields={self.fields})")
+
+
+def _scatter(values, rows, cols, shape):
+    """フィーチャごとの値を (nrows, ncols) の配列に並べる（セルの無い位置は NaN / False / None）"""
+    values = np.asarray(values)
+    if len(values) == shape[0] * shape[1]:
+        array = np.empty(shape, dtype=values.dtype)
+    elif values.dtype.kind in 'fc':
+        array = np.full(shape, np.nan, dtype=values.dtype)
+    elif values.dtype.kind in 'iu':
+        # 整数の列はセルの無い位置を表せないため float64 にする
+        array = np.full(shape, np.nan)
+    elif values.dtype.kind == 'b':
+        array = np.zeros(shape, dtype=bool)
+    else:
+        array = np.full(shape, None, dtype=object)
+    array[rows, cols] = values
+    return array
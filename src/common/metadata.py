@@ -0,0 +1,166 @@
+"""
+metadata.py
+GUI でファイルを選択したときに使う、入力ファイルのメタデータ取得
+
+レイヤ全体や CSV 全体を読み込まず、シェープファイルはスキーマ（属性フィールド名）、
+CSV は先頭の数行だけを読み込む。結果はパス・更新時刻・サイズをキーにキャッシュし、
+GUI からはワーカースレッドで実行する（run_probe）。
+"""
+import os
+import queue
+import threading
+from functools import lru_cache
+
+# Z 列候補の判定に使う CSV の先頭行数
+CSV_PROBE_ROWS = 1000
+
+# 点群 CSV の行数の見積もりに読む先頭のバイト数
+CSV_SAMPLE_BYTES = 1024 ** 2
+
+# run_probe が結果を確認する間隔（ms）
+PROBE_POLL_MS = 50
+
+
+def _file_key(path):
+    """キャッシュキー用に (絶対パス, 更新時刻, サイズ) を返す"""
+    abspath = os.path.abspath(path)
+    stat = os.stat(abspath)
+    return abspath, stat.st_mtime_ns, stat.st_size
+
+
+def probe_layer_fields(path, encoding=None):
+    """
+    ベクタレイヤのスキーマだけを読み込み、属性フィールド名のリストを返す
+
+    Args:
+        path: シェープファイルなどのパス
+        encoding: 属性の文字コード（省略時は fiona の既定）
+    """
+    return list(_probe_layer_fields_cached(*_file_key(path), encoding))
+
+
+@lru_cache(maxsize=64)
+def _probe_layer_fields_cached(abspath, mtime_ns, size, encoding):
+    import fiona
+
+    kwargs = {'encoding': encoding} if encoding else {}
+    with fiona.open(abspath, **kwargs) as src:
+        return tuple(src.schema['properties'].keys())
+
+
+def probe_csv_columns(path, nrows=CSV_PROBE_ROWS):
+    """
+    点群 CSV の先頭 nrows 行だけを読み込み、X/Y 列と Z 列候補を返す
+
+    Returns:
+        dict: 'columns', 'x_col', 'y_col', 'z_candidates' を持つ辞書
+
+    Raises:
+        ValueError: X 列または Y 列が見つからない場合
+    """
+    columns, x_col, y_col, z_candidates = _probe_csv_columns_cached(*_file_key(path), nrows)
+    return {
+        'columns': list(columns),
+        'x_col': x_col,
+        'y_col': y_col,
+        'z_candidates': list(z_candidates),
+    }
+
+
+@lru_cache(maxsize=64)
+def _probe_csv_columns_cached(abspath, mtime_ns, size, nrows):
+    import pandas as pd
+    from src.make_shp.add_elevation import get_xy_columns, get_z_candidates
+
+    df = pd.read_csv(abspath, nrows=nrows)
+    x_col, y_col = get_xy_columns(df)
+    z_candidates = get_z_candidates(df, x_col, y_col)
+    return tuple(df.columns), x_col, y_col, tuple(z_candidates)
+
+
+def probe_layer_summary(path):
+    """
+    ベクタレイヤのフィーチャ数・範囲・座標参照系だけを読み込む（ジオメトリは読まない）
+
+    Returns:
+        dict: 'count', 'bounds' (minx, miny, maxx, maxy), 'crs'（WKT などの文字列）を持つ辞書
+    """
+    count, bounds, crs = _probe_layer_summary_cached(*_file_key(path))
+    return {'count': count, 'bounds': bounds, 'crs': crs}
+
+
+@lru_cache(maxsize=64)
+def _probe_layer_summary_cached(abspath, mtime_ns, size):
+    import fiona
+
+    with fiona.open(abspath) as src:
+        crs = src.crs.to_string() if src.crs else None
+        return len(src), tuple(src.bounds), crs
+
+
+def estimate_csv_rows(path, sample_bytes=CSV_SAMPLE_BYTES):
+    """
+    CSV のデータ行数を、先頭 sample_bytes の 1 行あたりのバイト数から見積もる
+    （ファイルが sample_bytes 以下なら正確な行数）
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(sample_bytes)
+    lines = head.count(b'\n')
+    if size <= sample_bytes:
+        # 最終行に改行が無い場合も 1 行と数える
+        lines += 1 if head and not head.endswith(b'\n') else 0
+        return max(lines - 1, 0)
+    if lines == 0:
+        return 0
+    return max(int(size / (len(head) / lines)) - 1, 0)
+
+
+def common_z_candidates(paths, nrows=CSV_PROBE_ROWS):
+    """
+    複数の点群 CSV に共通する Z 列候補を、最初のファイルの列順で返す
+    共通の候補がなければ空リストを返す
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    common = None
+    for path in paths:
+        candidates = probe_csv_columns(path, nrows)['z_candidates']
+        if common is None:
+            common = candidates
+        else:
+            common = [c for c in common if c in candidates]
+    return common or []
+
+
+def run_probe(widget, func, args, on_result, on_error=None, poll_ms=PROBE_POLL_MS):
+    """
+    func(*args) をワーカースレッドで実行し、結果を Tk のメインスレッドでコールバックに渡す
+
+    Args:
+        widget: after() を持つ Tk ウィジェット（結果の確認に使う）
+        func: 実行する関数（probe_layer_fields など）
+        args: func に渡す引数のタプル
+        on_result: 成功時に結果を渡すコールバック
+        on_error: 失敗時に例外を渡すコールバック（省略時は無視）
+    """
+    result_queue = queue.Queue(maxsize=1)
+
+    def worker():
+        try:
+            result_queue.put((True, func(*args)))
+        except Exception as e:
+            result_queue.put((False, e))
+
+    def poll():
+        try:
+            ok, value = result_queue.get_nowait()
+        except queue.Empty:
+            widget.after(poll_ms, poll)
+            return
+        if ok:
+            on_result(value)
+        elif on_error is not None:
+            on_error(value)
+
+    threading.Thread(target=worker, daemon=True).start()
+    widget.after(poll_ms, poll)
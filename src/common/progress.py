@@ -0,0 +1,205 @@
+"""
+progress.py
+長時間処理の進捗通知
+
+処理関数は progress 引数にコールバックを受け取り、ProgressReporter を通して
+段階の開始・終了と処理件数をイベント（辞書）として通知する。
+GUI はイベントをキュー経由で受け取ってプログレスバーを更新し、
+CLI は ConsoleProgress で 1 行の進捗表示にする。
+
+イベントの辞書は以下のキーを持つ:
+    - 'type': 'stage_start' / 'progress' / 'stage_end'
+    - 'stage': 段階名
+    - 'step', 'steps': 段階の番号（1 始まり）と段階数
+    - 'done', 'total': 段階内の処理件数と総件数（総件数が不明なら None）
+    - 'fraction': 段階内の進捗率 0〜1（不明なら None）
+    - 'elapsed': 段階開始からの経過秒数
+    - 'rate': 1 秒あたりの処理件数（不明なら None）
+    - 'eta': 段階の残り秒数の推定（不明なら None）
+    - 'detail': 入れ子の処理の段階名（nested() 経由の場合）
+"""
+import contextlib
+import sys
+import time
+
+# 'progress' イベントを送る最小間隔（秒）。件数の多いループで通知が多くなり過ぎないようにする
+MIN_INTERVAL = 0.1
+
+
+class ProgressReporter:
+    """
+    処理関数の中で使う進捗通知の補助クラス
+    callback が None の場合は何もしない（既存の呼び出し側はそのまま動く）
+
+    Usage:
+        reporter = ProgressReporter(progress, steps=3)
+        with reporter.stage("ファイル読み込み"):
+            ...
+        with reporter.stage("交差計算", total=len(polygons)):
+            for chunk in chunks:
+                ...
+                reporter.advance(len(chunk))
+        reporter.begin("出力")  # with を使わずに begin / end で区切ってもよい
+        ...
+        reporter.end()
+    """
+
+    def __init__(self, callback=None, steps=None, min_interval=MIN_INTERVAL):
+        self.callback = callback
+        self.steps = steps
+        self.min_interval = min_interval
+        self.step = 0
+        self._stage = None
+        self._total = None
+        self._done = 0
+        self._start = 0.0
+        self._last_emit = 0.0
+
+    def begin(self, label, total=None):
+        """段階を開始する（前の段階が終わっていなければ先に終了を通知する）"""
+        if self._stage is not None:
+            self.end()
+        self.step += 1
+        self._stage = label
+        self._total = total
+        self._done = 0
+        self._start = self._last_emit = time.perf_counter()
+        self._emit('stage_start')
+
+    def end(self):
+        """現在の段階を終了する"""
+        if self._stage is None:
+            return
+        self._emit('stage_end', fraction=1.0)
+        self._stage = None
+
+    @contextlib.contextmanager
+    def stage(self, label, total=None):
+        """段階の開始・終了を通知するコンテキストマネージャ（例外で抜けた場合は終了を通知しない）"""
+        self.begin(label, total)
+        yield self
+        self.end()
+
+    def skip(self, count=1):
+        """実行しない段階の分だけ段階番号を進める（全体の進捗率をずらさないため）"""
+        self.end()
+        self.step += count
+
+    def set_total(self, total):
+        """段階の総件数を後から設定する"""
+        self._total = total
+
+    def advance(self, n=1, detail=None):
+        """段階内の処理件数を n 件進める（通知は min_interval ごとに間引く）"""
+        self._done += n
+        now = time.perf_counter()
+        if self.callback is not None and (
+                now - self._last_emit >= self.min_interval
+                or (self._total is not None and self._done >= self._total)):
+            self._last_emit = now
+            self._emit('progress', detail=detail)
+
+    def nested(self):
+        """
+        入れ子の処理関数に渡すコールバックを返す
+        入れ子側の進捗を、現在の段階の 'progress' イベントとして通知し直す
+        """
+        if self.callback is None:
+            return None
+
+        def callback(event):
+            self._emit('progress', fraction=overall_fraction(event), detail=event['stage'])
+        return callback
+
+    def _emit(self, kind, fraction=None, detail=None):
+        if self.callback is None:
+            return
+        elapsed = time.perf_counter() - self._start
+        done, total = self._done, self._total
+        if fraction is None and total:
+            fraction = min(done / total, 1.0)
+        rate = done / elapsed if done and elapsed > 0 else None
+        if rate and total is not None:
+            eta = max(total - done, 0) / rate
+        elif fraction and 0 < fraction < 1:
+            eta = elapsed * (1 - fraction) / fraction
+        else:
+            eta = None
+        self.callback({
+            'type': kind,
+            'stage': self._stage,
+            'step': self.step,
+            'steps': self.steps,
+            'done': done,
+            'total': total,
+            'fraction': fraction,
+            'elapsed': elapsed,
+            'rate': rate,
+            'eta': eta if kind != 'stage_end' else 0.0,
+            'detail': detail,
+        })
+
+
+def overall_fraction(event):
+    """イベントから処理全体の進捗率 0〜1 を求める（段階数が不明なら段階内の進捗率）"""
+    fraction = event['fraction'] or 0.0
+    if event['type'] == 'stage_start':
+        fraction = 0.0
+    steps = event['steps']
+    if not steps:
+        return fraction
+    return min((event['step'] - 1 + fraction) / steps, 1.0)
+
+
+def format_event(event):
+    """イベントを 1 行の文字列にする（例: "[2/5] 交差計算  45%  1234/2741  5.2k件/s  残り 3s"）"""
+    step = f"[{event['step']}/{event['steps']}] " if event['steps'] else ''
+    parts = [f"{step}{event['stage']}"]
+    if event['detail']:
+        parts[0] += f" - {event['detail']}"
+    if event['type'] == 'stage_end':
+        parts.append(f"完了 ({event['elapsed']:.1f}s)")
+        return '  '.join(parts)
+    if event['fraction'] is not None:
+        parts.append(f"{event['fraction'] * 100:3.0f}%")
+    if event['total'] is not None:
+        parts.append(f"{event['done']}/{event['total']}")
+    if event['rate']:
+        parts.append(f"{_format_count(event['rate'])}件/s")
+    if event['eta'] is not None:
+        parts.append(f"残り {event['eta']:.0f}s")
+    return '  '.join(parts)
+
+
+def _format_count(value):
+    if value >= 1e6:
+        return f"{value / 1e6:.1f}M"
+    if value >= 1e3:
+        return f"{value / 1e3:.1f}k"
+    return f"{value:.0f}"
+
+
+class ConsoleProgress:
+    """
+    CLI 用の進捗表示
+    端末では同じ行を書き換えて表示し、段階の終了時に改行する。
+    パイプやログファイルへの出力では、段階の終了ごとに 1 行だけ書き出す。
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stderr
+        self.interactive = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._width = 0
+
+    def __call__(self, event):
+        line = format_event(event)
+        if not self.interactive:
+            if event['type'] == 'stage_end':
+                self.stream.write(line + '\n')
+                self.stream.flush()
+            return
+        padding = ' ' * max(self._width - len(line), 0)
+        end = '\n' if event['type'] == 'stage_end' else ''
+        self.stream.write(f"\r{line}{padding}{end}")
+        self.stream.flush()
+        self._width = 0 if end else len(line)
@@ -0,0 +1,162 @@
+"""
+stage_cache.py
+パイプラインの段階ごとの出力を保存する内容アドレス型のキャッシュ
+
+各段階の出力（抽出した標準メッシュ、生成したメッシュ、セルごとの集計値など）を、
+入力ファイルのフィンガープリントとパラメータから求めたハッシュをキーに
+<キャッシュフォルダ>/<キー>/ へ保存する。再実行時は入力が変わった段階だけを計算し直す。
+
+キャッシュ全体の大きさが上限を超えたら、最後に使われた時刻が古いエントリから削除する。
+複数のプロセスから同時に使っても壊れないよう、エントリは一時フォルダに書いてから名前を変える。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+from src.common.fileio import file_fingerprint
+
+# キャッシュ全体の既定の上限（バイト）
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# 中断などで残った一時フォルダを削除するまでの時間（秒）
+STALE_TMP_SECONDS = 24 * 3600
+
+# キー計算の形式。出力の形式を変えたときに上げると古いエントリを使わなくなる
+KEY_VERSION = 1
+
+
+def default_cache_dir():
+    """既定のキャッシュフォルダ（Windows は %LOCALAPPDATA%、それ以外は ~/.cache の下）"""
+    if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+        base = os.environ['LOCALAPPDATA']
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'GeoMeshProcessor', 'stage_cache')
+
+
+def input_fingerprint(paths):
+    """
+    入力ファイル（1 つまたはリスト）のフィンガープリントを、キーに使える形で返す
+    パスも含めるため、同じ内容でも別の場所のファイルは別の入力として扱う
+    """
+    if paths is None:
+        return None
+    if isinstance(paths, str):
+        return [os.path.abspath(paths), file_fingerprint(paths)]
+    return [input_fingerprint(p) for p in paths]
+
+
+class StageCache:
+    """
+    段階の出力をフォルダ単位で保存するキャッシュ
+
+    Usage:
+        cache = StageCache(cache_dir)
+        key = cache.key('grid', input_fingerprint(domain_shp), cells_x, cells_y)
+        if not cache.restore(key, out_dir):
+            ...  # 計算して out_dir に書き出す
+            cache.save(key, out_dir, ['domain_mesh'])
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, stage, *parts):
+        """段階名と入力（フィンガープリントやパラメータ）からキーを求める"""
+        payload = json.dumps([KEY_VERSION, stage, parts], sort_keys=True, default=str)
+        return f"{stage}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        """エントリのフォルダを返す（無ければ None）。使用時刻を更新する"""
+        entry = self._entry_dir(key)
+        if not os.path.isdir(entry):
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(entry)
+        return entry
+
+    def restore(self, key, dest_dir):
+        """
+        エントリのファイルを dest_dir へコピーする
+        エントリが無い（またはコピー中に他のプロセスに削除された）場合は False
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        os.makedirs(dest_dir, exist_ok=True)
+        try:
+            for name in os.listdir(entry):
+                shutil.copy2(os.path.join(entry, name), os.path.join(dest_dir, name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def store(self, key):
+        """
+        エントリに保存するファイルを書くための一時フォルダを渡し、
+        with ブロックが正常終了したらエントリとして登録する
+        """
+        tmp_dir = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_dir)
+        try:
+            yield tmp_dir
+            try:
+                os.rename(tmp_dir, self._entry_dir(key))
+            except OSError:
+                # 他のプロセスが同じエントリを先に登録した
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.evict()
+
+    def save(self, key, src_dir, basenames):
+        """src_dir 内の <basename>.* をエントリとして保存する"""
+        with self.store(key) as tmp_dir:
+            for basename in basenames:
+                prefix = basename + '.'
+                for name in os.listdir(src_dir):
+                    if name.startswith(prefix):
+                        shutil.copy2(os.path.join(src_dir, name), os.path.join(tmp_dir, name))
+
+    def evict(self):
+        """キャッシュ全体が上限を超えていれば、使用時刻の古いエントリから削除する（古い一時フォルダも削除する）"""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.tmp-'):
+                with contextlib.suppress(OSError):
+                    if now - os.stat(path).st_mtime > STALE_TMP_SECONDS:
+                        shutil.rmtree(path, ignore_errors=True)
+                continue
+            if not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """すべてのエントリを削除する"""
+        for name in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
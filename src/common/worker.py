@@ -0,0 +1,304 @@
+"""
+worker.py
+GUI ツールの処理を実行する常駐ワーカープロセス
+
+ランチャーが start_worker() でワーカープロセスを 1 つ起動しておくと、各ツールの GUI は
+submit() で処理を依頼するだけで、重い処理（pandas / shapely など GIL を握る処理）は
+Tk のプロセスの外で実行される。ワーカープロセスは実行のたびに終了せず、
+読み込んだレイヤや点群を src.common.layer_cache に保持しておくため、
+同じ入力で再実行すると読み込みを省略できる。
+
+ワーカープロセスが起動していない場合（GUI を単体で起動した場合など）は、
+submit() は従来どおり GUI のプロセス内のスレッドで処理を実行する。
+
+処理関数は 'モジュール名:関数名' の文字列で指定し、キーワード引数に加えて
+cancel（CancelToken）と progress（進捗コールバック）を受け取れる必要がある。
+結果は on_message(kind, data) で通知する（バックグラウンドスレッドから呼ばれる）:
+    - ('progress', 進捗イベント)
+    - ('success', 処理関数の戻り値)
+    - ('cancelled', メッセージ)
+    - ('error', メッセージ)
+"""
+import gc
+import importlib
+import itertools
+import multiprocessing
+import pickle
+import queue
+import threading
+import traceback
+
+from src.common.cancel import CancelToken, JobCancelled
+from src.common.lazy_import import warm_up
+
+# ワーカープロセスの起動直後に読み込んでおく処理関数のモジュール
+WORKER_MODULES = (
+    'src.make_shp.pipeline',
+    'src.make_shp.elevation_assigner',
+    'src.mesh_dominant_module.mesh_dominant',
+    'src.shp_to_asc.core',
+)
+
+# ワーカープロセスが保持するレイヤキャッシュの上限（件数・バイト数）
+CACHE_MAX_ENTRIES = 8
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# イベントキューを待つ間隔（秒）。この間隔でワーカープロセスの異常終了を確認する
+_POLL_SECONDS = 0.5
+
+# stop() でワーカープロセスの終了を待つ時間（秒）
+_STOP_TIMEOUT = 2.0
+
+
+class JobHandle:
+    """submit() が返す実行中の処理の操作用オブジェクト"""
+
+    def __init__(self, cancel):
+        self._cancel = cancel
+
+    def cancel(self):
+        """キャンセルを要求する（処理の区切りのよいところで 'cancelled' が通知される）"""
+        self._cancel()
+
+
+def resolve_target(target):
+    """'モジュール名:関数名' から関数を取得する"""
+    module_name, func_name = target.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _run_job(target, kwargs, cancel, post):
+    """処理関数を実行し、結果を post(kind, data) で通知する"""
+    try:
+        func = resolve_target(target)
+        result = func(**kwargs, cancel=cancel, progress=lambda event: post('progress', event))
+        post('success', result)
+    except JobCancelled as e:
+        post('cancelled', str(e))
+    except Exception as e:
+        traceback.print_exc()
+        post('error', str(e))
+
+
+def _picklable(value):
+    """プロセス間で送れない戻り値は None にする（キューの送信スレッドで失敗して結果が届かなくなるため）"""
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return None
+    return value
+
+
+def _worker_main(job_queue, control_queue, event_queue, cache_entries, cache_bytes):
+    """ワーカープロセスの本体"""
+    from src.common import layer_cache
+
+    layer_cache.enable(cache_entries, cache_bytes)
+
+    lock = threading.Lock()
+    cancelled = set()
+    running = {}  # 実行中のジョブ ID -> CancelToken
+
+    def listen():
+        # キャンセル要求を受け取り、実行中のジョブならトークンに伝える
+        while True:
+            message = control_queue.get()
+            if message is None:
+                return
+            _, job_id = message
+            with lock:
+                cancelled.add(job_id)
+                if job_id in running:
+                    running[job_id].cancel()
+
+    threading.Thread(target=listen, daemon=True).start()
+    warm_up(WORKER_MODULES)
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, target, kwargs = job
+        token = CancelToken()
+        with lock:
+            if job_id in cancelled:
+                token.cancel()
+            running[job_id] = token
+
+        def post(kind, data, job_id=job_id):
+            if kind == 'success':
+                data = _picklable(data)
+            event_queue.put((job_id, kind, data))
+
+        if token.cancelled:
+            post('cancelled', str(JobCancelled()))
+        else:
+            _run_job(target, kwargs, token, post)
+        with lock:
+            running.pop(job_id, None)
+            cancelled.discard(job_id)
+        # ジョブの中間データを解放する（キャッシュしたレイヤは残る）
+        gc.collect()
+
+
+class WorkerProcess:
+    """
+    常駐ワーカープロセスの管理（GUI のプロセス側）
+    ジョブは 1 件ずつ順に実行する。ワーカープロセスが異常終了した場合は
+    実行待ちのジョブに 'error' を通知し、次の submit() で起動し直す。
+    """
+
+    def __init__(self, cache_entries=CACHE_MAX_ENTRIES, cache_bytes=CACHE_MAX_BYTES):
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}  # ジョブ ID -> (プロセス, on_message)
+        self._process = None
+        self._job_queue = None
+        self._control_queue = None
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """ワーカープロセスを起動する（起動済みなら何もしない）"""
+        with self._lock:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        if self.alive:
+            return
+        self._job_queue = self._context.Queue()
+        self._control_queue = self._context.Queue()
+        event_queue = self._context.Queue()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(self._job_queue, self._control_queue, event_queue,
+                  self.cache_entries, self.cache_bytes),
+            name='GeoMeshWorker',
+            daemon=True,
+        )
+        self._process.start()
+        threading.Thread(
+            target=self._dispatch, args=(self._process, event_queue), daemon=True
+        ).start()
+
+    def submit(self, target, kwargs, on_message):
+        """
+        ジョブをワーカープロセスに送る
+
+        Args:
+            target: 'モジュール名:関数名'
+            kwargs: 処理関数のキーワード引数（cancel / progress は含めない）
+            on_message: 結果を受け取るコールバック on_message(kind, data)
+
+        Returns:
+            JobHandle
+        """
+        with self._lock:
+            self._ensure_started()
+            job_id = next(self._ids)
+            self._jobs[job_id] = (self._process, on_message)
+            self._job_queue.put((job_id, target, kwargs))
+            control_queue = self._control_queue
+        return JobHandle(lambda: control_queue.put(('cancel', job_id)))
+
+    def _dispatch(self, process, event_queue):
+        """ワーカープロセスからのイベントを各ジョブのコールバックに振り分ける"""
+        while True:
+            try:
+                job_id, kind, data = event_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                self._fail_jobs(process, f"ワーカープロセスが終了しました（終了コード {process.exitcode}）")
+                return
+            except (EOFError, OSError):
+                self._fail_jobs(process, "ワーカープロセスとの通信が切断されました")
+                return
+
+            with self._lock:
+                entry = self._jobs.get(job_id)
+                if entry is not None and kind != 'progress':
+                    del self._jobs[job_id]
+            if entry is not None:
+                entry[1](kind, data)
+
+    def _fail_jobs(self, process, message):
+        """終了したワーカープロセスに送ったジョブに 'error' を通知する"""
+        with self._lock:
+            failed = [job_id for job_id, (p, _) in self._jobs.items() if p is process]
+            callbacks = [self._jobs.pop(job_id)[1] for job_id in failed]
+            if self._process is process:
+                self._process = None
+        for on_message in callbacks:
+            on_message('error', message)
+
+    def stop(self, timeout=_STOP_TIMEOUT):
+        """ワーカープロセスを終了する（実行中のジョブはキャンセルを要求してから待つ）"""
+        with self._lock:
+            process, self._process = self._process, None
+            running = [job_id for job_id, (p, _) in self._jobs.items() if p is process]
+        if process is None:
+            return
+        if process.is_alive():
+            for job_id in running:
+                self._control_queue.put(('cancel', job_id))
+            self._job_queue.put(None)
+            self._control_queue.put(None)
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout)
+
+
+_shared_worker = None
+
+
+def start_worker(**kwargs):
+    """共有のワーカープロセスを起動して返す（ランチャーから呼ぶ）"""
+    global _shared_worker
+    if _shared_worker is None:
+        _shared_worker = WorkerProcess(**kwargs)
+    _shared_worker.start()
+    return _shared_worker
+
+
+def get_worker():
+    """共有のワーカープロセスを返す（起動していなければ None）"""
+    return _shared_worker
+
+
+def stop_worker():
+    """共有のワーカープロセスを終了する"""
+    global _shared_worker
+    if _shared_worker is not None:
+        _shared_worker.stop()
+        _shared_worker = None
+
+
+def submit(target, kwargs, on_message):
+    """
+    処理を実行する。共有のワーカープロセスが起動していればそこへ送り、
+    起動していなければ GUI のプロセス内のスレッドで実行する
+
+    Args:
+        target: 'モジュール名:関数名'（例: 'src.make_shp.pipeline:pipeline'）
+        kwargs: 処理関数のキーワード引数（cancel / progress は含めない）
+        on_message: 結果を受け取るコールバック on_message(kind, data)
+
+    Returns:
+        JobHandle
+    """
+    worker = get_worker()
+    if worker is not None:
+        return worker.submit(target, kwargs, on_message)
+
+    token = CancelToken()
+    threading.Thread(
+        target=_run_job, args=(target, kwargs, token, on_message), daemon=True
+    ).start()
+    return JobHandle(token.cancel)
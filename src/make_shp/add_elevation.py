@@ -5,12 +5,40 @@
 計算領域メッシュへ転記 (流域外は NoData)
 """
 import argparse
+import contextlib
+import json
 import os
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
+from src.common.accumulator import (BLOCK_CELLS, QuantileSketch, accumulator_arrays, add_at, divide_blocks,
+                                    maximum_at, minimum_at)
+from src.common.cancel import check_cancel
+from src.common.fileio import atomic_output, file_fingerprint
+from src.common.grid import (DEFAULT_TOLERANCE, cell_lookup, detect_layer_grid, locate_points,
+                             on_cell_edge, point_cells)
+from src.common.layer_cache import read_csv, read_layer
+from src.common.progress import ConsoleProgress, ProgressReporter
+from src.common.stage_cache import input_fingerprint
+from src.make_shp.point_tiles import is_point_index, iter_tiles, read_point_tiles
 from src.shp_to_asc.gui import DEFAULT_NODATA
 
+# iter_point_chunks が 1 回に読み込む点群の行数
+POINT_CHUNK_ROWS = 1_000_000
+
+# 流域セルごとの集計値（--append で追記するための点数・標高の合計・二乗和）を保存するファイル
+# （出力フォルダの {流域メッシュ名}_elev_stats.npz）
+STATS_SUFFIX = '_elev_stats.npz'
+STATS_FORMAT = 1
+STATS_FIELDS = ('count', 'valid', 'sum', 'sumsq')
+
+# 平均標高・点数のほかに求められる統計量と、その出力列名（シェープファイルの列名は 10 文字まで）
+STATISTIC_COLUMNS = {'min': 'elev_min', 'max': 'elev_max', 'std': 'elev_std', 'median': 'elev_med'}
+
+# 中央値の近似（src.common.accumulator.QuantileSketch）の既定の分解能（標高の単位。誤差はこの半分以内）
+DEFAULT_MEDIAN_RESOLUTION = 0.01
+
 
 def get_xy_columns(df):
     """
@@ -61,7 +89,60 @@ def get_z_candidates(df, x_col, y_col):
 
 
 
-def load_points(paths, target_crs, zcol_arg=None):
+def _read_point_table(path, target_crs, zcol_arg=None, bounds=None):
+    """
+    単一の点群ファイル (CSV または SHP) を読み込み、
+    x, y, elevation 列を持つ DataFrame を返す（Point ジオメトリは作らない）
+    point_tiles の索引の場合は、bounds と重なるタイルだけを読み込む
+    """
+    # 0) 点群の索引の場合
+    if is_point_index(path):
+        return read_point_tiles(path, target_crs, bounds, zcol_arg)
+
+    # 1) SHPファイルの場合
+    if path.lower().endswith(".shp"):
+        gdf = read_layer(path).to_crs(target_crs)
+        # SHPファイルの場合はelevation列の存在を確認
+        if 'elevation' not in gdf.columns:
+            raise ValueError(f"SHPファイル '{path}' に 'elevation' 列が存在しません")
+        return pd.DataFrame({
+            'x': shapely.get_x(gdf.geometry.values),
+            'y': shapely.get_y(gdf.geometry.values),
+            'elevation': gdf['elevation'].to_numpy(),
+        })
+
+    # 2) CSVファイルの場合
+    df = read_csv(path)
+    x_col, y_col = get_xy_columns(df)
+    z_col = _resolve_z_column(df, path, x_col, y_col, zcol_arg)
+    return pd.DataFrame({
+        'x': df[x_col].to_numpy(),
+        'y': df[y_col].to_numpy(),
+        'elevation': df[z_col].to_numpy(),
+    })
+
+
+def _resolve_z_column(df, path, x_col, y_col, zcol_arg=None):
+    """Z列（標高値列）を決定する"""
+    z_cands = get_z_candidates(df, x_col, y_col)
+
+    if zcol_arg:
+        if zcol_arg in z_cands:
+            return zcol_arg
+        raise ValueError(
+            f"ファイル '{path}' に指定された標高値列 '{zcol_arg}' が見つかりません。\n"
+            f"利用可能な列: {z_cands}"
+        )
+    if len(z_cands) == 1:
+        return z_cands[0]
+    raise ValueError(
+        f"ファイル '{path}' で標高値列を特定できません。複数の候補があります。\n"
+        f"候補: {z_cands}\n"
+        "標高値列を明示的に指定するには --zcol オプションを使用してください。"
+    )
+
+
+def load_points(paths, target_crs, zcol_arg=None, cancel=None, progress=None, bounds=None):
     """
     複数の点群ファイル (CSV または SHP) を読み込み、
     target_crs に変換して結合した GeoDataFrame を返します。
@@ -70,6 +151,9 @@ def load_points(paths, target_crs, zcol_arg=None):
         paths: ファイルパス（文字列または文字列のリスト）
         target_crs: 変換先の座標参照系
         zcol_arg: 標高値列の名前（オプション）
+        cancel: CancelToken（ファイルごとに確認する）
+        progress: 進捗コールバック（ファイル数を単位に通知する）
+        bounds: 点群の索引から読み込む範囲 (minx, miny, maxx, maxy)（省略時はすべて）
         
     Returns:
         geopandas.GeoDataFrame: 結合された点群データ
@@ -79,46 +163,19 @@ def load_points(paths, target_crs, zcol_arg=None):
     """
     def _load_one(path):
         """単一の点群ファイルを読み込むヘルパー関数"""
-        # 1) SHPファイルの場合
+        # SHPファイルは属性も含めてそのまま返す
         if path.lower().endswith(".shp"):
-            gdf = gpd.read_file(path).to_crs(target_crs)
-            # SHPファイルの場合はelevation列の存在を確認
+            gdf = read_layer(path).to_crs(target_crs)
             if 'elevation' not in gdf.columns:
                 raise ValueError(f"SHPファイル '{path}' に 'elevation' 列が存在しません")
             return gdf
 
-        # 2) CSVファイルの場合
-        df = pd.read_csv(path)
-        x_col, y_col = get_xy_columns(df)
-        z_cands = get_z_candidates(df, x_col, y_col)
-
-        # 3) Z列の決定
-        if zcol_arg:
-            if zcol_arg in z_cands:
-                z_col = zcol_arg
-            else:
-                raise ValueError(
-                    f"ファイル '{path}' に指定された標高値列 '{zcol_arg}' が見つかりません。\n"
-                    f"利用可能な列: {z_cands}"
-                )
-        else:
-            if len(z_cands) == 1:
-                z_col = z_cands[0]
-            else:
-                raise ValueError(
-                    f"ファイル '{path}' で標高値列を特定できません。複数の候補があります。\n"
-                    f"候補: {z_cands}\n"
-                    "標高値列を明示的に指定するには --zcol オプションを使用してください。"
-                )
-
-        # 4) GeoDataFrame 作成
-        geom = [Point(xy) for xy in zip(df[x_col], df[y_col])]
-        gdf = gpd.GeoDataFrame(
-            df[[z_col]].rename(columns={z_col: "elevation"}),
-            geometry=geom,
+        table = _read_point_table(path, target_crs, zcol_arg, bounds)
+        return gpd.GeoDataFrame(
+            table[["elevation"]],
+            geometry=gpd.points_from_xy(table["x"], table["y"]),
             crs=target_crs
         )
-        return gdf
 
     # パスをリストに統一
     paths = [paths] if isinstance(paths, str) else paths
@@ -127,13 +184,18 @@ def load_points(paths, target_crs, zcol_arg=None):
         raise ValueError("処理するファイルが指定されていません")
     
     # すべてのファイルを読み込み
+    reporter = ProgressReporter(progress)
+    reporter.begin("点群読み込み", total=len(paths))
     gdfs = []
     for path in paths:
+        check_cancel(cancel)
         try:
             gdf = _load_one(path)
             gdfs.append(gdf)
         except Exception as e:
             raise ValueError(f"ファイル '{path}' の処理中にエラーが発生しました: {str(e)}")
+        reporter.advance(detail=os.path.basename(path))
+    reporter.end()
     
     # すべてのファイルを結合
     if gdfs:
@@ -142,54 +204,741 @@ def load_points(paths, target_crs, zcol_arg=None):
     
     raise ValueError("有効なデータが読み込めませんでした")
 
-def main(basin_shp, domain_shp, points_path, out_dir, zcol=None, nodata=None):
+
+def load_point_arrays(paths, target_crs, zcol_arg=None, cancel=None, progress=None, bounds=None):
+    """
+    load_points と同じ規則で点群を読み込み、座標と標高の配列だけを返す
+    （Point ジオメトリを作らないため、規則格子メッシュへの集計に使う）
+    bounds は点群の索引から読み込む範囲（load_points と同じ）
+
+    Returns:
+        tuple: (x, y, z) の float64 配列
+    """
+    paths = [paths] if isinstance(paths, str) else paths
+    if not paths:
+        raise ValueError("処理するファイルが指定されていません")
+
+    reporter = ProgressReporter(progress)
+    reporter.begin("点群読み込み", total=len(paths))
+    tables = []
+    for path in paths:
+        check_cancel(cancel)
+        try:
+            tables.append(_read_point_table(path, target_crs, zcol_arg, bounds))
+        except Exception as e:
+            raise ValueError(f"ファイル '{path}' の処理中にエラーが発生しました: {str(e)}")
+        reporter.advance(detail=os.path.basename(path))
+    reporter.end()
+
+    combined = pd.concat(tables, ignore_index=True)
+    return (
+        combined['x'].to_numpy(dtype='float64'),
+        combined['y'].to_numpy(dtype='float64'),
+        combined['elevation'].to_numpy(dtype='float64'),
+    )
+
+
+def iter_point_chunks(paths, target_crs, zcol_arg=None, chunk_rows=POINT_CHUNK_ROWS, bounds=None):
+    """
+    load_point_arrays と同じ規則で点群を読み込み、chunk_rows 行ずつ (x, y, z) の float64 配列を返すジェネレータ
+    点群全体をメモリに載せずに処理するために使う（点の順序はファイル順のまま）。
+    CSV の Z 列は最初のチャンクの列から決める。SHP はファイル全体を 1 チャンクとして返す。
+    点群の索引は bounds と重なるタイルを 1 つずつ返す（点の順序はタイル順）
+    """
+    paths = [paths] if isinstance(paths, str) else paths
+    if not paths:
+        raise ValueError("処理するファイルが指定されていません")
+    for path in paths:
+        try:
+            if is_point_index(path):
+                yield from iter_tiles(path, target_crs, bounds, zcol_arg)
+                continue
+            if path.lower().endswith(".shp"):
+                chunks = [_read_point_table(path, target_crs, zcol_arg)]
+                columns = ('x', 'y', 'elevation')
+            else:
+                chunks = pd.read_csv(path, chunksize=chunk_rows)
+                columns = None
+            for chunk in chunks:
+                if columns is None:
+                    x_col, y_col = get_xy_columns(chunk)
+                    columns = (x_col, y_col, _resolve_z_column(chunk, path, x_col, y_col, zcol_arg))
+                yield tuple(chunk[c].to_numpy(dtype='float64') for c in columns)
+        except Exception as e:
+            raise ValueError(f"ファイル '{path}' の処理中にエラーが発生しました: {str(e)}")
+
+
+def aggregate_points_on_grid(grid, x, y, z, lookup=None):
+    """
+    規則格子メッシュの各フィーチャについて、含まれる点の平均標高と点数を求める
+    空間結合の代わりに座標からセル番号を直接計算する（セル境界上の点は空間結合の within と同じく
+    どのセルにも含めない。src.common.grid.point_cells）
+
+    Args:
+        grid: detect_regular_grid の戻り値
+        x, y, z: 点の座標と標高
+        lookup: cell_lookup(grid) の結果（省略時は内部で作成）
+
+    Returns:
+        tuple: (平均標高, 点数) のフィーチャ順の配列。点の無いセルの平均は NaN
+    """
+    n = len(grid['rows'])
+    idx = locate_points(grid, x, y, lookup)
+    hit = idx >= 0
+    counts = np.bincount(idx[hit], minlength=n)
+    # 標高が欠損の点は点数には含めるが平均には含めない（groupby と同じ扱い）
+    valid = hit & ~np.isnan(z)
+    sums = np.bincount(idx[valid], weights=z[valid], minlength=n)
+    n_valid = np.bincount(idx[valid], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / n_valid
+    return mean, counts
+
+
+class CellStatistics:
+    """
+    フィーチャごとの標高の統計量を、点を 1 回走査するだけで求める集計器
+
+    点数・標高の合計・二乗和は常に集計し、statistics に 'min' / 'max' / 'median' があれば
+    同じ走査で最小・最大と中央値のスケッチ（src.common.accumulator.QuantileSketch）も集計する
+    （'std' は合計と二乗和から求める）。標高が欠損の点は点数には含めるが、標高の統計量には含めない。
+
+    Args:
+        n: フィーチャ数
+        statistics: STATISTIC_COLUMNS のキーの並び
+        arrays: 集計配列の辞書（specs を accumulator_arrays に渡して作ったもの。省略時はメモリ上に作る）
+        median_resolution: 中央値の近似の分解能（標高の単位。誤差はこの半分以内）
+    """
+
+    def __init__(self, n, statistics=(), arrays=None, median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+        unknown = sorted(set(statistics) - set(STATISTIC_COLUMNS))
+        if unknown:
+            raise ValueError(f"未対応の統計量です: {unknown}（{', '.join(STATISTIC_COLUMNS)} から指定）")
+        self.n = n
+        self.statistics = tuple(statistics)
+        if arrays is None:
+            arrays = {name: np.zeros(shape, dtype=dtype)
+                      for name, (shape, dtype) in self.specs(n, statistics).items()}
+        self.arrays = arrays
+        if 'min' in arrays:
+            arrays['min'][:] = np.inf
+        if 'max' in arrays:
+            arrays['max'][:] = -np.inf
+        self.sketch = QuantileSketch(median_resolution) if 'median' in statistics else None
+        # メモリマップの集計配列には、点をセル順に並べ替えて先頭から順に書き込む
+        self._on_disk = any(isinstance(array, np.memmap) for array in arrays.values())
+
+    @staticmethod
+    def specs(n, statistics=()):
+        """accumulator_arrays に渡す集計配列の指定"""
+        specs = {
+            'count': (n, 'int64'),
+            'valid': (n, 'int64'),
+            'sum': (n, 'float64'),
+            'sumsq': (n, 'float64'),
+        }
+        for name in ('min', 'max'):
+            if name in statistics:
+                specs[name] = (n, 'float64')
+        return specs
+
+    def add(self, idx, z):
+        """
+        点を加える
+
+        Args:
+            idx: 点が含まれるフィーチャの位置（locate_points の戻り値。どこにも含まれない点は -1）
+            z: 点の標高
+        """
+        arrays = self.arrays
+        if self._on_disk:
+            order = np.argsort(idx, kind='stable')
+            idx, z = idx[order], z[order]
+        hit = idx >= 0
+        valid = hit & ~np.isnan(z)
+        cells, values = idx[valid], z[valid]
+        if self._on_disk:
+            add_at(arrays['count'], idx[hit])
+            add_at(arrays['valid'], cells)
+            add_at(arrays['sum'], cells, values)
+            add_at(arrays['sumsq'], cells, values ** 2)
+            if 'min' in arrays:
+                minimum_at(arrays['min'], cells, values)
+            if 'max' in arrays:
+                maximum_at(arrays['max'], cells, values)
+        else:
+            arrays['count'] += np.bincount(idx[hit], minlength=self.n)
+            arrays['valid'] += np.bincount(cells, minlength=self.n)
+            arrays['sum'] += np.bincount(cells, weights=values, minlength=self.n)
+            arrays['sumsq'] += np.bincount(cells, weights=values ** 2, minlength=self.n)
+            if 'min' in arrays:
+                np.minimum.at(arrays['min'], cells, values)
+            if 'max' in arrays:
+                np.maximum.at(arrays['max'], cells, values)
+        if self.sketch is not None:
+            self.sketch.add(cells, values)
+
+    def result(self):
+        """
+        集計値の辞書を返す
+        STATS_FIELDS と、求めた統計量に応じて 'min' / 'max' / 'median_cells' / 'median_bins' /
+        'median_counts'（中央値のスケッチ）を持つ。集計配列はコピーせずにそのまま返すため、
+        メモリマップの場合は accumulator_arrays を抜けるまでに使い終えること
+        """
+        stats = dict(self.arrays)
+        if self.sketch is not None:
+            stats['median_cells'], stats['median_bins'], stats['median_counts'] = self.sketch.arrays()
+        return stats
+
+
+@contextlib.contextmanager
+def aggregate_point_chunks(grid, chunks, accumulator_dir=None, cancel=None, progress=None,
+                           statistics=(), median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    point_cell_stats のチャンク版。(x, y, z) のチャンク（iter_point_chunks など）を順に
+    CellStatistics に足し込み、点群全体をメモリに載せずに集計するコンテキストマネージャ
+
+    accumulator_dir を指定すると、セル番号の引き当て表と集計配列をそのフォルダの
+    一時ファイル（メモリマップ）に置く（src.common.accumulator）。同じセルへの加算順は点の順の
+    ままなので、点の順が同じなら point_cell_stats と同じ値になる。
+    集計値はメモリマップのまま渡すため、平均・統計量（stats_mean, statistic_columns）や
+    保存は with の中で行う（ブロックごとに読むため集計配列全体をメモリに載せない）。
+    中央値のスケッチは値のある (セル, 区間) の組だけをメモリ上に持つ。
+
+    Yields:
+        dict: CellStatistics.result の辞書
+    """
+    n = len(grid['rows'])
+    reporter = ProgressReporter(progress)
+    reporter.begin("標高集計")
+    specs = {'lookup': (grid['nrows'] * grid['ncols'], 'int64'), **CellStatistics.specs(n, statistics)}
+    with accumulator_arrays(specs, accumulator_dir) as acc:
+        lookup = cell_lookup(grid, out=acc['lookup'])
+        engine = CellStatistics(n, statistics, {name: acc[name] for name in specs if name != 'lookup'},
+                                median_resolution)
+        for x, y, z in chunks:
+            check_cancel(cancel)
+            engine.add(locate_points(grid, x, y, lookup), z)
+            reporter.advance(len(x))
+        reporter.end()
+        yield engine.result()
+
+
+def point_cell_stats(grid, x, y, z, lookup=None, statistics=(),
+                     median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    規則格子メッシュの各フィーチャについて、含まれる点の点数と標高の合計・二乗和
+    （と statistics の統計量）を 1 回の走査で求める（CellStatistics）
+    平均は aggregate_points_on_grid と同じ値になる。
+
+    Returns:
+        dict: フィーチャ順の配列の辞書
+            - 'count': 点数（標高が欠損の点も含む）
+            - 'valid': 標高が欠損でない点数
+            - 'sum', 'sumsq': 標高の合計と二乗和
+            - statistics に応じた 'min', 'max' と中央値のスケッチ（CellStatistics.result）
+    """
+    engine = CellStatistics(len(grid['rows']), statistics, median_resolution=median_resolution)
+    engine.add(locate_points(grid, x, y, lookup), z)
+    return engine.result()
+
+
+def stats_mean(stats):
+    """point_cell_stats の集計値から平均標高を求める（点の無いセルは NaN）"""
+    return divide_blocks(stats['sum'], stats['valid'])
+
+
+def statistic_columns(stats, statistics, median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    集計値から statistics の出力列を求める
+
+    Returns:
+        dict: STATISTIC_COLUMNS の列名 -> フィーチャ順の配列（標高の無いセルは NaN）
+    """
+    n = len(stats['valid'])
+    columns = {}
+    for name in statistics:
+        if name == 'median':
+            sketch = QuantileSketch(median_resolution, stats['median_cells'], stats['median_bins'],
+                                    stats['median_counts'])
+            columns[STATISTIC_COLUMNS[name]] = sketch.quantile(0.5, n)
+            continue
+        values = np.empty(n, dtype='float64')
+        # メモリマップの集計配列もブロックごとに読む
+        for start in range(0, n, BLOCK_CELLS):
+            block = slice(start, start + BLOCK_CELLS)
+            valid = stats['valid'][block]
+            if name in ('min', 'max'):
+                values[block] = np.where(valid > 0, stats[name][block], np.nan)
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    mean = stats['sum'][block] / valid
+                    variance = stats['sumsq'][block] / valid - mean ** 2
+                # 丸め誤差で負になった分散は 0 とみなす（母標準偏差）
+                values[block] = np.sqrt(np.where(variance < 0, 0.0, variance))
+        columns[STATISTIC_COLUMNS[name]] = values
+    return columns
+
+
+def merge_stats(previous, stats, statistics=(), median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """2 つの集計値（CellStatistics.result）を合わせる（statistics の分だけを残す）"""
+    merged = {name: previous[name] + stats[name] for name in STATS_FIELDS}
+    if 'min' in statistics:
+        merged['min'] = np.minimum(previous['min'], stats['min'])
+    if 'max' in statistics:
+        merged['max'] = np.maximum(previous['max'], stats['max'])
+    if 'median' in statistics:
+        sketch = QuantileSketch(median_resolution, previous['median_cells'], previous['median_bins'],
+                                previous['median_counts'])
+        sketch.merge(QuantileSketch(median_resolution, stats['median_cells'], stats['median_bins'],
+                                    stats['median_counts']))
+        merged['median_cells'], merged['median_bins'], merged['median_counts'] = sketch.arrays()
+    return merged
+
+
+def assign_elevation_grid(mesh, points_path, zcol=None, nodata=None, cancel=None, progress=None,
+                          accumulator_dir=None, statistics=(),
+                          median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    MeshGrid（src.common.mesh_grid）のセルに平均標高と点数を配列で付与して返す（ポリゴンは作らない）
+
+    'basin' 属性（bool）があれば流域セルだけに付与し、それ以外のセルは標高 nodata・点数 0 にする
+    （main で流域メッシュに付与して計算領域メッシュへ転記した結果と同じ扱い）。
+    点群は mesh の範囲と重なる部分だけを読む（点群の索引の場合）。
+    accumulator_dir を指定すると点群をチャンクごとに読み、集計配列をディスク上に置く
+    （aggregate_point_chunks）。statistics（STATISTIC_COLUMNS のキー）を指定すると、
+    同じ集計で求めた統計量も STATISTIC_COLUMNS の名前で設定する（値の無いセルは nodata）。
+
+    Returns:
+        MeshGrid: 'elevation'（float64）と 'pnt_count'（int64）を設定した mesh
+    """
+    if nodata is None:
+        nodata = DEFAULT_NODATA
+    reporter = ProgressReporter(progress, steps=2)
+    target = mesh.cell_mask & mesh['basin'] if 'basin' in mesh else mesh.cell_mask
+    rows, cols = np.nonzero(target)
+    grid = {**mesh.grid, 'rows': rows, 'cols': cols}
+    with contextlib.ExitStack() as resources:
+        if accumulator_dir is not None:
+            reporter.begin("点群読み込み・標高集計")
+            chunks = iter_point_chunks(points_path, mesh.crs, zcol, bounds=mesh.bounds)
+            stats = resources.enter_context(aggregate_point_chunks(
+                grid, chunks, accumulator_dir, cancel, reporter.nested(), statistics, median_resolution))
+            reporter.skip()
+        else:
+            reporter.begin("点群読み込み")
+            x, y, z = load_point_arrays(points_path, mesh.crs, zcol, cancel, reporter.nested(),
+                                        bounds=mesh.bounds)
+            check_cancel(cancel)
+            reporter.begin("標高集計", total=len(x))
+            stats = point_cell_stats(grid, x, y, z, statistics=statistics,
+                                     median_resolution=median_resolution)
+            reporter.advance(len(x))
+        # 出力の列は 1 つずつ求めて格子に並べる（集計配列はブロックごとに読む）
+        for name, statistic in [('elevation', None), *((STATISTIC_COLUMNS[s], s) for s in statistics)]:
+            if statistic is None:
+                values = stats_mean(stats)
+            else:
+                values = statistic_columns(stats, [statistic], median_resolution)[name]
+            array = np.full(mesh.shape, nodata, dtype='float64')
+            array[rows, cols] = np.where(np.isnan(values), nodata, values)
+            mesh[name] = array
+            del values
+        point_count = np.zeros(mesh.shape, dtype=np.int64)
+        point_count[rows, cols] = stats['count']
+    mesh['pnt_count'] = point_count
+    reporter.end()
+    return mesh
+
+
+def _same_lattice(grid_a, grid_b, tol=DEFAULT_TOLERANCE):
+    """2 つの規則格子のセルサイズが同じで、格子点が揃っていれば True"""
+    dx, dy = grid_a['dx'], grid_a['dy']
+    if abs(grid_b['dx'] - dx) > tol * dx or abs(grid_b['dy'] - dy) > tol * dy:
+        return False
+    ox = (grid_b['origin'][0] - grid_a['origin'][0]) / dx
+    oy = (grid_b['origin'][1] - grid_a['origin'][1]) / dy
+    return abs(ox - round(ox)) <= tol and abs(oy - round(oy)) <= tol
+
+
+def _nest_offset(fine, grid, tol=DEFAULT_TOLERANCE):
+    """
+    grid のセルが fine のセルをちょうど kx x ky 個ずつ束ねたものなら
+    (kx, ky, ox, oy) を返す（ox, oy は fine の原点から grid の原点までのセル数）。入れ子でなければ None
+    """
+    kx = grid['dx'] / fine['dx']
+    ky = grid['dy'] / fine['dy']
+    ox = (grid['origin'][0] - fine['origin'][0]) / fine['dx']
+    oy = (grid['origin'][1] - fine['origin'][1]) / fine['dy']
+    values = (kx, ky, ox, oy)
+    if any(abs(v - round(v)) > tol * max(1.0, abs(v)) for v in values) or round(kx) < 1 or round(ky) < 1:
+        return None
+    return tuple(int(round(v)) for v in values)
+
+
+def aggregate_points_pyramid(grids, x, y, z):
+    """
+    入れ子になった複数の規則格子について、点を最も細かい格子で 1 回だけ集計し、
+    粗い格子の平均標高と点数は細かい格子の和と点数をブロック単位で足し合わせて求める
+
+    セル境界上の点は各格子で main と同じくどのセルにも含めない。最も細かい格子の境界上の点は
+    粗い格子ではセルの内側にあることがあるため、その点だけは格子ごとに振り分け直して足す。
+
+    Args:
+        grids: detect_regular_grid の戻り値のリスト（最も細かい格子のセルを整数個ずつ束ねたもの）
+        x, y, z: 点の座標と標高
+
+    Returns:
+        list: grids と同じ順の (平均標高, 点数) のリスト（aggregate_points_on_grid と同じ形式）
+
+    Raises:
+        ValueError: 最も細かい格子と入れ子にならない格子がある場合
+    """
+    fine = min(grids, key=lambda g: g['dx'] * g['dy'])
+    offsets = []
+    for grid in grids:
+        offset = _nest_offset(fine, grid)
+        if offset is None:
+            raise ValueError("最も細かいメッシュと入れ子にならないメッシュがあります")
+        offsets.append(offset)
+
+    # すべての格子を覆う範囲に、最も細かい格子を広げる
+    lo_x = min(ox for _, _, ox, _ in offsets)
+    lo_y = min(oy for _, _, _, oy in offsets)
+    hi_x = max(ox + g['ncols'] * kx for g, (kx, _, ox, _) in zip(grids, offsets))
+    hi_y = max(oy + g['nrows'] * ky for g, (_, ky, _, oy) in zip(grids, offsets))
+    base = {
+        'origin': (fine['origin'][0] + lo_x * fine['dx'], fine['origin'][1] + lo_y * fine['dy']),
+        'dx': fine['dx'],
+        'dy': fine['dy'],
+        'ncols': hi_x - lo_x,
+        'nrows': hi_y - lo_y,
+    }
+
+    # 点群に触れるのはここだけ: 最も細かい格子の和・有効点数・点数を 2 次元配列にする
+    rows, cols = point_cells(base, x, y)
+    hit = rows >= 0
+    flat = rows * base['ncols'] + cols
+    size = base['nrows'] * base['ncols']
+    shape = (base['nrows'], base['ncols'])
+    valid = hit & ~np.isnan(z)
+    counts = np.bincount(flat[hit], minlength=size).reshape(shape)
+    sums = np.bincount(flat[valid], weights=z[valid], minlength=size).reshape(shape)
+    n_valid = np.bincount(flat[valid], minlength=size).reshape(shape)
+    edge = on_cell_edge(base, x, y)
+    edge_x, edge_y, edge_z = x[edge], y[edge], z[edge]
+
+    results = []
+    for grid, (kx, ky, ox, oy) in zip(grids, offsets):
+        # 行は上端が 0 なので、下端からのセル数を上端からの位置に直す
+        c0 = ox - lo_x
+        r0 = base['nrows'] - (oy - lo_y) - grid['nrows'] * ky
+        block = (slice(r0, r0 + grid['nrows'] * ky), slice(c0, c0 + grid['ncols'] * kx))
+
+        def reduce(a):
+            return a[block].reshape(grid['nrows'], ky, grid['ncols'], kx).sum(axis=(1, 3))
+
+        cell_sums = reduce(sums)[grid['rows'], grid['cols']]
+        cell_valid = reduce(n_valid)[grid['rows'], grid['cols']]
+        cell_counts = reduce(counts)[grid['rows'], grid['cols']]
+        if len(edge_x):
+            n = len(grid['rows'])
+            idx = locate_points(grid, edge_x, edge_y)
+            edge_hit = idx >= 0
+            edge_valid = edge_hit & ~np.isnan(edge_z)
+            cell_counts = cell_counts + np.bincount(idx[edge_hit], minlength=n)
+            cell_sums = cell_sums + np.bincount(idx[edge_valid], weights=edge_z[edge_valid], minlength=n)
+            cell_valid = cell_valid + np.bincount(idx[edge_valid], minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = cell_sums / cell_valid
+        results.append((mean, cell_counts))
+    return results
+
+
+def _load_aggregates(stage_cache, key, n):
+    """
+    キャッシュした流域セルごとの (平均標高, 点数, 集計値) を返す
+    （無い・セル数が合わない・集計値を含まない古い形式の場合は None）
+    """
+    if key is None:
+        return None
+    entry = stage_cache.lookup(key)
+    if entry is None:
+        return None
+    try:
+        with np.load(os.path.join(entry, 'aggregate.npz')) as data:
+            mean_elev = data['mean']
+            stats = {name: data[name] for name in data.files if name != 'mean'}
+    except (OSError, KeyError, ValueError):
+        return None
+    if len(mean_elev) != n or not set(STATS_FIELDS) <= set(stats):
+        return None
+    return mean_elev, stats['count'], stats
+
+
+def stats_sidecar_path(out_dir, basin_shp):
+    """流域セルごとの集計値を保存するファイルのパス（出力フォルダの {流域メッシュ名}_elev_stats.npz）"""
+    basin_filename = os.path.splitext(os.path.basename(basin_shp))[0]
+    return os.path.join(out_dir, f"{basin_filename}{STATS_SUFFIX}")
+
+
+def _source_entry(path):
+    """集計済みの点群ファイルの記録（JSON に保存できる形）"""
+    return {'path': os.path.abspath(path), 'fingerprint': json.loads(json.dumps(file_fingerprint(path)))}
+
+
+def load_elevation_stats(path):
+    """
+    stats_sidecar_path の集計値を読み込む
+
+    Returns:
+        tuple: (集計値の配列の辞書（CellStatistics.result と同じキー）, メタ情報の辞書)
+
+    Raises:
+        ValueError: 形式が異なる場合
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('format') != STATS_FORMAT:
+            raise ValueError(f"集計値ファイルの形式が異なります: {path}")
+        stats = {name: data[name] for name in data.files if name != 'meta'}
+    return stats, meta
+
+
+def _previous_stats(out_dir, basin_shp, basin, paths, zcol, statistics=(),
+                    median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    --append 用に前回の集計値を読み込み、まだ集計していない点群ファイルを返す
+
+    Returns:
+        tuple: (集計値, メタ情報, 追加する点群ファイルのリスト)
+
+    Raises:
+        ValueError: 集計値ファイルが無い・流域メッシュや Z 列が前回と異なる・
+            前回に集計していない統計量を求める・集計済みのファイルが更新されている場合
+    """
+    sidecar = stats_sidecar_path(out_dir, basin_shp)
+    if not os.path.exists(sidecar):
+        raise ValueError(f"追記する集計値ファイルがありません: {sidecar}（--append なしで実行してください）")
+    stats, meta = load_elevation_stats(sidecar)
+    if meta['features'] != len(basin) or not np.allclose(meta['bounds'], basin.total_bounds):
+        raise ValueError("流域メッシュが前回の集計時と異なります。--append なしで実行してください")
+    if zcol is not None and meta.get('zcol') not in (None, zcol):
+        raise ValueError(f"Z 列が前回の集計時（{meta['zcol']}）と異なります")
+    # 標準偏差は常に保存している二乗和から求まるため、前回に求めていなくてもよい
+    missing = [name for name in statistics
+               if name != 'std' and name not in meta.get('statistics', [])]
+    if missing:
+        raise ValueError(f"前回の集計に無い統計量は追記できません: {missing}（--append なしで実行してください）")
+    if 'median' in statistics and meta.get('median_resolution') != median_resolution:
+        raise ValueError(f"中央値の分解能が前回の集計時（{meta.get('median_resolution')}）と異なります")
+    done = {source['path']: source['fingerprint'] for source in meta['sources']}
+    new_paths = []
+    for path in paths:
+        entry = _source_entry(path)
+        if entry['path'] not in done:
+            new_paths.append(path)
+        elif done[entry['path']] == entry['fingerprint']:
+            print(f"[INFO] 集計済みのため読み込みません: {path}")
+        else:
+            # 前回の点の寄与を取り除けないため、全体を集計し直す必要がある
+            raise ValueError(f"集計済みの点群ファイルが更新されています: {path}。--append なしで実行してください")
+    return stats, meta, new_paths
+
+
+def main(basin_shp, domain_shp, points_path, out_dir, zcol=None, nodata=None, cancel=None,
+         progress=None, verbose=False, stage_cache=None, basin_key=None, accumulator_dir=None,
+         append=False, statistics=(), median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    流域メッシュに平均標高と点数を付与し、計算領域メッシュへ転記して出力する
+
+    cancel に CancelToken を渡すと、各段階の区切りでキャンセルを確認する。
+    キャンセル時は JobCancelled を送出し、出力ファイルは作成しない。
+    progress に進捗コールバックを渡すと、5 つの段階の進捗を通知する（src.common.progress）。
+    verbose=True の場合は結合結果の先頭行や標高の統計などのデバッグ情報も表示する。
+    stage_cache に StageCache を渡すと、流域セルごとの集計値（平均標高・点数）をキャッシュし、
+    流域メッシュ・点群・Z 列が前回と同じなら点群の読み込みと集計を省略する。
+    basin_key は流域メッシュを表すキー（省略時は basin_shp のフィンガープリント）。
+    accumulator_dir を指定すると、流域メッシュが規則格子の場合に点群をチャンクごとに読み、
+    セルごとの集計配列をそのフォルダのメモリマップに置く（aggregate_point_chunks）。
+
+    流域セルごとの点数・標高の合計・二乗和と、集計した点群ファイルの一覧は、出力フォルダの
+    {流域メッシュ名}_elev_stats.npz に保存する。append=True の場合は points_path のうち
+    まだ集計していないファイルだけを読み、前回の集計値に足して出力し直す（stage_cache は使わない）。
+
+    statistics に 'min' / 'max' / 'std' / 'median' を指定すると、平均と同じ 1 回の集計で
+    最小・最大・標準偏差（母標準偏差）・中央値も求め、STATISTIC_COLUMNS の列として出力する。
+    中央値は median_resolution 刻みの区間の個数から求める近似値（誤差は median_resolution / 2 以内）。
+    """
     # Nodata値が指定されていない場合はデフォルト値を使用
     if nodata is None:
         nodata = DEFAULT_NODATA
+    reporter = ProgressReporter(progress, steps=5)
+
     # 1. ベースとなるポリゴンデータの読み込み
-    basin = gpd.read_file(basin_shp)
+    reporter.begin("メッシュ読み込み")
+    basin = read_layer(basin_shp)
     print(f"ベースのCRS: {basin.crs}")
     
     # 2. ドメインデータの読み込みと座標系の統一
-    domain = gpd.read_file(domain_shp).to_crs(basin.crs)
-    
-    # 3. 点群データの読み込みと座標系の設定
-    points = load_points(points_path, basin.crs, zcol)
-    
-    # 4. 座標系が正しく設定されているか確認
-    print(f"点群データのCRS: {points.crs}")
-    print(f"点群データの範囲: {points.total_bounds}")
-    print(f"流域ポリゴンの範囲: {basin.total_bounds}")
+    domain = read_layer(domain_shp).to_crs(basin.crs)
+    check_cancel(cancel)
 
-    # 空間結合 + 平均標高算出
-    joined = gpd.sjoin(points, basin, predicate="within", how="left")
-    
-    # デバッグ用に結合結果を表示
-    print("結合結果の先頭5行:")
-    print(joined.head())
-    
-    # グループ化する前に、結合に使用するインデックスを確認
-    print("\nbasinのインデックス:", basin.index.tolist()[:10])
-    print("joinedのindex_rightのユニーク値:", joined["index_right"].unique()[:10])
-    
-    # 平均標高と点数を計算
-    grouped = joined.groupby("index_right")
-    mean_elev = grouped["elevation"].mean()
-    point_count = grouped.size()
-    point_count.name = "pnt_count"
-    print("\n平均標高の計算結果:")
-    print(mean_elev.head())
-    print("\n点群数の計算結果:")
-    print(point_count.head())
+    paths = [points_path] if isinstance(points_path, str) else list(points_path)
+    previous = None
+    if append:
+        previous, meta, paths = _previous_stats(out_dir, basin_shp, basin, paths, zcol, statistics,
+                                                median_resolution)
+        print(f"前回までに集計した点群: {len(meta['sources'])} ファイル / 追加する点群: {len(paths)} ファイル")
+        sources = meta['sources'] + [_source_entry(path) for path in paths]
+        zcol = zcol if zcol is not None else meta.get('zcol')
+    else:
+        sources = [_source_entry(path) for path in paths]
+
+    # 点群の集計値は nodata に依存しないため、nodata を変えただけの再実行でも再利用できる
+    aggregate_key = None
+    if stage_cache is not None and not append:
+        aggregate_key = stage_cache.key(
+            'aggregate', basin_key or input_fingerprint(basin_shp), input_fingerprint(paths), zcol,
+            sorted(statistics), median_resolution if 'median' in statistics else None)
+    cached = _load_aggregates(stage_cache, aggregate_key, len(basin))
+
+    # --accumulator-dir の集計値はメモリマップのまま、出力を書き終えるまで使う
+    with contextlib.ExitStack() as resources:
+        basin_grid = detect_layer_grid(basin)
+        if cached is not None:
+            reporter.begin("点群読み込み（キャッシュ）")
+            print("流域メッシュと点群が前回と同じため、キャッシュした集計値を使います。")
+            _, _, stats = cached
+            reporter.skip()
+        elif append and not paths:
+            reporter.begin("点群読み込み")
+            print("追加する点群がありません。前回の集計値から出力し直します。")
+            stats = CellStatistics(len(basin), statistics, median_resolution=median_resolution).result()
+            reporter.skip()
+        elif basin_grid is not None and accumulator_dir is not None:
+            reporter.begin("点群読み込み・標高集計")
+            print(f"流域メッシュは規則格子です ({basin_grid['ncols']} x {basin_grid['nrows']})。"
+                  f"集計配列を {accumulator_dir} に置き、点群をチャンクごとに集計します。")
+            chunks = iter_point_chunks(paths, basin.crs, zcol, bounds=basin.total_bounds)
+            stats = resources.enter_context(aggregate_point_chunks(
+                basin_grid, chunks, accumulator_dir, cancel, reporter.nested(), statistics,
+                median_resolution))
+            reporter.skip()
+        elif basin_grid is not None:
+            reporter.begin("点群読み込み")
+            # 3. 規則格子: 点の座標からセル番号を直接求める（Point 生成・空間結合なし）
+            print(f"流域メッシュは規則格子です ({basin_grid['ncols']} x {basin_grid['nrows']})。"
+                  "セル番号による集計を行います。")
+            x, y, z = load_point_arrays(paths, basin.crs, zcol, cancel, reporter.nested(),
+                                        bounds=basin.total_bounds)
+            if len(x):
+                print(f"点群データの範囲: {[x.min(), y.min(), x.max(), y.max()]}")
+            print(f"流域ポリゴンの範囲: {basin.total_bounds}")
+
+            reporter.begin("標高集計", total=len(x))
+            stats = point_cell_stats(basin_grid, x, y, z, statistics=statistics,
+                                     median_resolution=median_resolution)
+            reporter.advance(len(x))
+        else:
+            reporter.begin("点群読み込み")
+            # 3. 点群データの読み込みと座標系の設定
+            points = load_points(paths, basin.crs, zcol, cancel, reporter.nested(),
+                                 bounds=basin.total_bounds)
+        
+            # 4. 座標系が正しく設定されているか確認
+            print(f"点群データのCRS: {points.crs}")
+            print(f"点群データの範囲: {points.total_bounds}")
+            print(f"流域ポリゴンの範囲: {basin.total_bounds}")
+
+            # 空間結合 + 平均標高算出
+            reporter.begin("標高集計", total=len(points))
+            joined = gpd.sjoin(points, basin, predicate="within", how="left")
+            check_cancel(cancel)
+        
+            if verbose:
+                # デバッグ用に結合結果を表示
+                print("結合結果の先頭5行:")
+                print(joined.head())
+
+                # グループ化する前に、結合に使用するインデックスを確認
+                print("\nbasinのインデックス:", basin.index.tolist()[:10])
+                print("joinedのindex_rightのユニーク値:", joined["index_right"].unique()[:10])
+        
+            # 結合先の流域セルの位置（どのセルにも含まれない点は -1）ごとに、規則格子と同じ集計を行う
+            engine = CellStatistics(len(basin), statistics, median_resolution=median_resolution)
+            engine.add(basin.index.get_indexer(joined["index_right"]),
+                       joined["elevation"].to_numpy(dtype='float64'))
+            stats = engine.result()
+            if verbose:
+                print("\n平均標高の計算結果:")
+                print(stats_mean(stats)[:5])
+                print("\n点群数の計算結果:")
+                print(stats['count'][:5])
+            reporter.advance(len(points))
+        check_cancel(cancel)
+
+        if cached is None and aggregate_key is not None:
+            with stage_cache.store(aggregate_key) as entry_dir:
+                np.savez(os.path.join(entry_dir, 'aggregate.npz'), mean=stats_mean(stats), **stats)
+
+        if previous is not None:
+            # 前回の集計値に今回の点群の分を足す（全件を集計し直した場合とは丸め誤差の範囲で一致）
+            stats = merge_stats(previous, stats, statistics, median_resolution)
+        mean_elev, point_count = stats_mean(stats), np.array(stats['count'])
+
+        stats_meta = {
+            'format': STATS_FORMAT,
+            'features': len(basin),
+            'bounds': [float(v) for v in basin.total_bounds],
+            'zcol': zcol,
+            'statistics': list(statistics),
+            'median_resolution': median_resolution,
+            'sources': sources,
+        }
+        _write_outputs(basin, domain, basin_grid, mean_elev, point_count, basin_shp, domain_shp,
+                       out_dir, nodata, cancel, reporter, verbose, stats, stats_meta,
+                       statistic_columns(stats, statistics, median_resolution))
 
+
+def _write_outputs(basin, domain, basin_grid, mean_elev, point_count, basin_shp, domain_shp,
+                   out_dir, nodata, cancel, reporter, verbose=False, stats=None, stats_meta=None,
+                   columns=None):
+    """
+    流域セルごとの平均標高と点数を流域メッシュに付与し、計算領域メッシュへ転記して出力する
+    （reporter に「計算領域へ転記」「結果出力」の 2 段階を通知する）
+    stats を渡すと集計値ファイル（stats_sidecar_path）も同時に置き換える。渡さない場合は
+    出力と合わなくなる前回の集計値ファイルを削除する
+    columns（列名 -> 流域セルごとの値。statistic_columns の戻り値）は標高と同じく転記して出力する
+    """
+    columns = columns or {}
     # basinに標高と点数を追加
-    basin["elevation"] = basin.index.map(mean_elev).fillna(nodata)
-    basin["pnt_count"] = basin.index.map(point_count).fillna(0).astype(int)
+    basin["elevation"] = np.where(np.isnan(mean_elev), nodata, mean_elev)
+    basin["pnt_count"] = point_count
+    for name, values in columns.items():
+        basin[name] = np.where(np.isnan(values), nodata, values)
     
-    # 空間結合でdomainとbasinをマッチング
-    domain = gpd.sjoin(domain, basin[["elevation", "pnt_count", "geometry"]], how="left", predicate="within")
+    reporter.begin("計算領域へ転記")
+    domain_grid = detect_layer_grid(domain) if basin_grid is not None else None
+    if domain_grid is not None and _same_lattice(domain_grid, basin_grid):
+        # 同じ格子上のメッシュ同士は、流域セルの中心から計算領域セルを直接引く
+        bounds = basin.geometry.bounds.to_numpy()
+        target = locate_points(domain_grid,
+                               (bounds[:, 0] + bounds[:, 2]) / 2,
+                               (bounds[:, 1] + bounds[:, 3]) / 2)
+        matched = target >= 0
+        for name in ["elevation", "pnt_count", *columns]:
+            values = np.full(len(domain), np.nan)
+            values[target[matched]] = basin[name].to_numpy()[matched]
+            domain[name] = values
+    else:
+        # 空間結合でdomainとbasinをマッチング
+        domain = gpd.sjoin(domain, basin[["elevation", "pnt_count", *columns, "geometry"]],
+                           how="left", predicate="within")
     # 流域外は nodata / 0 に置き換え
     domain['elevation'] = domain['elevation'].fillna(nodata)
+    for name in columns:
+        domain[name] = domain[name].fillna(nodata)
     domain['pnt_count'] = domain['pnt_count'].fillna(0).astype(int)
     
     # 不要な列（index_right, geometry_right など）を削除
@@ -199,31 +948,128 @@ def main(basin_shp, domain_shp, points_path, out_dir, zcol=None, nodata=None):
     # 出力フォルダを作成
     os.makedirs(out_dir, exist_ok=True)
 
-    # デバッグ用に標高の統計情報を表示
-    print("\n最終的な標高の統計:")
-    print("流域メッシュの標高統計:")
-    print(basin["elevation"].describe())
-    print("\n流域メッシュの点群数統計:")
-    print(basin["pnt_count"].describe())
-    print("\n計算領域メッシュの標高統計:")
-    print(domain["elevation"].describe())
-    print("\n計算領域メッシュの点群数統計:")
-    print(domain["pnt_count"].describe())
+    if verbose:
+        # デバッグ用に標高の統計情報を表示
+        print("\n最終的な標高の統計:")
+        print("流域メッシュの標高統計:")
+        print(basin["elevation"].describe())
+        print("\n流域メッシュの点群数統計:")
+        print(basin["pnt_count"].describe())
+        print("\n計算領域メッシュの標高統計:")
+        print(domain["elevation"].describe())
+        print("\n計算領域メッシュの点群数統計:")
+        print(domain["pnt_count"].describe())
     
     # 拡張子以外の部分を取得
     basin_filename = os.path.splitext(os.path.basename(basin_shp))[0]
     domain_filename = os.path.splitext(os.path.basename(domain_shp))[0]
-    basin.to_file(f"{out_dir}/{basin_filename}_elev.shp")
-    domain.to_file(f"{out_dir}/{domain_filename}_elev.shp")
+    check_cancel(cancel)
+    reporter.begin("結果出力")
+    # 一時ファイルへ書いてから置き換え、途中で失敗しても書きかけの出力を残さない
+    sidecar = stats_sidecar_path(out_dir, basin_shp)
+    with atomic_output(f"{out_dir}/{basin_filename}_elev.shp") as basin_tmp, \
+            atomic_output(f"{out_dir}/{domain_filename}_elev.shp") as domain_tmp, \
+            atomic_output(sidecar) as stats_tmp:
+        basin.to_file(basin_tmp)
+        domain.to_file(domain_tmp)
+        if stats is not None:
+            np.savez(stats_tmp, meta=np.array(json.dumps(stats_meta, ensure_ascii=False)), **stats)
+    if stats is None and os.path.exists(sidecar):
+        os.remove(sidecar)
+    reporter.end()
+
+def main_pyramid(levels, points_path, zcol=None, nodata=None, cancel=None, progress=None,
+                 verbose=False):
+    """
+    解像度の異なる複数のメッシュに、点群を 1 回だけ読み込んで平均標高と点数を付与する（ピラミッドモード）
+
+    分割数が 400, 200, 100, 50 のように入れ子になっている場合、最も細かい流域メッシュの格子で
+    点を集計し、粗いメッシュの値はその和と点数をブロック単位で足し合わせて求める
+    （aggregate_points_pyramid）。点数は各レベルで main を実行した場合と同じで、
+    平均標高は足し合わせる順序による丸め誤差の範囲で一致する。
+    規則格子でない、または最も細かいメッシュと入れ子にならないレベルは main で個別に処理する。
+
+    Args:
+        levels: (流域メッシュ, 計算領域メッシュ, 出力フォルダ) のリスト
+        points_path, zcol, nodata, cancel, progress, verbose: main と同じ
+    """
+    if nodata is None:
+        nodata = DEFAULT_NODATA
+    if not levels:
+        raise ValueError("メッシュが指定されていません")
+    reporter = ProgressReporter(progress, steps=3 + len(levels))
+
+    reporter.begin("メッシュ読み込み", total=len(levels))
+    loaded = []
+    crs = None
+    for basin_shp, domain_shp, out_dir in levels:
+        check_cancel(cancel)
+        basin = read_layer(basin_shp)
+        if crs is None:
+            crs = basin.crs
+            print(f"ベースのCRS: {crs}")
+        domain = read_layer(domain_shp).to_crs(basin.crs)
+        grid = detect_layer_grid(basin) if basin.crs == crs else None
+        loaded.append((basin, domain, grid))
+        reporter.advance(detail=os.path.basename(out_dir))
+
+    grids = [grid for _, _, grid in loaded if grid is not None]
+    fine = min(grids, key=lambda g: g['dx'] * g['dy']) if grids else None
+    nested = [grid is not None and _nest_offset(fine, grid) is not None for _, _, grid in loaded]
+    for (basin_shp, _, _), ok in zip(levels, nested):
+        if not ok:
+            print(f"{basin_shp} は最も細かいメッシュと入れ子にならないため、個別に集計します。")
+
+    aggregates = {}
+    if any(nested):
+        reporter.begin("点群読み込み")
+        bounds = np.array([loaded[i][0].total_bounds for i, ok in enumerate(nested) if ok])
+        bounds = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+        x, y, z = load_point_arrays(points_path, crs, zcol, cancel, reporter.nested(), bounds=bounds)
+        check_cancel(cancel)
+        reporter.begin("標高集計", total=len(x))
+        print(f"最も細かいメッシュ ({fine['ncols']} x {fine['nrows']}) で点群を 1 回だけ集計します。")
+        indices = [i for i, ok in enumerate(nested) if ok]
+        results = aggregate_points_pyramid([loaded[i][2] for i in indices], x, y, z)
+        aggregates = dict(zip(indices, results))
+        reporter.advance(len(x))
+    else:
+        reporter.begin("点群読み込み")
+        reporter.skip()
+
+    for i, (basin_shp, domain_shp, out_dir) in enumerate(levels):
+        check_cancel(cancel)
+        reporter.begin(f"出力 ({os.path.basename(os.path.normpath(out_dir))})")
+        if i not in aggregates:
+            main(basin_shp, domain_shp, points_path, out_dir, zcol, nodata, cancel,
+                 reporter.nested(), verbose)
+            continue
+        basin, domain, grid = loaded[i]
+        mean_elev, point_count = aggregates[i]
+        _write_outputs(basin, domain, grid, mean_elev, point_count, basin_shp, domain_shp,
+                       out_dir, nodata, cancel, ProgressReporter(reporter.nested(), steps=2), verbose)
+    reporter.end()
+
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser(description="標高付与")
     ap.add_argument("--basin_mesh",  required=True, help="流域メッシュ (.shp)")
     ap.add_argument("--domain_mesh", required=True, help="計算領域メッシュ (.shp)")
-    ap.add_argument("--points",      required=True, nargs='+', help="点群 CSV (.csv)。複数ファイル指定可")
+    ap.add_argument("--points",      required=True, nargs='+', help="点群 CSV (.csv)。複数ファイル指定可。point_tiles の索引（フォルダ）も指定できる")
     ap.add_argument("--zcol",        default=None, help="Z 列名")
     ap.add_argument("--outdir",      default="./outputs", help="出力フォルダ")
+    ap.add_argument("--verbose",     action="store_true", help="結合結果や標高の統計などのデバッグ情報を表示")
+    ap.add_argument("--accumulator-dir", default=None,
+                    help="集計配列をメモリマップとして置くフォルダ（メモリに収まらない大規模メッシュ用）")
+    ap.add_argument("--append",      action="store_true",
+                    help="出力フォルダの前回の集計値に、まだ集計していない点群ファイルだけを追加する")
+    ap.add_argument("--stats",       nargs='+', default=[], choices=list(STATISTIC_COLUMNS),
+                    help="平均と同じ集計で求めて出力する統計量（列名は elev_min, elev_max, elev_std, elev_med）")
+    ap.add_argument("--median-resolution", type=float, default=DEFAULT_MEDIAN_RESOLUTION,
+                    help=f"中央値の近似の分解能（標高の単位。誤差はこの半分以内。既定: {DEFAULT_MEDIAN_RESOLUTION}）")
     args = ap.parse_args()
-    main(args.basin_mesh, args.domain_mesh, args.points, args.outdir, args.zcol)
+    main(args.basin_mesh, args.domain_mesh, args.points, args.outdir, args.zcol,
+         progress=ConsoleProgress(), verbose=args.verbose, accumulator_dir=args.accumulator_dir,
+         append=args.append, statistics=args.stats, median_resolution=args.median_resolution)
     
 # python src/make_shp/add_elevation.py --basin_mesh output4\basin_mesh.shp --domain_mesh output4\domain_mesh.shp --points input\SHP→ASC変換作業_サンプルデータ\標高点群.csv --outdir ./output3
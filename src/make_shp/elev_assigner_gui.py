@@ -4,18 +4,17 @@
 
 流域メッシュと計算領域メッシュに標高値を付与するためのGUIツールです。
 """
+import gc
 import os
 import sys
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-from src.make_shp.add_elevation import get_xy_columns, get_z_candidates
-import pandas as pd
-import threading
+from src.common.metadata import common_z_candidates, run_probe
+from src.common.progress import format_event, overall_fraction
+from src.common.worker import submit
 import queue
 import tkinter.font as tkFont
 
-from src.make_shp.elevation_assigner import add_elevation
-
 # ベースディレクトリの設定
 BASE_DIR = getattr(
     sys, '_MEIPASS',
@@ -61,6 +60,7 @@ class ElevAssignerApp(ttk.Frame):
         
         # 非同期処理用のキュー
         self.result_queue = queue.Queue()
+        self.job = None
         self.after(100, self.check_queue)
 
     def create_widgets(self):
@@ -137,8 +137,18 @@ class ElevAssignerApp(ttk.Frame):
         ttk.Label(left_frame, textvariable=self.status_var, anchor='w').grid(
             row=6, column=0, columnspan=2, sticky='w', padx=5, pady=10)
         
-        self.run_button = ttk.Button(left_frame, text='実行', command=self.run_process, width=BUTTON_WIDTH)
-        self.run_button.grid(row=6, column=2, sticky='e', padx=5, pady=10)
+        button_frame = ttk.Frame(left_frame)
+        button_frame.grid(row=6, column=2, sticky='e', padx=5, pady=10)
+        self.run_button = ttk.Button(button_frame, text='実行', command=self.run_process, width=BUTTON_WIDTH)
+        self.run_button.pack(side='left')
+        self.cancel_button = ttk.Button(button_frame, text='キャンセル', command=self.cancel_process,
+                                        width=BUTTON_WIDTH, state='disabled')
+        self.cancel_button.pack(side='left', padx=(5, 0))
+
+        # 進捗バー
+        self.progress_var = tk.DoubleVar(value=0.0)
+        ttk.Progressbar(left_frame, variable=self.progress_var, maximum=100).grid(
+            row=7, column=0, columnspan=3, sticky='we', padx=5, pady=(0, 10))
         
         # ヘルプパネル生成の直前にフォントを定義
         help_font = tkFont.Font(family='メイリオ', size=10)
@@ -209,55 +219,49 @@ CSVデータ内の標高値の列名を選択してください。
 
     def _update_z_candidates(self, paths):
         # パスをリストに統一
-        paths = [paths] if isinstance(paths, str) else paths
-        
-        all_candidates = []
-        
-        try:
-            # 各ファイルから列候補を取得
-            for i, path in enumerate(paths):
-                df = pd.read_csv(path)
-                x_col, y_col = get_xy_columns(df)
-                candidates = get_z_candidates(df, x_col, y_col)
-                
-                if i == 0:
-                    # 最初のファイルの候補をベースに
-                    common_candidates = set(candidates)
-                else:
-                    # 共通の候補のみを残す
-                    common_candidates.intersection_update(set(candidates))
-                
-                all_candidates.extend(candidates)
-            
-            # 共通の候補がない場合は警告を表示
-            if not common_candidates:
-                self.z_combo['values'] = []
-                self.z_var.set('')
-                messagebox.showwarning(
-                    '警告', 
-                    'ファイル間で共通の標高値列が見つかりません。\n' +
-                    '以下の理由が考えられます：\n' +
-                    '1. 選択したファイルに共通の列名が存在しない\n' +
-                    '2. ファイルの形式が異なる\n\n' +
-                    '全てのファイルで同じ列名を使用していることを確認してください。'
-                )
-                return
-                
-            # 共通の候補を使用
-            final_candidates = list(common_candidates)
-            
-            # ドロップダウンに設定
-            self.z_combo['values'] = final_candidates
-            
-            # 現在の選択を維持（無効な場合は先頭を選択）
-            current = self.z_var.get()
-            if current not in final_candidates:
-                self.z_var.set(final_candidates[0])
-                
-        except Exception as e:
-            messagebox.showwarning('警告', f'列候補の取得中にエラーが発生しました:\n{str(e)}')
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        # 各ファイルの先頭行だけを読み込んで列候補を取得（ワーカースレッドで実行）
+        self._z_probe_paths = paths
+        run_probe(
+            self, common_z_candidates, (paths,),
+            lambda candidates: self._apply_z_candidates(paths, candidates),
+            lambda e: self._z_candidates_failed(paths, e),
+        )
+
+    def _apply_z_candidates(self, paths, candidates):
+        """共通の標高値列候補をドロップダウンに設定する"""
+        # 取得中に別のファイルが選択された場合は古い結果を捨てる
+        if paths != self._z_probe_paths:
+            return
+
+        # 共通の候補がない場合は警告を表示
+        if not candidates:
             self.z_combo['values'] = []
             self.z_var.set('')
+            messagebox.showwarning(
+                '警告', 
+                'ファイル間で共通の標高値列が見つかりません。\n' +
+                '以下の理由が考えられます：\n' +
+                '1. 選択したファイルに共通の列名が存在しない\n' +
+                '2. ファイルの形式が異なる\n\n' +
+                '全てのファイルで同じ列名を使用していることを確認してください。'
+            )
+            return
+
+        # ドロップダウンに設定
+        self.z_combo['values'] = candidates
+
+        # 現在の選択を維持（無効な場合は先頭を選択）
+        current = self.z_var.get()
+        if current not in candidates:
+            self.z_var.set(candidates[0])
+
+    def _z_candidates_failed(self, paths, e):
+        if paths != self._z_probe_paths:
+            return
+        messagebox.showwarning('警告', f'列候補の取得中にエラーが発生しました:\n{str(e)}')
+        self.z_combo['values'] = []
+        self.z_var.set('')
 
     def browse_basin(self):
         """流域メッシュを選択"""
@@ -345,43 +349,55 @@ CSVデータ内の標高値の列名を選択してください。
             
         # 処理中はボタンを無効化
         self.run_button['state'] = 'disabled'
+        self.cancel_button['state'] = 'normal'
         self.status_var.set('処理中...')
+        self.progress_var.set(0.0)
         
-        # 別スレッドで処理を実行
-        thread = threading.Thread(target=self._run_in_thread)
-        thread.daemon = True
-        thread.start()
-
-    def _run_in_thread(self):
-        """別スレッドで実行する処理"""
-        try:
-            points = self.points_var.get().split(';')
-            zcol = self.z_var.get()
-            nodata = float(self.nodata_var.get()) if self.nodata_var.get() else None
-            
-            add_elevation(
+        # 処理はワーカープロセス（ランチャーから起動した場合）またはスレッドで実行する
+        nodata = float(self.nodata_var.get()) if self.nodata_var.get() else None
+        self.job = submit(
+            'src.make_shp.elevation_assigner:add_elevation',
+            dict(
                 basin_mesh=self.basin_var.get(),
                 domain_mesh=self.domain_var.get(),
-                points_path=points,
+                points_path=self.points_var.get().split(';'),
                 out_dir=self.outdir_var.get(),
-                zcol=zcol,
-                nodata=nodata
-            )
-            self.result_queue.put(('success', '標高付与が完了しました'))
-        except Exception as e:
-            self.result_queue.put(('error', str(e)))
+                zcol=self.z_var.get(),
+                nodata=nodata,
+            ),
+            lambda kind, data: self.result_queue.put((kind, data)),
+        )
+
+    def cancel_process(self):
+        """実行中の処理にキャンセルを要求する（区切りのよいところで中断される）"""
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_button['state'] = 'disabled'
+            self.status_var.set('キャンセル中...')
 
     def check_queue(self):
         """キューをチェックして結果を処理"""
         try:
             while True:
                 result_type, message = self.result_queue.get_nowait()
+                if result_type == 'progress':
+                    self.progress_var.set(overall_fraction(message) * 100)
+                    self.status_var.set(format_event(message))
+                    continue
                 if result_type == 'success':
+                    message = '標高付与が完了しました'
+                    self.progress_var.set(100.0)
                     messagebox.showinfo('完了', message)
+                elif result_type == 'cancelled':
+                    # 中断した処理の中間データを解放する
+                    gc.collect()
+                    self.progress_var.set(0.0)
                 else:
                     messagebox.showerror('エラー', message)
                 self.status_var.set(message)
                 self.run_button.config(state='normal')
+                self.cancel_button.config(state='disabled')
+                self.job = None
         except queue.Empty:
             pass
         
@@ -3,7 +3,8 @@
 
 import argparse
 
-from src.make_shp.add_elevation import main as elevation_main
+from src.make_shp.add_elevation import (DEFAULT_MEDIAN_RESOLUTION, STATISTIC_COLUMNS,
+                                        main as elevation_main)
 
 
 def add_elevation(basin_mesh: str,
@@ -11,9 +12,20 @@ def add_elevation(basin_mesh: str,
                   points_path,
                   out_dir: str,
                   zcol: str | None = None,
-                  nodata: float | None = None) -> None:
-    """Add elevation values to basin and domain meshes."""
-    elevation_main(basin_mesh, domain_mesh, points_path, out_dir, zcol, nodata)
+                  nodata: float | None = None,
+                  cancel=None,
+                  progress=None,
+                  append: bool = False,
+                  statistics=(),
+                  median_resolution: float = DEFAULT_MEDIAN_RESOLUTION) -> None:
+    """Add elevation values to basin and domain meshes.
+
+    With ``append=True`` only point files not yet folded into the per-cell
+    statistics saved in ``out_dir`` are read. ``statistics`` adds per-cell
+    min/max/std/median columns computed in the same aggregation pass.
+    """
+    elevation_main(basin_mesh, domain_mesh, points_path, out_dir, zcol, nodata, cancel, progress,
+                   append=append, statistics=statistics, median_resolution=median_resolution)
 
 
 def main() -> None:
@@ -24,6 +36,12 @@ def main() -> None:
     ap.add_argument("--outdir", default="./outputs", help="出力フォルダ")
     ap.add_argument("--zcol", default=None, help="Z 列名")
     ap.add_argument("--nodata", type=float, default=None, help="NODATA値")
+    ap.add_argument("--append", action="store_true",
+                    help="前回の集計値に、まだ集計していない点群ファイルだけを追加する")
+    ap.add_argument("--stats", nargs='+', default=[], choices=list(STATISTIC_COLUMNS),
+                    help="平均と同じ集計で求めて出力する統計量")
+    ap.add_argument("--median-resolution", type=float, default=DEFAULT_MEDIAN_RESOLUTION,
+                    help="中央値の近似の分解能（誤差はこの半分以内）")
     args = ap.parse_args()
 
     add_elevation(
@@ -33,6 +51,9 @@ def main() -> None:
         args.outdir,
         args.zcol,
         args.nodata,
+        append=args.append,
+        statistics=args.stats,
+        median_resolution=args.median_resolution,
     )
 
 
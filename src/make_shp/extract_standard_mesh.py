@@ -17,12 +17,13 @@ Usage:
 import argparse
 import os
 import sys
-import geopandas as gpd
+
+from src.common.layer_cache import read_layer
 
 def extract_cells(standard_shp, domain_shp, output_shp, id_col=None):
     # シェープ読み込み
-    mesh_gdf = gpd.read_file(standard_shp)
-    domain_gdf = gpd.read_file(domain_shp)
+    mesh_gdf = read_layer(standard_shp)
+    domain_gdf = read_layer(domain_shp)
 
     # CRS を合わせる
     if mesh_gdf.crs != domain_gdf.crs:
@@ -9,7 +9,13 @@ import os
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import box
+import shapely
+
+from src.common.cancel import check_cancel
+from src.common.fileio import atomic_output
+from src.common.layer_cache import read_layer
+from src.common.mesh_grid import MeshGrid
+from src.common.progress import ConsoleProgress, ProgressReporter
 
 def build_grid(extent, num_cells_x, num_cells_y, crs):
     """
@@ -21,23 +27,51 @@ def build_grid(extent, num_cells_x, num_cells_y, crs):
     minx, miny, maxx, maxy = extent
     xs = np.linspace(minx, maxx, num_cells_x + 1)
     ys = np.linspace(miny, maxy, num_cells_y + 1)
-    polys = []
-    for i in range(num_cells_x):
-        for j in range(num_cells_y):
-            polys.append(box(xs[i], ys[j], xs[i+1], ys[j+1]))
+    # セルの並びは X 方向が外側、Y 方向が内側（下から上）
+    ix, iy = np.meshgrid(np.arange(num_cells_x), np.arange(num_cells_y), indexing='ij')
+    ix = ix.ravel()
+    iy = iy.ravel()
+    polys = shapely.box(xs[ix], ys[iy], xs[ix + 1], ys[iy + 1])
     return gpd.GeoDataFrame(geometry=polys, crs=crs)
 
-def main(domain_shp, basin_shp, cells_x, cells_y, out_dir):
+def build_mesh_grids(domain_shp, basin_shp, cells_x, cells_y, cancel=None):
+    """
+    計算領域の各フィーチャに cells_x x cells_y の MeshGrid（src.common.mesh_grid）を作ってリストで返す
+    シェープファイルは出力せず、流域界と重なるセルを 'basin'（bool）、フィーチャの ID を 'feature_id' に持つ
+    （main の domain_mesh.shp / basin_mesh.shp と同じ格子線・同じ判定）
+    """
+    domain_gdf = read_layer(domain_shp)
+    basin_union = read_layer(basin_shp).to_crs(domain_gdf.crs).unary_union
+    shapely.prepare(basin_union)
+
+    meshes = []
+    for idx, row in domain_gdf.iterrows():
+        check_cancel(cancel)
+        mesh = MeshGrid.from_bounds(row.geometry.bounds, cells_x, cells_y, domain_gdf.crs)
+        rows, cols = np.indices(mesh.shape)
+        mesh['basin'] = shapely.intersects(mesh.cell_boxes(rows, cols), basin_union)
+        mesh['feature_id'] = row.get('id', idx)
+        meshes.append(mesh)
+    return meshes
+
+def main(domain_shp, basin_shp, cells_x, cells_y, out_dir, cancel=None, progress=None):
+    """
+    計算領域の各フィーチャにグリッドを作り、domain_mesh.shp / basin_mesh.shp を出力する
+    progress に進捗コールバックを渡すと、フィーチャ数を単位に進捗を通知する
+    """
+    reporter = ProgressReporter(progress, steps=2)
     # シェープの読み込み
-    domain_gdf = gpd.read_file(domain_shp)
-    basin_gdf = gpd.read_file(basin_shp).to_crs(domain_gdf.crs)
+    domain_gdf = read_layer(domain_shp)
+    basin_gdf = read_layer(basin_shp).to_crs(domain_gdf.crs)
     basin_union = basin_gdf.unary_union
 
     all_grids = []
     basin_grids = []
 
     # 各フィーチャごとにグリッド生成
+    reporter.begin("グリッド生成", total=len(domain_gdf))
     for idx, row in domain_gdf.iterrows():
+        check_cancel(cancel)
         nx = cells_x
         ny = cells_y
 
@@ -51,6 +85,7 @@ def main(domain_shp, basin_shp, cells_x, cells_y, out_dir):
         basin_sub = grid[mask].copy()
         basin_sub['feature_id'] = row.get('id', idx)
         basin_grids.append(basin_sub)
+        reporter.advance()
 
     # 結合して出力
     os.makedirs(out_dir, exist_ok=True)
@@ -59,8 +94,12 @@ def main(domain_shp, basin_shp, cells_x, cells_y, out_dir):
 
     domain_out = os.path.join(out_dir, 'domain_mesh.shp')
     basin_out = os.path.join(out_dir, 'basin_mesh.shp')
-    domain_mesh.to_file(domain_out)
-    basin_mesh.to_file(basin_out)
+    check_cancel(cancel)
+    reporter.begin("メッシュ出力")
+    with atomic_output(domain_out) as domain_tmp, atomic_output(basin_out) as basin_tmp:
+        domain_mesh.to_file(domain_tmp)
+        basin_mesh.to_file(basin_tmp)
+    reporter.end()
     print(f"domain mesh -> {domain_out}")
     print(f"basin mesh  -> {basin_out}")
 
@@ -73,4 +112,4 @@ if __name__ == '__main__':
     parser.add_argument('--outdir', default='./outputs', help='出力フォルダ')
     args = parser.parse_args()
 
-    main(args.domain, args.basin, args.cells_x, args.cells_y, args.outdir)
+    main(args.domain, args.basin, args.cells_x, args.cells_y, args.outdir, progress=ConsoleProgress())
@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
-import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
-import threading
 import queue
 import tkinter.font as tkFont
+import gc
 import os
 import sys
 
-from src.make_shp.add_elevation import get_xy_columns, get_z_candidates
-from src.make_shp.pipeline import pipeline
+from src.common.metadata import common_z_candidates, run_probe
+from src.common.progress import format_event, overall_fraction
+from src.common.stage_cache import default_cache_dir
+from src.common.worker import submit
 
 # ── 実行モード判別 ──
 # - PyInstaller の exe 化時には _MEIPASS に資源が展開される
@@ -71,6 +72,7 @@ class MeshElevApp(ttk.Frame):
         
         # 1) Queue を作成
         self.result_queue = queue.Queue()
+        self.job = None
         # 2) 定期的に結果をチェックするコールバックを登録
         self.after(100, self.check_queue)
         
@@ -225,11 +227,22 @@ class MeshElevApp(ttk.Frame):
                   anchor='w') \
             .grid(row=8, column=0, columnspan=2,
                   sticky='we', padx=5, pady=10)
-        self.run_button = ttk.Button(left_frame, text='実行',
+        button_frame = ttk.Frame(left_frame)
+        button_frame.grid(row=8, column=2, sticky='e',
+                  padx=5, pady=10)
+        self.run_button = ttk.Button(button_frame, text='実行',
                    command=self.run_process,
                    width=BUTTON_WIDTH)
-        self.run_button.grid(row=8, column=2, sticky='e',
-                  padx=5, pady=10)
+        self.run_button.pack(side='left')
+        self.cancel_button = ttk.Button(button_frame, text='キャンセル',
+                   command=self.cancel_process,
+                   width=BUTTON_WIDTH, state='disabled')
+        self.cancel_button.pack(side='left', padx=(5, 0))
+
+        # 進捗バー
+        self.progress_var = tk.DoubleVar(value=0.0)
+        ttk.Progressbar(left_frame, variable=self.progress_var, maximum=100) \
+            .grid(row=9, column=0, columnspan=3, sticky='we', padx=5, pady=(0, 10))
 
         # ヘルプパネル生成の直前にフォントを定義
         help_font = tkFont.Font(family='メイリオ', size=10)
@@ -319,55 +332,49 @@ basin_mesh_elev；流域界の標高メッシュ
 
     def _update_z_candidates(self, paths):
         # パスをリストに統一
-        paths = [paths] if isinstance(paths, str) else paths
-        
-        all_candidates = []
-        
-        try:
-            # 各ファイルから列候補を取得
-            for i, path in enumerate(paths):
-                df = pd.read_csv(path)
-                x_col, y_col = get_xy_columns(df)
-                candidates = get_z_candidates(df, x_col, y_col)
-                
-                if i == 0:
-                    # 最初のファイルの候補をベースに
-                    common_candidates = set(candidates)
-                else:
-                    # 共通の候補のみを残す
-                    common_candidates.intersection_update(set(candidates))
-                
-                all_candidates.extend(candidates)
-            
-            # 共通の候補がない場合は警告を表示
-            if not common_candidates:
-                self.z_combo['values'] = []
-                self.z_var.set('')
-                messagebox.showwarning(
-                    '警告', 
-                    'ファイル間で共通の標高値列が見つかりません。\n' +
-                    '以下の理由が考えられます：\n' +
-                    '1. 選択したファイルに共通の列名が存在しない\n' +
-                    '2. ファイルの形式が異なる\n\n' +
-                    '全てのファイルで同じ列名を使用していることを確認してください。'
-                )
-                return
-                
-            # 共通の候補を使用
-            final_candidates = list(common_candidates)
-            
-            # ドロップダウンに設定
-            self.z_combo['values'] = final_candidates
-            
-            # 現在の選択を維持（無効な場合は先頭を選択）
-            current = self.z_var.get()
-            if current not in final_candidates:
-                self.z_var.set(final_candidates[0])
-                
-        except Exception as e:
-            messagebox.showwarning('警告', f'列候補の取得中にエラーが発生しました:\n{str(e)}')
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        # 各ファイルの先頭行だけを読み込んで列候補を取得（ワーカースレッドで実行）
+        self._z_probe_paths = paths
+        run_probe(
+            self, common_z_candidates, (paths,),
+            lambda candidates: self._apply_z_candidates(paths, candidates),
+            lambda e: self._z_candidates_failed(paths, e),
+        )
+
+    def _apply_z_candidates(self, paths, candidates):
+        """共通の標高値列候補をドロップダウンに設定する"""
+        # 取得中に別のファイルが選択された場合は古い結果を捨てる
+        if paths != self._z_probe_paths:
+            return
+
+        # 共通の候補がない場合は警告を表示
+        if not candidates:
             self.z_combo['values'] = []
             self.z_var.set('')
+            messagebox.showwarning(
+                '警告', 
+                'ファイル間で共通の標高値列が見つかりません。\n' +
+                '以下の理由が考えられます：\n' +
+                '1. 選択したファイルに共通の列名が存在しない\n' +
+                '2. ファイルの形式が異なる\n\n' +
+                '全てのファイルで同じ列名を使用していることを確認してください。'
+            )
+            return
+
+        # ドロップダウンに設定
+        self.z_combo['values'] = candidates
+
+        # 現在の選択を維持（無効な場合は先頭を選択）
+        current = self.z_var.get()
+        if current not in candidates:
+            self.z_var.set(candidates[0])
+
+    def _z_candidates_failed(self, paths, e):
+        if paths != self._z_probe_paths:
+            return
+        messagebox.showwarning('警告', f'列候補の取得中にエラーが発生しました:\n{str(e)}')
+        self.z_combo['values'] = []
+        self.z_var.set('')
     # 元実装: path が文字列のみ :contentReference[oaicite:1]{index=1}
 
 
@@ -379,45 +386,73 @@ basin_mesh_elev；流域界の標高メッシュ
             messagebox.showerror('エラー', '必須項目が入力されていません。')
             return
 
+        try:
+            params = dict(
+                domain_shp=self.domain_var.get(),
+                basin_shp=self.basin_var.get(),
+                num_cells_x=int(self.cells_x_var.get()),
+                # Y方向セル数をX方向セル数と同一にする
+                num_cells_y=int(self.cells_x_var.get()),
+                points_path=paths,
+                out_dir=self.outdir_var.get(),
+                zcol=self.z_var.get(),
+                nodata=float(self.nodata_var.get()),
+                standard_mesh=STANDARD_MESH,
+                mesh_id=MESH_ID,
+                # 入力が変わっていない段階（標準メッシュ抽出・メッシュ生成・点群集計）は再計算しない
+                cache_dir=default_cache_dir(),
+            )
+        except ValueError:
+            messagebox.showerror('エラー', 'メッシュ分割数と NODATA値は数値で指定してください。')
+            return
+
         self.run_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
         self.status_var.set('実行中...')
+        self.progress_var.set(0.0)
+        # 処理はワーカープロセス（ランチャーから起動した場合）またはスレッドで実行する
+        self.job = submit(
+            'src.make_shp.pipeline:pipeline', params,
+            lambda kind, data: self.result_queue.put((kind, data)),
+        )
 
-        def worker():
-            try:
-                pipeline(
-                    domain_shp=self.domain_var.get(),
-                    basin_shp=self.basin_var.get(),
-                    num_cells_x=int(self.cells_x_var.get()),
-                    # Y方向セル数をX方向セル数と同一にする
-                    num_cells_y=int(self.cells_x_var.get()),
-                    points_path=paths,
-                    out_dir=self.outdir_var.get(),
-                    zcol=self.z_var.get(),
-                    nodata=float(self.nodata_var.get()),
-                    standard_mesh=STANDARD_MESH,
-                    mesh_id=MESH_ID
-                )
-                self.result_queue.put(('success', 'メッシュ抽出・生成と標高付与が完了しました'))
-            except Exception as e:
-                self.result_queue.put(('error', str(e)))
-        threading.Thread(target=worker, daemon=True).start()
+    def cancel_process(self):
+        """実行中の処理にキャンセルを要求する（区切りのよいところで中断される）"""
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_button.config(state='disabled')
+            self.status_var.set('キャンセル中...')
 
     def check_queue(self):
         """キューをチェックし、メッセージがあれば処理する"""
         try:
             # キューからメッセージを取得（ブロックなし）
             message_type, data = self.result_queue.get_nowait()
+            # 進捗は溜まっている分をまとめて反映し、最新の状態だけを表示する
+            while message_type == 'progress':
+                self.progress_var.set(overall_fraction(data) * 100)
+                self.status_var.set(format_event(data))
+                self.result_queue.task_done()
+                message_type, data = self.result_queue.get_nowait()
             
             # ボタンの状態を元に戻す
             self.run_button.config(state='normal')
+            self.cancel_button.config(state='disabled')
+            self.job = None
             
             # メッセージタイプに応じた処理
             if message_type == 'success':
                 self.status_var.set("完了")
-                messagebox.showinfo('完了', data)
+                self.progress_var.set(100.0)
+                messagebox.showinfo('完了', 'メッシュ抽出・生成と標高付与が完了しました')
             elif message_type == 'error':
                 self.status_var.set("エラーが発生しました")
                 messagebox.showerror('エラー', f'処理中にエラーが発生しました: {data}')
+            elif message_type == 'cancelled':
+                # 中断した処理の中間データを解放する
+                gc.collect()
+                self.status_var.set(data)
+                self.progress_var.set(0.0)
                 
             # 処理完了をマーク
             self.result_queue.task_done()
@@ -10,11 +10,10 @@ import sys
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 
-import threading
 import queue
 import tkinter.font as tkFont
 
-from src.make_shp.mesh_generator import generate_mesh
+from src.common.worker import submit
 
 BASE_DIR = getattr(
     sys, '_MEIPASS',
@@ -234,23 +233,32 @@ RRI計算対象領域となる流域のポリゴンシェープファイルを
         self.master.config(cursor='wait')
         self.update()
 
-        # 別スレッドで処理を実行
-        threading.Thread(target=self._run_in_thread, daemon=True).start()
-
-    def _run_in_thread(self):
-        """別スレッドで実行する処理"""
         try:
-            generate_mesh(
+            cells = int(self.cells_var.get())
+        except ValueError:
+            self.result_queue.put(('error', 'セル数は整数で指定してください'))
+            return
+
+        # 処理はワーカープロセス（ランチャーから起動した場合）またはスレッドで実行する
+        submit(
+            'src.make_shp.mesh_generator:generate_mesh',
+            dict(
                 domain_shp=self.domain_var.get(),
                 basin_shp=self.basin_var.get(),
-                cells=int(self.cells_var.get()),
+                cells=cells,
                 out_dir=self.outdir_var.get(),
                 standard_mesh=STANDARD_MESH,
-                mesh_id=MESH_ID
-            )
+                mesh_id=MESH_ID,
+            ),
+            self._on_message,
+        )
+
+    def _on_message(self, kind, data):
+        """処理の結果をキューに渡す（進捗は表示しない）"""
+        if kind == 'success':
             self.result_queue.put(('success', 'メッシュの生成が完了しました'))
-        except Exception as e:
-            self.result_queue.put(('error', f'エラーが発生しました: {str(e)}'))
+        elif kind != 'progress':
+            self.result_queue.put(('error', f'エラーが発生しました: {data}'))
 
     def check_queue(self):
         """キューをチェックして結果を処理"""
@@ -18,7 +18,9 @@ def generate_mesh(domain_shp: str,
                  cells: int,
                  out_dir: str,
                  standard_mesh: str | None = None,
-                 mesh_id: str | None = None) -> None:
+                 mesh_id: str | None = None,
+                 cancel=None,
+                 progress=None) -> None:
     """計算領域と流域界のメッシュを生成します。
 
     パラメータ
@@ -35,6 +37,10 @@ def generate_mesh(domain_shp: str,
         標準メッシュのシェープファイルパス（オプション）
     mesh_id : str | None, optional
         標準メッシュのIDカラム名（standard_mesh指定時必須）
+    cancel : CancelToken | None, optional
+        キャンセル要求（src.common.cancel）
+    progress : callable | None, optional
+        メッシュ生成の進捗コールバック（src.common.progress）
     """
 
     # --- 0) 標準メッシュ抽出 ---
@@ -48,7 +54,7 @@ def generate_mesh(domain_shp: str,
 
     # --- 1) メッシュ生成 ---
     print("=== メッシュ生成 ===")
-    generate_main(domain_shp, basin_shp, x_cells, y_cells, out_dir)
+    generate_main(domain_shp, basin_shp, x_cells, y_cells, out_dir, cancel, progress)
     domain_out = os.path.join(out_dir, "domain_mesh.shp")
     print(f"計算領域メッシュを生成中: {x_cells}x{y_cells} グリッド...")
     print(f"計算領域メッシュを保存しました: {domain_out}")
@@ -2,9 +2,19 @@
 import os
 import argparse
 import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from src.make_shp.generate_mesh import main as generate_main
-from src.make_shp.add_elevation import main as elevation_main
+from src.make_shp.add_elevation import (DEFAULT_MEDIAN_RESOLUTION, STATISTIC_COLUMNS,
+                                        main as elevation_main, main_pyramid as elevation_pyramid)
 from src.make_shp.extract_standard_mesh import extract_cells
+from src.make_shp.plan import (available_memory, check_plan, format_plan, plan_pipeline,
+                               suggest_tile_size)
+from src.make_shp.tiled import DEFAULT_TILE_SIZE, pipeline_tiled
+from src.common import layer_cache
+from src.common.cancel import JobCancelled, check_cancel
+from src.common.progress import ConsoleProgress, ProgressReporter
+from src.common.stage_cache import DEFAULT_MAX_BYTES as DEFAULT_CACHE_BYTES, StageCache, input_fingerprint
 
 def pipeline(domain_shp,
              basin_shp,
@@ -15,65 +25,394 @@ def pipeline(domain_shp,
              zcol=None,
              nodata=None,
              standard_mesh=None,
-             mesh_id=None):
+             mesh_id=None,
+             cancel=None,
+             progress=None,
+             verbose=False,
+             cache_dir=None,
+             cache_max_bytes=DEFAULT_CACHE_BYTES,
+             statistics=(),
+             median_resolution=DEFAULT_MEDIAN_RESOLUTION):
     """
     1) 標準地域メッシュと計算領域の重なるセルを抽出（標準メッシュを使用する場合）
     2) メッシュ生成
     3) 標高付与
     4) 中間ファイルを削除
+
+    cancel に CancelToken を渡すと各段階の区切りでキャンセルを確認し、
+    キャンセル時はこの実行で作成したファイルを削除して JobCancelled を送出する。
+    progress に進捗コールバックを渡すと、各段階の進捗を通知する（src.common.progress）。
+    verbose は標高付与のデバッグ表示に渡す。
+    cache_dir を指定すると、各段階の出力（抽出結果、生成メッシュ、流域セルごとの集計値）を
+    入力ファイルのフィンガープリントとパラメータをキーにキャッシュし（src.common.stage_cache）、
+    入力が変わっていない段階は計算を省略する。
+    statistics, median_resolution は標高付与に渡す（平均と同じ集計で求めて出力する統計量）。
+    """
+    reporter = ProgressReporter(progress, steps=3 if standard_mesh else 2)
+    cache = StageCache(cache_dir, cache_max_bytes) if cache_dir else None
+    created = ["domain_mesh", "basin_mesh"]
+    try:
+        # --- 0) 標準メッシュ抽出 / 1) メッシュ生成 ---
+        basin_mesh, domain_mesh, grid_key = _build_meshes(
+            domain_shp, basin_shp, num_cells_x, num_cells_y, out_dir, standard_mesh, mesh_id,
+            cache, cancel, reporter, created)
+
+        # --- 2) 標高付与 ---
+        reporter.begin("標高付与")
+        elevation_main(basin_mesh, domain_mesh, points_path, out_dir, zcol, nodata, cancel,
+                       reporter.nested(), verbose, cache, grid_key, statistics=statistics,
+                       median_resolution=median_resolution)
+        reporter.end()
+    except JobCancelled:
+        print("=== キャンセルされました ===")
+        _remove_outputs(out_dir, created)
+        raise
+
+    # 3) 中間ファイルをまとめて削除
+    try:
+        _remove_outputs(out_dir, ("domain_mesh", "basin_mesh"))
+    except Exception as e:
+        print(f"[WARNING] 中間ファイルの削除中にエラーが発生しました: {e}")
+
+
+def _build_meshes(domain_shp, basin_shp, num_cells_x, num_cells_y, out_dir, standard_mesh, mesh_id,
+                  cache, cancel, reporter, created):
+    """
+    pipeline の標準メッシュ抽出とメッシュ生成を実行し、
+    (流域メッシュ, 計算領域メッシュ, メッシュのキャッシュキー) を返す
+    作成した中間ファイルの名前（拡張子なし）は created に追加する
     """
     # --- 0) 標準メッシュ抽出 ---
+    domain_key = input_fingerprint(domain_shp)
     if standard_mesh:
         extracted = os.path.join(out_dir, "domain_standard_mesh.shp")
-        print(f"Extracting standard mesh cells intersecting domain → {extracted}")
-        extract_cells(standard_mesh, domain_shp, extracted, mesh_id)
+        reporter.begin("標準メッシュ抽出")
+        created.append("domain_standard_mesh")
+        if cache is not None:
+            domain_key = cache.key('extract', input_fingerprint(standard_mesh), domain_key, mesh_id)
+        if cache is not None and cache.restore(domain_key, out_dir):
+            print(f"Standard mesh cells restored from cache → {extracted}")
+        else:
+            print(f"Extracting standard mesh cells intersecting domain → {extracted}")
+            extract_cells(standard_mesh, domain_shp, extracted, mesh_id)
+            if cache is not None:
+                cache.save(domain_key, out_dir, ["domain_standard_mesh"])
         domain_shp = extracted
+    check_cancel(cancel)
 
     # --- 1) メッシュ生成 ---
-    print("=== メッシュ生成 ===")
-    generate_main(domain_shp, basin_shp, num_cells_x, num_cells_y, out_dir)
+    reporter.begin("メッシュ生成")
+    grid_key = None
+    if cache is not None:
+        grid_key = cache.key('grid', domain_key, input_fingerprint(basin_shp),
+                             num_cells_x, num_cells_y)
+    if cache is not None and cache.restore(grid_key, out_dir):
+        print("メッシュの入力が前回と同じため、キャッシュしたメッシュを使います。")
+    else:
+        generate_main(domain_shp, basin_shp, num_cells_x, num_cells_y, out_dir, cancel,
+                      reporter.nested())
+        if cache is not None:
+            cache.save(grid_key, out_dir, ["domain_mesh", "basin_mesh"])
 
-    # --- 2) 標高付与 ---
-    basin_mesh  = os.path.join(out_dir, "basin_mesh.shp")
-    domain_mesh = os.path.join(out_dir, "domain_mesh.shp")
-    print("=== 標高付与 ===")
-    elevation_main(basin_mesh, domain_mesh, points_path, out_dir, zcol, nodata)
+    return (os.path.join(out_dir, "basin_mesh.shp"),
+            os.path.join(out_dir, "domain_mesh.shp"),
+            grid_key)
+
+
+def pipeline_sweep(domain_shp,
+                   basin_shp,
+                   cell_counts,
+                   points_path,
+                   out_dir,
+                   zcol=None,
+                   nodata=None,
+                   standard_mesh=None,
+                   mesh_id=None,
+                   cancel=None,
+                   progress=None,
+                   verbose=False,
+                   cache_dir=None,
+                   cache_max_bytes=DEFAULT_CACHE_BYTES,
+                   jobs=1,
+                   pyramid=False):
+    """
+    複数のメッシュ分割数で pipeline を実行し、分割数ごとに out_dir/<分割数>/ へ出力する
+    （X・Y 方向とも同じ分割数）
+
+    計算領域・流域界・標準メッシュ・点群は最初の 1 回だけ読み込み、以降の分割数では
+    読み込んだデータを再利用する（src.common.layer_cache）。
+    jobs が 2 以上の場合は分割数ごとにプロセスを分けて並列に実行する。
+    この場合、入力の読み込みはワーカープロセスごとに 1 回になる。
+    pyramid=True の場合は全分割数のメッシュを先に生成し、標高付与を 1 回の点群集計で行う
+    （add_elevation.main_pyramid。400, 200, 100, 50 のように分割数が最大の分割数の約数になっていれば、
+    粗いメッシュは最も細かいメッシュの集計値から求める）。このとき jobs は使わない。
+
+    Returns:
+        dict: 分割数 -> 出力フォルダ
+    """
+    cell_counts = list(dict.fromkeys(int(n) for n in cell_counts))
+    if not cell_counts:
+        raise ValueError("メッシュ分割数が指定されていません")
+    out_dirs = {n: os.path.join(out_dir, str(n)) for n in cell_counts}
+    kwargs = dict(zcol=zcol, nodata=nodata, standard_mesh=standard_mesh, mesh_id=mesh_id,
+                  verbose=verbose, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes)
+    if pyramid:
+        _sweep_pyramid(domain_shp, basin_shp, cell_counts, points_path, out_dirs, kwargs,
+                       cancel, progress)
+        return out_dirs
+    if jobs and jobs > 1 and len(cell_counts) > 1:
+        reporter = ProgressReporter(progress, steps=1)
+        reporter.begin("分割数ごとの並列実行", total=len(cell_counts))
+        with ProcessPoolExecutor(max_workers=min(jobs, len(cell_counts)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=layer_cache.enable) as executor:
+            futures = {
+                executor.submit(_sweep_one, domain_shp, basin_shp, n, points_path, out_dirs[n], kwargs): n
+                for n in cell_counts
+            }
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    reporter.advance(detail=f"{futures[future]} 分割")
+                    check_cancel(cancel)
+            except BaseException:
+                # 実行待ちの分割数は取り消す（実行中のものは終わるまで待つ）
+                for future in futures:
+                    future.cancel()
+                raise
+        reporter.end()
+        return out_dirs
+
+    reporter = ProgressReporter(progress, steps=len(cell_counts))
+    with layer_cache.session():
+        for n in cell_counts:
+            check_cancel(cancel)
+            reporter.begin(f"{n} 分割")
+            print(f"=== メッシュ分割数 {n} → {out_dirs[n]} ===")
+            _sweep_one(domain_shp, basin_shp, n, points_path, out_dirs[n], kwargs,
+                       cancel, reporter.nested())
+        reporter.end()
+    return out_dirs
+
+
+def _sweep_pyramid(domain_shp, basin_shp, cell_counts, points_path, out_dirs, kwargs,
+                   cancel=None, progress=None):
+    """pipeline_sweep のピラミッドモード: 全分割数のメッシュを生成してから標高をまとめて付与する"""
+    reporter = ProgressReporter(progress, steps=len(cell_counts) + 1)
+    cache_dir = kwargs['cache_dir']
+    cache = StageCache(cache_dir, kwargs['cache_max_bytes']) if cache_dir else None
+    created = ["domain_mesh", "basin_mesh"]
+    levels = []
+    try:
+        with layer_cache.session():
+            for n in cell_counts:
+                check_cancel(cancel)
+                reporter.begin(f"{n} 分割のメッシュ生成")
+                print(f"=== メッシュ分割数 {n} → {out_dirs[n]} ===")
+                os.makedirs(out_dirs[n], exist_ok=True)
+                sub = ProgressReporter(reporter.nested(), steps=2 if kwargs['standard_mesh'] else 1)
+                basin_mesh, domain_mesh, _ = _build_meshes(
+                    domain_shp, basin_shp, n, n, out_dirs[n], kwargs['standard_mesh'],
+                    kwargs['mesh_id'], cache, cancel, sub, created)
+                sub.end()
+                levels.append((basin_mesh, domain_mesh, out_dirs[n]))
+
+            reporter.begin("標高付与（ピラミッド）")
+            elevation_pyramid(levels, points_path, kwargs['zcol'], kwargs['nodata'], cancel,
+                              reporter.nested(), kwargs['verbose'])
+            reporter.end()
+    except JobCancelled:
+        print("=== キャンセルされました ===")
+        for n in cell_counts:
+            _remove_outputs(out_dirs[n], created)
+        raise
 
-    # 3) 中間ファイルをまとめて削除
     try:
-        for basename in ("domain_mesh", "basin_mesh"):
-            pattern = os.path.join(out_dir, f"{basename}.*")
-            for fp in glob.glob(pattern):
-                os.remove(fp)
+        for n in cell_counts:
+            _remove_outputs(out_dirs[n], ("domain_mesh", "basin_mesh"))
     except Exception as e:
         print(f"[WARNING] 中間ファイルの削除中にエラーが発生しました: {e}")
 
+
+def _sweep_one(domain_shp, basin_shp, cells, points_path, out_dir, kwargs, cancel=None, progress=None):
+    """pipeline_sweep の 1 つの分割数を実行する（並列実行時はワーカープロセスから呼ばれる）"""
+    os.makedirs(out_dir, exist_ok=True)
+    pipeline(domain_shp, basin_shp, cells, cells, points_path, out_dir,
+             cancel=cancel, progress=progress, **kwargs)
+
+
+def _preflight(args):
+    """
+    コマンドライン引数の設定を見積もり、(見積もりの表示, 警告のリスト, 推奨するタイルのセル数) を返す
+    タイル実行に切り替えられない設定や、メモリに収まる場合はタイルのセル数は None
+    """
+    levels = [(n, n) for n in args.sweep] if args.sweep is not None else [(args.cells_x, args.cells_y)]
+    available = available_memory()
+    jobs = min(args.jobs, len(levels)) if args.sweep is not None and not args.pyramid else 1
+    texts, warnings = [], []
+    tile_size = None
+    for nx, ny in levels:
+        plan = plan_pipeline(args.domain, args.basin, nx, ny, args.points, args.standard_mesh)
+        if args.tile_size is not None:
+            # タイル実行ではメッシュ全体をメモリに載せないため、メモリの見積もりでは警告しない
+            level_warnings = check_plan(plan, float('inf'), jobs, shapefile=not args.ascii)
+        else:
+            level_warnings = check_plan(plan, available, jobs, shapefile=not args.ascii)
+            if args.sweep is None and not args.standard_mesh and plan['domain_features'] == 1:
+                tile_size = suggest_tile_size(plan, available, args.jobs)
+        texts.append(f"--- {nx} x {ny} ---\n" + format_plan(plan, level_warnings))
+        warnings.extend(level_warnings)
+    if available is not None:
+        texts.append(f"利用可能なメモリ: {available / 1024 ** 3:.1f}GB")
+    if tile_size is not None:
+        texts.append(f"タイル実行を推奨します: --tile-size {tile_size}")
+    return '\n'.join(texts), warnings, tile_size
+
+
+def _remove_outputs(out_dir, basenames):
+    """out_dir 内の <basename>.* を削除する"""
+    for basename in basenames:
+        pattern = os.path.join(glob.escape(out_dir), f"{basename}.*")
+        for fp in glob.glob(pattern):
+            os.remove(fp)
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser(
         description="計算領域→（標準地域メッシュ抽出）→メッシュ生成→標高付与 を一括実行"
     )
     ap.add_argument("--domain",        required=True, help="計算領域ポリゴン (.shp)")
     ap.add_argument("--basin",         required=True, help="流域界ポリゴン (.shp)")
-    ap.add_argument("--cells_x",       type=int, required=True, help="X方向セル数")
-    ap.add_argument("--cells_y",       type=int, required=True, help="Y方向セル数")
-    ap.add_argument("--points",        required=True, help="点群データ (CSV/SHP)")
+    ap.add_argument("--cells_x",       type=int, default=None, help="X方向セル数")
+    ap.add_argument("--cells_y",       type=int, default=None, help="Y方向セル数")
+    ap.add_argument("--sweep",         type=int, nargs='+', default=None,
+                    help="複数の分割数（例: 25 50 100 200）。入力を 1 回だけ読み込み、outdir/<分割数>/ へ出力")
+    ap.add_argument("--jobs",          type=int, default=1, help="--sweep・--tile-size の同時実行数")
+    ap.add_argument("--pyramid",       action="store_true",
+                    help="--sweep で点群を 1 回だけ集計し、粗い分割数は細かい分割数の集計値から求める")
+    ap.add_argument("--points",        required=True, help="点群データ (CSV/SHP, または point_tiles の索引フォルダ)")
     ap.add_argument("--zcol",          default=None, help="Z 列名")
     ap.add_argument("--outdir",        default="./outputs", help="出力フォルダ")
     ap.add_argument("--nodata",        type=float, default=None, help="NODATA値 (デフォルト: -9999)")
     ap.add_argument("--standard-mesh", default=None, help="標準地域メッシュ (.shp) を指定すると抽出処理を実行")
     ap.add_argument("--mesh-id",       default=None, help="標準メッシュのID列名 (省略可)")
+    ap.add_argument("--verbose",       action="store_true", help="標高付与のデバッグ情報を表示")
+    ap.add_argument("--tile-size",     type=int, default=None,
+                    help=f"計算領域を 1 辺このセル数のタイルに分けて処理（メモリに載らない大きさ向け, 例: {DEFAULT_TILE_SIZE}）。"
+                         "--jobs で同時実行数を指定")
+    ap.add_argument("--ascii",         default=None, metavar="ASC",
+                    help="シェープファイルの代わりに、計算領域の標高をこの ASCII Grid (.asc, .prj) に直接出力")
+    ap.add_argument("--stats",         nargs='+', default=[], choices=list(STATISTIC_COLUMNS),
+                    help="平均と同じ集計で求めて出力する統計量（列名は elev_min, elev_max, elev_std, elev_med）")
+    ap.add_argument("--median-resolution", type=float, default=DEFAULT_MEDIAN_RESOLUTION,
+                    help=f"中央値の近似の分解能（標高の単位。既定: {DEFAULT_MEDIAN_RESOLUTION}）")
+    ap.add_argument("--plan",          action="store_true",
+                    help="実行せずに、セル数・メモリのピーク・所要時間の見積もりだけを表示")
+    ap.add_argument("--cache-dir",     default=None,
+                    help="段階ごとの出力をキャッシュするフォルダ（入力が変わっていない段階を省略）")
+    ap.add_argument("--cache-max-mb",  type=int, default=None,
+                    help=f"キャッシュ全体の上限 (MB, 既定: {DEFAULT_CACHE_BYTES // 1024 ** 2})")
     args = ap.parse_args()
+    if args.sweep is None and (args.cells_x is None or args.cells_y is None):
+        ap.error("--cells_x と --cells_y（または --sweep）を指定してください")
+
+    if args.tile_size is not None and (args.sweep is not None or args.standard_mesh):
+        ap.error("--tile-size は --sweep・--standard-mesh と併用できません")
+    if args.ascii and (args.sweep is not None or args.standard_mesh):
+        ap.error("--ascii は --sweep・--standard-mesh と併用できません")
+    if args.stats and (args.sweep is not None or args.ascii):
+        ap.error("--stats は --sweep・--ascii と併用できません")
+    if args.pyramid and args.sweep is None:
+        ap.error("--pyramid は --sweep と併用してください")
+    # タイル実行（--ascii を含む）では使えないオプション
+    untiled_options = [name for name, given in (("--cache-dir", args.cache_dir),
+                                                ("--cache-max-mb", args.cache_max_mb is not None),
+                                                ("--verbose", args.verbose)) if given]
+    if untiled_options and (args.tile_size is not None or args.ascii):
+        ap.error(f"{'・'.join(untiled_options)} は --tile-size・--ascii と併用できません")
+    if args.cache_max_mb is None:
+        args.cache_max_mb = DEFAULT_CACHE_BYTES // 1024 ** 2
+
+    if args.plan:
+        text, warnings, _ = _preflight(args)
+        print(text)
+        raise SystemExit(1 if warnings else 0)
+    try:
+        _, warnings, suggested_tile_size = _preflight(args)
+    except Exception as e:
+        warnings, suggested_tile_size = [], None
+        print(f"[WARNING] 実行前の見積もりに失敗しました: {e}")
+    for message in warnings:
+        print(f"[WARNING] {message}")
+    tile_size = args.tile_size
+    if tile_size is None and suggested_tile_size is not None:
+        if untiled_options:
+            print(f"[WARNING] メモリに収まらない見込みですが、{'・'.join(untiled_options)} を指定しているため"
+                  "タイル実行には切り替えません")
+        else:
+            tile_size = suggested_tile_size
+            print(f"[INFO] メモリに収まらない見込みのため、タイル実行（1 辺 {tile_size} セル）に切り替えます")
+
+    if tile_size is None and args.ascii:
+        # タイルに分けない場合も、集計結果の配列から直接書き出すためタイル実行の処理を 1 タイルで使う
+        tile_size = max(args.cells_x, args.cells_y)
 
     os.makedirs(args.outdir, exist_ok=True)
-    pipeline(
-        args.domain,
-        args.basin,
-        args.cells_x,
-        args.cells_y,
-        args.points,
-        args.outdir,
-        args.zcol,
-        args.nodata,
-        args.standard_mesh,
-        args.mesh_id
-    )
+    if tile_size is not None:
+        try:
+            pipeline_tiled(
+                args.domain,
+                args.basin,
+                args.cells_x,
+                args.cells_y,
+                args.points,
+                args.outdir,
+                args.zcol,
+                args.nodata,
+                tile_size=tile_size,
+                jobs=args.jobs,
+                progress=ConsoleProgress(),
+                ascii_path=args.ascii,
+                statistics=args.stats,
+                median_resolution=args.median_resolution
+            )
+        except ValueError as e:
+            # 計算領域のフィーチャが 1 つでない場合など、タイル実行できない入力
+            print(f"[ERROR] {e}")
+            raise SystemExit(2)
+    elif args.sweep is not None:
+        pipeline_sweep(
+            args.domain,
+            args.basin,
+            args.sweep,
+            args.points,
+            args.outdir,
+            args.zcol,
+            args.nodata,
+            args.standard_mesh,
+            args.mesh_id,
+            progress=ConsoleProgress(),
+            verbose=args.verbose,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 ** 2,
+            jobs=args.jobs,
+            pyramid=args.pyramid
+        )
+    else:
+        pipeline(
+            args.domain,
+            args.basin,
+            args.cells_x,
+            args.cells_y,
+            args.points,
+            args.outdir,
+            args.zcol,
+            args.nodata,
+            args.standard_mesh,
+            args.mesh_id,
+            progress=ConsoleProgress(),
+            verbose=args.verbose,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 ** 2,
+            statistics=args.stats,
+            median_resolution=args.median_resolution
+        )
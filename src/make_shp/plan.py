@@ -0,0 +1,246 @@
+"""
+plan.py
+pipeline の実行前に、セル数・メモリのピーク・所要時間を見積もる（--plan）
+
+入力はメタデータ（フィーチャ数・範囲・点群ファイルのサイズ）だけを読み、
+メッシュや点群の本体は読み込まない。見積もりは COST_MODEL の係数による概算で、
+流域メッシュのセル数は範囲の重なりから求めた上限を使う。
+"""
+import ctypes
+import math
+import os
+import sys
+
+from src.common.metadata import estimate_csv_rows, probe_layer_summary
+from src.make_shp.point_tiles import is_point_index, load_point_index
+
+# コストモデルの係数（src.benchmark の合成データで、メッシュ 4 万〜64 万セル・点群 100 万〜400 万点を計測して決めた値）
+COST_MODEL = {
+    # Python・geopandas などを読み込んだ時点のメモリ
+    'base_bytes': 150 * 1024 ** 2,
+    # メッシュ生成（計算領域メッシュ 1 セルあたり）
+    'mesh_bytes_per_cell': 600,
+    'mesh_seconds_per_cell': 9e-6,
+    # 標高付与（計算領域メッシュ 1 セルあたり・点 1 行あたり）
+    'elevation_bytes_per_cell': 500,
+    'elevation_seconds_per_cell': 13e-6,
+    'point_bytes_per_row': 80,
+    'point_seconds_per_row': 0.45e-6,
+    # 標準メッシュ抽出（標準メッシュ 1 フィーチャあたり）
+    'extract_bytes_per_feature': 600,
+    'extract_seconds_per_feature': 10e-6,
+}
+
+# 見積もりに掛ける安全率
+SAFETY_FACTOR = 1.3
+
+# 利用可能なメモリに対して、この割合を超える見積もりは警告する
+MEMORY_LIMIT_FRACTION = 0.8
+
+# タイル実行に切り替えるときのタイルの 1 辺のセル数の範囲
+MIN_TILE_SIZE = 100
+MAX_TILE_SIZE = 4000
+
+# シェープファイル（.shp / .dbf）の上限サイズと、矩形セル 1 つあたりのおおよそのサイズ
+SHAPEFILE_LIMIT_BYTES = 2 * 1024 ** 3
+SHP_BYTES_PER_CELL = 136
+
+
+def available_memory():
+    """利用可能な物理メモリ（バイト）を返す。取得できなければ None"""
+    if sys.platform == 'win32':
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ('dwLength', ctypes.c_ulong),
+                ('dwMemoryLoad', ctypes.c_ulong),
+                ('ullTotalPhys', ctypes.c_ulonglong),
+                ('ullAvailPhys', ctypes.c_ulonglong),
+                ('ullTotalPageFile', ctypes.c_ulonglong),
+                ('ullAvailPageFile', ctypes.c_ulonglong),
+                ('ullTotalVirtual', ctypes.c_ulonglong),
+                ('ullAvailVirtual', ctypes.c_ulonglong),
+                ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+            ]
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return int(status.ullAvailPhys)
+        return None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _overlap_fraction(inner, outer):
+    """outer の範囲のうち inner の範囲と重なる割合（0〜1）"""
+    w = min(inner[2], outer[2]) - max(inner[0], outer[0])
+    h = min(inner[3], outer[3]) - max(inner[1], outer[1])
+    area = (outer[2] - outer[0]) * (outer[3] - outer[1])
+    if w <= 0 or h <= 0 or area <= 0:
+        return 0.0
+    return min(w * h / area, 1.0)
+
+
+def count_points(points_path):
+    """
+    点群ファイル（1 つまたはリスト）の点数を見積もる
+    （CSV は先頭から推定、SHP はフィーチャ数、point_tiles の索引は全タイルの点数）
+    """
+    paths = [points_path] if isinstance(points_path, str) else list(points_path)
+    total = 0
+    for path in paths:
+        if is_point_index(path):
+            total += load_point_index(path)['count']
+        elif path.lower().endswith('.shp'):
+            total += probe_layer_summary(path)['count']
+        else:
+            total += estimate_csv_rows(path)
+    return total
+
+
+def plan_pipeline(domain_shp, basin_shp, cells_x, cells_y, points_path, standard_mesh=None,
+                  model=None):
+    """
+    pipeline の段階ごとのセル数・メモリのピーク・所要時間を見積もる
+
+    Returns:
+        dict: 以下のキーを持つ辞書
+            - 'domain_features': 計算領域のフィーチャ数（標準メッシュ使用時は抽出セル数の上限）
+            - 'domain_cells', 'basin_cells': 計算領域・流域メッシュのセル数（流域は上限）
+            - 'points': 点数
+            - 'stages': 段階ごとの {'name', 'seconds', 'peak_bytes'} のリスト
+            - 'seconds', 'peak_bytes': 合計の所要時間とメモリのピーク
+    """
+    model = {**COST_MODEL, **(model or {})}
+    domain = probe_layer_summary(domain_shp)
+    basin = probe_layer_summary(basin_shp)
+    stages = []
+
+    features = domain['count']
+    if standard_mesh:
+        standard = probe_layer_summary(standard_mesh)
+        # 標準メッシュのうち計算領域の範囲に入る割合だけ抽出されるとみなす
+        features = max(1, round(standard['count'] * _overlap_fraction(domain['bounds'], standard['bounds'])))
+        stages.append({
+            'name': '標準メッシュ抽出',
+            'seconds': standard['count'] * model['extract_seconds_per_feature'],
+            'peak_bytes': standard['count'] * model['extract_bytes_per_feature'],
+        })
+
+    domain_cells = features * cells_x * cells_y
+    basin_cells = round(domain_cells * _overlap_fraction(basin['bounds'], domain['bounds']))
+    points = count_points(points_path)
+
+    stages.append({
+        'name': 'メッシュ生成',
+        'seconds': domain_cells * model['mesh_seconds_per_cell'],
+        'peak_bytes': domain_cells * model['mesh_bytes_per_cell'],
+    })
+    stages.append({
+        'name': '標高付与',
+        'seconds': (domain_cells * model['elevation_seconds_per_cell']
+                    + points * model['point_seconds_per_row']),
+        'peak_bytes': (domain_cells * model['elevation_bytes_per_cell']
+                       + points * model['point_bytes_per_row']),
+    })
+    for stage in stages:
+        stage['seconds'] *= SAFETY_FACTOR
+        stage['peak_bytes'] = int(model['base_bytes'] + stage['peak_bytes'] * SAFETY_FACTOR)
+
+    return {
+        'domain_features': features,
+        'domain_cells': domain_cells,
+        'basin_cells': basin_cells,
+        'points': points,
+        'stages': stages,
+        'seconds': sum(stage['seconds'] for stage in stages),
+        'peak_bytes': max(stage['peak_bytes'] for stage in stages),
+    }
+
+
+def check_plan(plan, available=None, jobs=1, shapefile=True):
+    """
+    見積もりが実行環境の上限を超えないか確認し、警告メッセージのリストを返す
+
+    Args:
+        plan: plan_pipeline の戻り値
+        available: 利用可能なメモリ（バイト。省略時は available_memory()）
+        jobs: 同時に実行するプロセス数（メモリのピークはこの倍になるとみなす）
+        shapefile: False ならシェープファイルの上限の確認を省く（ASCII Grid に直接出力する場合）
+    """
+    warnings = []
+    if available is None:
+        available = available_memory()
+    peak = plan['peak_bytes'] * max(jobs, 1)
+    if available is not None and peak > available * MEMORY_LIMIT_FRACTION:
+        warnings.append(
+            f"メモリのピークの見積もり {_format_bytes(peak)} が利用可能なメモリ "
+            f"{_format_bytes(available)} の {MEMORY_LIMIT_FRACTION:.0%} を超えます。"
+            "分割数を減らすか、点群を分けて実行してください"
+            + ("（--jobs を減らすと同時実行分のメモリも減ります）" if jobs > 1 else "")
+        )
+    shp_bytes = plan['domain_cells'] * SHP_BYTES_PER_CELL
+    if shapefile and shp_bytes > SHAPEFILE_LIMIT_BYTES:
+        warnings.append(
+            f"計算領域メッシュ {plan['domain_cells']:,} セルはシェープファイルの上限 "
+            f"({_format_bytes(SHAPEFILE_LIMIT_BYTES)}) を超える見込みです。分割数を減らしてください"
+        )
+    return warnings
+
+
+def suggest_tile_size(plan, available=None, jobs=1, model=None):
+    """
+    見積もりのメモリのピークが上限を超える場合に、タイル実行（src.make_shp.tiled）の
+    タイルの 1 辺のセル数を返す。上限に収まる場合や、メモリが取得できない場合は None
+    """
+    model = {**COST_MODEL, **(model or {})}
+    if available is None:
+        available = available_memory()
+    jobs = max(jobs, 1)
+    if available is None or plan['peak_bytes'] * jobs <= available * MEMORY_LIMIT_FRACTION:
+        return None
+    # 1 プロセスあたりに使えるメモリの半分にタイルが収まる大きさ
+    budget = max(available * MEMORY_LIMIT_FRACTION / jobs - model['base_bytes'], 0) / 2
+    per_cell = (model['mesh_bytes_per_cell'] + model['elevation_bytes_per_cell']) * SAFETY_FACTOR
+    return max(MIN_TILE_SIZE, min(int(math.sqrt(budget / per_cell)), MAX_TILE_SIZE))
+
+
+def _format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if value < 1024 or unit == 'TB':
+            return f"{value:.0f}{unit}" if unit == 'B' else f"{value:.1f}{unit}"
+        value /= 1024
+
+
+def _format_seconds(value):
+    if value < 60:
+        return f"{value:.1f}秒"
+    if value < 3600:
+        return f"{value / 60:.1f}分"
+    return f"{value / 3600:.1f}時間"
+
+
+def format_plan(plan, warnings=(), available=None):
+    """見積もりを表示用の文字列にする"""
+    lines = [
+        f"計算領域のフィーチャ数: {plan['domain_features']:,}",
+        f"計算領域メッシュ: {plan['domain_cells']:,} セル / 流域メッシュ: 最大 {plan['basin_cells']:,} セル",
+        f"点群: 約 {plan['points']:,} 点",
+    ]
+    for stage in plan['stages']:
+        lines.append(f"  {stage['name']}: 所要時間 約 {_format_seconds(stage['seconds'])}"
+                     f" / メモリ 約 {_format_bytes(stage['peak_bytes'])}")
+    lines.append(f"合計: 所要時間 約 {_format_seconds(plan['seconds'])}"
+                 f" / メモリのピーク 約 {_format_bytes(plan['peak_bytes'])}")
+    if available is not None:
+        lines.append(f"利用可能なメモリ: {_format_bytes(available)}")
+    lines.extend(f"[WARNING] {message}" for message in warnings)
+    return '\n'.join(lines)
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+point_tiles.py
+巨大な点群ファイルを 1 回だけ読み、空間タイルごとのバイナリ列ファイルに振り分ける
+
+座標を tile_size（座標の単位）の正方形タイルに分け、タイルごとに x, y, 標高と
+元のファイルでの通し番号 (seq) を列ごとのファイル（リトルエンディアンの生配列）へ追記する。
+振り分けが終わったら、タイルをさらに cells_per_tile x cells_per_tile のセルに分け、
+タイル内の点をセル番号（行優先）の順に並べ替えて、セルごとの開始位置の表 (cells) を書く。
+最後にタイルの範囲と点数を書いた索引 (points_index.json) を出力する。
+
+add_elevation・pipeline の点群に索引（またはそのフォルダ）を指定すると、
+流域メッシュの範囲と重なるタイルの、範囲と重なるセルの行だけをメモリマップで読み込む
+（読み込む量は範囲内の点数にほぼ比例し、データセット全体の大きさにはよらない）。
+読み込んだ点は seq の順に並べ直すため、集計結果は元のファイルを指定した場合と同じになる。
+
+使用方法:
+    python -m src.make_shp.point_tiles points1.csv points2.csv --outdir points_tiles \\
+        --tile-size 1000 --zcol elevation
+    python -m src.make_shp.pipeline ... --points points_tiles
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import uuid
+
+import numpy as np
+
+from src.common.cancel import check_cancel
+from src.common.progress import ConsoleProgress, ProgressReporter
+
+# 索引のファイル名と形式
+POINT_INDEX_NAME = 'points_index.json'
+INDEX_FORMAT = 2
+
+# タイルの 1 辺の既定の長さ（座標の単位。平面直角座標系ならメートル）
+DEFAULT_TILE_EXTENT = 1000.0
+
+# タイルを分けるセルの 1 辺の既定の数（範囲検索の細かさ）
+DEFAULT_CELLS_PER_TILE = 32
+
+# タイルごとに保存する列と型
+COLUMNS = {'x': '<f8', 'y': '<f8', 'z': '<f8', 'seq': '<i8'}
+
+# タイル内のセルごとの開始位置の表（セル数 + 1 個。セル c の点は [cells[c], cells[c + 1])）
+CELLS_COLUMN = 'cells'
+CELLS_DTYPE = '<i8'
+
+# タイルのファイルを置くサブフォルダ
+TILES_DIR = 'tiles'
+
+
+def _index_file(path):
+    """path が点群の索引（またはそれを含むフォルダ）なら索引ファイルのパスを返す。そうでなければ None"""
+    if os.path.isdir(path):
+        candidate = os.path.join(path, POINT_INDEX_NAME)
+        return candidate if os.path.isfile(candidate) else None
+    return path if path.lower().endswith('.json') else None
+
+
+def is_point_index(path):
+    """path が point_tiles で作った点群の索引（またはそのフォルダ）なら True"""
+    return _index_file(path) is not None
+
+
+def load_point_index(path):
+    """
+    索引を読み込んで辞書で返す（'root' に索引のあるフォルダを加える）
+
+    Raises:
+        ValueError: 索引が見つからない、または形式が異なる場合
+    """
+    index_path = _index_file(path)
+    if index_path is None or not os.path.isfile(index_path):
+        raise ValueError(f"点群の索引が見つかりません: {path}")
+    with open(index_path, encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('format') != INDEX_FORMAT:
+        raise ValueError(f"点群の索引の形式が異なります: {index_path}（point_tiles で作り直してください）")
+    index['root'] = os.path.dirname(os.path.abspath(index_path))
+    return index
+
+
+def _tile_path(root, key, column):
+    return os.path.join(root, TILES_DIR, f"{key}_{column}.bin")
+
+
+def select_tiles(index, bounds=None):
+    """索引のタイルのうち、点の範囲が bounds (minx, miny, maxx, maxy) と重なる（境界を含む）ものを返す"""
+    if bounds is None:
+        return list(index['tiles'])
+    minx, miny, maxx, maxy = bounds
+    return [
+        tile for tile in index['tiles']
+        if tile['bounds'][0] <= maxx and tile['bounds'][2] >= minx
+        and tile['bounds'][1] <= maxy and tile['bounds'][3] >= miny
+    ]
+
+
+def _transformer(index, target_crs):
+    """索引の座標系から target_crs への変換（変換が不要なら None）"""
+    if index.get('crs') is None or target_crs is None:
+        return None
+    from pyproj import CRS, Transformer
+
+    source = CRS.from_user_input(index['crs'])
+    target = CRS.from_user_input(target_crs)
+    if source == target:
+        return None
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def _local_cells(index, tile, x, y):
+    """タイル内の点のセルの列・行番号（浮動小数点の誤差でタイル外になった点は端のセルに含める）"""
+    size, n = index['tile_size'], index['cells_per_tile']
+    cx = np.floor((x - tile['tile'][0] * size) / (size / n)).astype('int64')
+    cy = np.floor((y - tile['tile'][1] * size) / (size / n)).astype('int64')
+    return np.clip(cx, 0, n - 1), np.clip(cy, 0, n - 1)
+
+
+def _sort_tile(root, index, tile):
+    """タイルの点をセル番号の順に並べ替え（セル内は元の順序のまま）、セルの開始位置の表を書く"""
+    n = index['cells_per_tile']
+    columns = {column: np.fromfile(_tile_path(root, tile['key'], column), dtype=dtype)
+               for column, dtype in COLUMNS.items()}
+    cx, cy = _local_cells(index, tile, columns['x'], columns['y'])
+    keys = cy * n + cx
+    order = np.argsort(keys, kind='stable')
+    for column, dtype in COLUMNS.items():
+        columns[column][order].astype(dtype, copy=False).tofile(_tile_path(root, tile['key'], column))
+    starts = np.searchsorted(keys[order], np.arange(n * n + 1)).astype(CELLS_DTYPE)
+    starts.tofile(_tile_path(root, tile['key'], CELLS_COLUMN))
+
+
+def _tile_ranges(index, tile, bounds):
+    """タイル内で bounds と重なるセルの点の範囲 [start, stop) のリスト（セルの行ごとに 1 つ）"""
+    if bounds is None or (bounds[0] <= tile['bounds'][0] and bounds[1] <= tile['bounds'][1]
+                          and bounds[2] >= tile['bounds'][2] and bounds[3] >= tile['bounds'][3]):
+        return [(0, tile['count'])]
+    n = index['cells_per_tile']
+    (cx0, cx1), (cy0, cy1) = _local_cells(index, tile, np.array(bounds[0::2]), np.array(bounds[1::2]))
+    starts = np.fromfile(_tile_path(index['root'], tile['key'], CELLS_COLUMN), dtype=CELLS_DTYPE)
+    ranges = []
+    for cy in range(cy0, cy1 + 1):
+        start, stop = int(starts[cy * n + cx0]), int(starts[cy * n + cx1 + 1])
+        if start == stop:
+            continue
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _read_tiles(path, target_crs=None, bounds=None, zcol_arg=None):
+    """
+    索引のタイルのうち bounds（target_crs の座標）と重なるものを 1 つずつ読み、
+    範囲内の点について列名 -> 配列の辞書を返すジェネレータ（x, y は target_crs に変換する）
+    """
+    index = load_point_index(path)
+    if zcol_arg and zcol_arg != index['zcol']:
+        raise ValueError(
+            f"点群の索引 '{path}' の標高値列は '{index['zcol']}' です（指定: '{zcol_arg}'）"
+        )
+    transformer = _transformer(index, target_crs)
+    if transformer is not None and bounds is not None:
+        # 範囲を索引の座標系に変換して選ぶ（変換後の外接矩形なので少し広めになる）
+        bounds = transformer.transform_bounds(*bounds, direction='INVERSE')
+    for tile in select_tiles(index, bounds):
+        ranges = _tile_ranges(index, tile, bounds)
+        if not ranges:
+            continue
+        columns = {}
+        for column, dtype in COLUMNS.items():
+            data = np.memmap(_tile_path(index['root'], tile['key'], column), dtype=dtype, mode='r')
+            columns[column] = np.concatenate([data[start:stop] for start, stop in ranges])
+            del data
+        if bounds is not None:
+            # セル単位で読んだ点から、範囲外の点を除く
+            inside = ((columns['x'] >= bounds[0]) & (columns['x'] <= bounds[2])
+                      & (columns['y'] >= bounds[1]) & (columns['y'] <= bounds[3]))
+            if not inside.all():
+                columns = {column: values[inside] for column, values in columns.items()}
+        if transformer is not None:
+            x, y = transformer.transform(columns['x'], columns['y'])
+            columns['x'], columns['y'] = np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64')
+        yield columns
+
+
+def iter_tiles(path, target_crs=None, bounds=None, zcol_arg=None):
+    """
+    索引のタイルのうち bounds（target_crs の座標）と重なるものを 1 つずつ読み、
+    範囲内の点の (x, y, z) の float64 配列を返すジェネレータ（点の順序はタイル・セルの順、セル内は元のファイル順）
+    """
+    for columns in _read_tiles(path, target_crs, bounds, zcol_arg):
+        yield columns['x'], columns['y'], columns['z']
+
+
+def read_point_tiles(path, target_crs=None, bounds=None, zcol_arg=None):
+    """
+    索引から bounds（target_crs の座標, 境界を含む）の範囲内の点を読み、x, y, elevation 列の DataFrame を返す
+    点は元のファイルでの順序（seq）に並べ直す（集計の丸め誤差まで元のファイルと同じにするため）
+    """
+    import pandas as pd
+
+    parts = list(_read_tiles(path, target_crs, bounds, zcol_arg))
+    if not parts:
+        return pd.DataFrame({'x': np.empty(0), 'y': np.empty(0), 'elevation': np.empty(0)})
+    order = np.argsort(np.concatenate([p['seq'] for p in parts]), kind='stable')
+    return pd.DataFrame({
+        'x': np.concatenate([p['x'] for p in parts])[order],
+        'y': np.concatenate([p['y'] for p in parts])[order],
+        'elevation': np.concatenate([p['z'] for p in parts])[order],
+    })
+
+
+def _resolve_zcol(paths, zcol):
+    """最初の点群ファイルで使われる標高値列の名前（add_elevation と同じ規則）"""
+    import pandas as pd
+
+    from src.make_shp.add_elevation import _resolve_z_column, get_xy_columns
+
+    path = paths[0]
+    if path.lower().endswith('.shp'):
+        return 'elevation'
+    sample = pd.read_csv(path, nrows=100)
+    x_col, y_col = get_xy_columns(sample)
+    return _resolve_z_column(sample, path, x_col, y_col, zcol)
+
+
+def _source_crs(paths, crs):
+    """振り分ける座標系（指定が無ければ最初の SHP の座標系。CSV だけなら None）"""
+    if crs is not None:
+        return crs
+    from src.common.metadata import probe_layer_summary
+
+    for path in paths:
+        if path.lower().endswith('.shp'):
+            return probe_layer_summary(path)['crs']
+    return None
+
+
+def partition_points(paths, out_dir, tile_size=DEFAULT_TILE_EXTENT, zcol=None, crs=None,
+                     chunk_rows=None, cancel=None, progress=None, cells_per_tile=DEFAULT_CELLS_PER_TILE):
+    """
+    点群ファイル（CSV または SHP、1 つまたはリスト）を読みながらタイルごとの列ファイルへ振り分け、
+    out_dir に索引 (points_index.json) と tiles フォルダを書き出す
+
+    Args:
+        paths: 点群ファイル（add_elevation と同じ形式）
+        out_dir: 出力フォルダ（既存の索引とタイルは置き換える）
+        tile_size: タイルの 1 辺の長さ（座標の単位）
+        zcol: 標高値列（add_elevation の --zcol と同じ）
+        crs: 座標系。SHP はこの座標系に変換する（省略時は最初の SHP の座標系。CSV の座標は変換しない）
+        chunk_rows: CSV を 1 回に読み込む行数（省略時は add_elevation.POINT_CHUNK_ROWS）
+        cancel, progress: CancelToken と進捗コールバック
+        cells_per_tile: 範囲検索のためにタイルを分けるセルの 1 辺の数
+
+    Returns:
+        dict: 書き出した索引
+    """
+    from src.make_shp.add_elevation import POINT_CHUNK_ROWS, iter_point_chunks
+
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if tile_size <= 0:
+        raise ValueError("tile_size は正の値を指定してください")
+    if cells_per_tile < 1:
+        raise ValueError("cells_per_tile は 1 以上を指定してください")
+    crs = _source_crs(paths, crs)
+    reporter = ProgressReporter(progress, steps=2)
+
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_root = os.path.join(out_dir, f".tmp-{uuid.uuid4().hex[:8]}")
+    os.makedirs(os.path.join(tmp_root, TILES_DIR))
+    stats = {}
+    offset = 0
+    dropped = 0
+    try:
+        reporter.begin("点群の振り分け")
+        for x, y, z in iter_point_chunks(paths, crs, zcol, chunk_rows or POINT_CHUNK_ROWS):
+            check_cancel(cancel)
+            seq = np.arange(offset, offset + len(x), dtype='int64')
+            offset += len(x)
+            # 座標が欠損した点はどのセルにも入らないため保存しない
+            valid = np.isfinite(x) & np.isfinite(y)
+            dropped += int(len(x) - valid.sum())
+            x, y, z, seq = x[valid], y[valid], z[valid], seq[valid]
+            tx = np.floor(x / tile_size).astype('int64')
+            ty = np.floor(y / tile_size).astype('int64')
+            # 安定ソートでタイル内の点の順序（ファイル順）を保つ
+            order = np.lexsort((ty, tx))
+            x, y, z, seq, tx, ty = x[order], y[order], z[order], seq[order], tx[order], ty[order]
+            starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])])
+            stops = np.r_[starts[1:], len(x)]
+            for start, stop in zip(starts, stops):
+                key = f"{tx[start]}_{ty[start]}"
+                part = {'x': x[start:stop], 'y': y[start:stop], 'z': z[start:stop],
+                        'seq': seq[start:stop]}
+                for column, dtype in COLUMNS.items():
+                    with open(_tile_path(tmp_root, key, column), 'ab') as f:
+                        part[column].astype(dtype, copy=False).tofile(f)
+                bounds = [float(part['x'].min()), float(part['y'].min()),
+                          float(part['x'].max()), float(part['y'].max())]
+                entry = stats.get(key)
+                if entry is None:
+                    stats[key] = {'key': key, 'tile': [int(tx[start]), int(ty[start])],
+                                  'count': stop - start, 'bounds': bounds}
+                else:
+                    entry['count'] += stop - start
+                    entry['bounds'] = [min(entry['bounds'][0], bounds[0]), min(entry['bounds'][1], bounds[1]),
+                                       max(entry['bounds'][2], bounds[2]), max(entry['bounds'][3], bounds[3])]
+            reporter.advance(len(valid))
+        reporter.end()
+        check_cancel(cancel)
+
+        tiles = sorted(stats.values(), key=lambda t: (t['tile'][0], t['tile'][1]))
+        for tile in tiles:
+            tile['count'] = int(tile['count'])
+        index = {
+            'format': INDEX_FORMAT,
+            'crs': None if crs is None else str(crs),
+            'zcol': _resolve_zcol(paths, zcol),
+            'tile_size': float(tile_size),
+            'cells_per_tile': int(cells_per_tile),
+            'columns': COLUMNS,
+            'sources': [os.path.abspath(p) for p in paths],
+            'count': int(sum(t['count'] for t in tiles)),
+            'dropped': dropped,
+            'bounds': ([min(t['bounds'][0] for t in tiles), min(t['bounds'][1] for t in tiles),
+                        max(t['bounds'][2] for t in tiles), max(t['bounds'][3] for t in tiles)]
+                       if tiles else None),
+            'tiles': tiles,
+        }
+
+        reporter.begin("セル順の並べ替え", total=len(tiles))
+        for tile in tiles:
+            check_cancel(cancel)
+            _sort_tile(tmp_root, index, tile)
+            reporter.advance()
+        reporter.end()
+
+        # 既存の索引を先に消し、タイルを置き換えてから索引を書く（途中で失敗しても古い索引が残らない）
+        index_path = os.path.join(out_dir, POINT_INDEX_NAME)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        shutil.rmtree(os.path.join(out_dir, TILES_DIR), ignore_errors=True)
+        os.replace(os.path.join(tmp_root, TILES_DIR), os.path.join(out_dir, TILES_DIR))
+        tmp_index = os.path.join(tmp_root, POINT_INDEX_NAME)
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+            f.write('\n')
+        os.replace(tmp_index, index_path)
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    return index
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="点群を空間タイルごとのバイナリ列ファイルに振り分ける")
+    ap.add_argument("points", nargs='+', help="点群ファイル (CSV/SHP, 複数可)")
+    ap.add_argument("--outdir", required=True, help="索引とタイルの出力フォルダ")
+    ap.add_argument("--tile-size", type=float, default=DEFAULT_TILE_EXTENT,
+                    help=f"タイルの 1 辺の長さ（座標の単位, 既定: {DEFAULT_TILE_EXTENT:g}）")
+    ap.add_argument("--zcol", default=None, help="標高値列（CSV で候補が複数ある場合は必須）")
+    ap.add_argument("--crs", default=None,
+                    help="座標系（例: EPSG:6677）。SHP はこの座標系に変換する。省略時は最初の SHP の座標系")
+    ap.add_argument("--cells-per-tile", type=int, default=DEFAULT_CELLS_PER_TILE,
+                    help=f"範囲検索のためにタイルを分けるセルの 1 辺の数（既定: {DEFAULT_CELLS_PER_TILE}）")
+    ap.add_argument("--chunk-rows", type=int, default=None, help="CSV を 1 回に読み込む行数")
+    args = ap.parse_args(argv)
+    if args.tile_size <= 0:
+        ap.error("--tile-size は正の値を指定してください")
+    if args.cells_per_tile < 1:
+        ap.error("--cells-per-tile は 1 以上を指定してください")
+
+    index = partition_points(args.points, args.outdir, args.tile_size, args.zcol, args.crs,
+                             args.chunk_rows, progress=ConsoleProgress(),
+                             cells_per_tile=args.cells_per_tile)
+    print(f"点群 {index['count']:,} 点を {len(index['tiles']):,} タイルに振り分けました"
+          + (f"（座標が欠損した {index['dropped']:,} 点を除く）" if index['dropped'] else ''))
+    print(f"索引 -> {os.path.join(args.outdir, POINT_INDEX_NAME)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
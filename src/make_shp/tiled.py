@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+tiled.py
+メモリに載らない大きさの計算領域を、セル境界に揃えたタイルに分けて処理する pipeline
+
+計算領域のメッシュを tile_size x tile_size セルのタイルに分け、タイルごとに
+メッシュ生成（流域界との判定）と点群の集計をプロセスプールで実行し、
+最後に 1 つの流域メッシュ・計算領域メッシュへ結合して出力する。
+メッシュ全体・点群全体を同時にメモリに載せないため、国土規模の計算領域でも実行できる。
+
+出力は pipeline（タイルに分けない実行）と同じになるよう、以下をそろえている:
+    - セルの座標は計算領域全体の linspace から取る（generate_mesh.build_grid と同じ値）
+    - 点のセル判定は流域メッシュ全体の格子で行う（detect_regular_grid と同じ原点・セルサイズ）
+    - 各セルの点はファイル順のまま集計する（合計の丸め誤差まで同じになる。
+      point_tiles の索引を指定した場合はタイル順に集計するため、丸め誤差の範囲で一致する）
+    - 出力のフィーチャ順は X 方向が外側、Y 方向が内側
+
+ascii_path を指定すると、シェープファイルの代わりに計算領域の標高を ESRI ASCII Grid (.asc, .prj) として
+タイルの集計結果から直接書き出す（ポリゴンの作成・シェープファイルの入出力・ラスタ化を行わない）。
+出力は domain_mesh_elev.shp を shp_to_ascii で変換した場合と同じになる。
+
+タイルの集計は add_elevation と同じ CellStatistics で行い、statistics を指定すると
+最小・最大・標準偏差・中央値の列も出力する。流域セルごとの集計値ファイル（{流域メッシュ名}_elev_stats.npz）は
+保存しないため、タイル実行の出力に add_elevation の --append で追記することはできない
+（出力フォルダに前回の集計値ファイルがあれば、出力と合わなくなるため削除する）。
+
+計算領域のフィーチャが 1 つの場合だけ対応する（標準メッシュ抽出とは併用できない）。
+"""
+import os
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.common import layer_cache
+from src.common.cancel import check_cancel
+from src.common.fileio import atomic_output, file_fingerprint
+from src.common.grid import point_cells
+from src.common.layer_cache import read_layer
+from src.common.progress import ProgressReporter
+from src.make_shp.add_elevation import (DEFAULT_MEDIAN_RESOLUTION, STATISTIC_COLUMNS, CellStatistics,
+                                        iter_point_chunks, statistic_columns, stats_mean,
+                                        stats_sidecar_path)
+from src.shp_to_asc.core import grid_header, round_grid_values, write_ascii_blocks
+from src.shp_to_asc.gui import DEFAULT_NODATA
+
+# タイルの 1 辺の既定のセル数
+DEFAULT_TILE_SIZE = 1000
+
+# 結合出力で 1 回に書き出すセル数
+WRITE_BATCH_CELLS = 1_000_000
+
+# タイルごとの点群ファイルのレコード（セルの列・行番号と標高）
+POINT_RECORD = np.dtype([('ix', '<i8'), ('iy', '<i8'), ('z', '<f8')])
+
+# ワーカープロセスで流域界の結合ジオメトリを使い回すためのキャッシュ
+_basin_unions = {}
+
+
+def _basin_union(basin_shp, crs):
+    """流域界を crs に変換して結合したジオメトリを返す（generate_mesh と同じ方法）"""
+    import shapely
+
+    key = (os.path.abspath(basin_shp), file_fingerprint(basin_shp), str(crs))
+    union = _basin_unions.get(key)
+    if union is None:
+        _basin_unions.clear()
+        union = read_layer(basin_shp).to_crs(crs).unary_union
+        shapely.prepare(union)
+        _basin_unions[key] = union
+    return union
+
+
+def _tile_boxes(xs, ys):
+    """xs, ys の格子線で区切られるセルの矩形を、X 方向が外側・Y 方向が内側の順で返す"""
+    import shapely
+
+    ix, iy = np.meshgrid(np.arange(len(xs) - 1), np.arange(len(ys) - 1), indexing='ij')
+    ix = ix.ravel()
+    iy = iy.ravel()
+    return shapely.box(xs[ix], ys[iy], xs[ix + 1], ys[iy + 1])
+
+
+def _mask_tile(basin_shp, crs, xs, ys, mask_path):
+    """
+    タイルのセルのうち流域界と重なるものを判定して mask_path に保存する（ワーカープロセスで実行）
+
+    Returns:
+        tuple | None: 流域セルのタイル内の列・行番号の範囲 (列の最小, 列の最大, 行の最小, 行の最大)。
+        流域セルが無ければ None
+    """
+    import shapely
+
+    mask = shapely.intersects(_tile_boxes(xs, ys), _basin_union(basin_shp, crs))
+    mask = mask.reshape(len(xs) - 1, len(ys) - 1)
+    np.save(mask_path, mask)
+    if not mask.any():
+        return None
+    cols = np.flatnonzero(mask.any(axis=1))
+    rows = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(cols[-1]), int(rows[0]), int(rows[-1])
+
+
+def _aggregate_tile(mask_path, points_path, ix0, iy0, nodata, elevation_path, count_path,
+                    statistics=(), median_resolution=DEFAULT_MEDIAN_RESOLUTION, column_paths=None):
+    """
+    タイルの点を集計し、セルごとの標高（流域外は nodata）と点数を保存する（ワーカープロセスで実行）
+    集計は add_elevation と同じ CellStatistics で行い、statistics の統計量は
+    column_paths（STATISTIC_COLUMNS の列名 -> 保存先）へ標高と同じく保存する
+    """
+    mask = np.load(mask_path)
+    width, height = mask.shape
+    n_cells = width * height
+    engine = CellStatistics(n_cells, statistics, median_resolution=median_resolution)
+    if os.path.exists(points_path):
+        records = np.fromfile(points_path, dtype=POINT_RECORD)
+        local = (records['ix'] - ix0) * height + (records['iy'] - iy0)
+        # 流域外のセルの点はどのセルにも含めない
+        engine.add(np.where(mask.ravel()[local], local, -1), records['z'])
+    stats = engine.result()
+    basin = mask.ravel()
+
+    def save(path, values):
+        # 流域外と標高の無いセルは nodata
+        out = np.full(n_cells, nodata, dtype='float64')
+        out[basin] = np.where(np.isnan(values[basin]), nodata, values[basin])
+        np.save(path, out.reshape(width, height))
+
+    save(elevation_path, stats_mean(stats))
+    np.save(count_path, stats['count'].reshape(width, height))
+    for name, values in statistic_columns(stats, statistics, median_resolution).items():
+        save(column_paths[name], values)
+
+
+def _run_tasks(executor, func, tasks, cancel, reporter):
+    """tasks（キー -> 引数のタプル）を実行し、キー -> 戻り値の辞書を返す"""
+    results = {}
+    if executor is None:
+        for key, args in tasks.items():
+            check_cancel(cancel)
+            results[key] = func(*args)
+            reporter.advance()
+        return results
+    futures = {executor.submit(func, *args): key for key, args in tasks.items()}
+    try:
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            reporter.advance()
+            check_cancel(cancel)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+def _tile_count(n, tile_size):
+    """n セルを tile_size セルずつに分けたタイルの数"""
+    return -(-n // tile_size)
+
+
+def _span(tile, tile_size, n):
+    """タイル番号 tile が受け持つセル番号の範囲 [開始, 終了)"""
+    return tile * tile_size, min((tile + 1) * tile_size, n)
+
+
+def _run_tiles(basin_shp, points_path, zcol, nodata, crs, xs, ys, tile_size, jobs, tile_file,
+               cancel, reporter, statistics=(), median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """タイルごとのメッシュ生成・点群の振り分け・標高集計を実行する（結果は tile_file のパスに保存）"""
+    nx, ny = len(xs) - 1, len(ys) - 1
+    tiles_x, tiles_y = _tile_count(nx, tile_size), _tile_count(ny, tile_size)
+    print(f"{nx} x {ny} セルを {tiles_x} x {tiles_y} タイルに分けて処理します。")
+
+    executor = None
+    if jobs > 1 and tiles_x * tiles_y > 1:
+        executor = ProcessPoolExecutor(max_workers=min(jobs, tiles_x * tiles_y),
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=layer_cache.enable)
+    try:
+        # --- 1) タイルごとのメッシュ生成（流域界との判定） ---
+        reporter.begin("タイルのメッシュ生成", total=tiles_x * tiles_y)
+        tasks = {}
+        for tx in range(tiles_x):
+            x0, x1 = _span(tx, tile_size, nx)
+            for ty in range(tiles_y):
+                y0, y1 = _span(ty, tile_size, ny)
+                tasks[tx, ty] = (basin_shp, crs, xs[x0:x1 + 1], ys[y0:y1 + 1],
+                                 tile_file(tx, ty, 'mask.npy'))
+        extents = _run_tasks(executor, _mask_tile, tasks, cancel, reporter)
+
+        # --- 2) 点群をタイルごとのファイルへ振り分け ---
+        reporter.begin("点群の振り分け")
+        found = [(tx * tile_size + c0, tx * tile_size + c1, ty * tile_size + r0, ty * tile_size + r1)
+                 for (tx, ty), extent in extents.items() if extent is not None
+                 for c0, c1, r0, r1 in [extent]]
+        if found:
+            _partition_points(points_path, zcol, crs, xs, ys, found, tile_size, tiles_y, tile_file,
+                              cancel, reporter)
+        else:
+            print("流域界と重なるセルがありません。")
+
+        # --- 3) タイルごとの標高集計 ---
+        reporter.begin("タイルの標高集計", total=tiles_x * tiles_y)
+        tasks = {}
+        for tx in range(tiles_x):
+            for ty in range(tiles_y):
+                column_paths = {STATISTIC_COLUMNS[name]: tile_file(tx, ty, f'{STATISTIC_COLUMNS[name]}.npy')
+                                for name in statistics}
+                tasks[tx, ty] = (tile_file(tx, ty, 'mask.npy'), tile_file(tx, ty, 'points.bin'),
+                                 tx * tile_size, ty * tile_size, nodata,
+                                 tile_file(tx, ty, 'elevation.npy'), tile_file(tx, ty, 'count.npy'),
+                                 statistics, median_resolution, column_paths)
+        _run_tasks(executor, _aggregate_tile, tasks, cancel, reporter)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _partition_points(points_path, zcol, crs, xs, ys, found, tile_size, tiles_y, tile_file,
+                      cancel, reporter):
+    """
+    点群を読みながら、流域メッシュ全体の格子でセルを求めてタイルごとのファイルへ追記する
+    found は流域セルを含むタイルの (列の最小, 列の最大, 行の最小, 行の最大)（計算領域全体の番号）
+    """
+    cmin = min(e[0] for e in found)
+    cmax = max(e[1] for e in found)
+    rmin = min(e[2] for e in found)
+    rmax = max(e[3] for e in found)
+    # add_elevation が流域メッシュから detect_regular_grid で求める格子と同じ原点・セルサイズ
+    grid = {
+        'origin': (xs[cmin], ys[rmin]),
+        'dx': (xs[cmax + 1] - xs[cmin]) / (cmax - cmin + 1),
+        'dy': (ys[rmax + 1] - ys[rmin]) / (rmax - rmin + 1),
+        'ncols': cmax - cmin + 1,
+        'nrows': rmax - rmin + 1,
+    }
+    n_points = 0
+    bounds = (xs[cmin], ys[rmin], xs[cmax + 1], ys[rmax + 1])
+    for x, y, z in iter_point_chunks(points_path, crs, zcol, bounds=bounds):
+        check_cancel(cancel)
+        rows, cols = point_cells(grid, x, y)
+        inside = rows >= 0
+        records = np.empty(int(inside.sum()), dtype=POINT_RECORD)
+        records['ix'] = cols[inside] + cmin
+        records['iy'] = grid['nrows'] - 1 - rows[inside] + rmin
+        records['z'] = z[inside]
+        tile_ids = (records['ix'] // tile_size) * tiles_y + records['iy'] // tile_size
+        # 安定ソートでタイル内の点の順序（ファイル順）を保つ
+        order = np.argsort(tile_ids, kind='stable')
+        records, tile_ids = records[order], tile_ids[order]
+        ids, starts = np.unique(tile_ids, return_index=True)
+        for tile_id, start, stop in zip(ids, starts, list(starts[1:]) + [len(records)]):
+            tx, ty = divmod(int(tile_id), tiles_y)
+            with open(tile_file(tx, ty, 'points.bin'), 'ab') as f:
+                records[start:stop].tofile(f)
+        n_points += len(x)
+        reporter.advance(len(x))
+    print(f"点群 {n_points:,} 点を振り分けました。")
+
+
+def _stitch_tiles(out_dir, crs, xs, ys, tile_size, tile_file, cancel, reporter, columns=()):
+    """
+    タイルの集計結果を X 方向が外側・Y 方向が内側の順に並べ、
+    流域メッシュと計算領域メッシュのシェープファイルへ少しずつ書き出す
+    columns は標高・点数のあとに出力する統計量の列名（_aggregate_tile が保存したもの）
+
+    Returns:
+        tuple: (流域メッシュのパス, 計算領域メッシュのパス)
+    """
+    import geopandas as gpd
+
+    nx, ny = len(xs) - 1, len(ys) - 1
+    tiles_x, tiles_y = _tile_count(nx, tile_size), _tile_count(ny, tile_size)
+    reporter.begin("結合出力", total=nx)
+    basin_out = os.path.join(out_dir, "basin_mesh_elev.shp")
+    domain_out = os.path.join(out_dir, "domain_mesh_elev.shp")
+    batch = max(1, WRITE_BATCH_CELLS // ny)
+    with atomic_output(basin_out) as basin_tmp, atomic_output(domain_out) as domain_tmp:
+        basin_written = False
+        domain_chunk = None
+        for tx in range(tiles_x):
+            check_cancel(cancel)
+            x0, x1 = _span(tx, tile_size, nx)
+            names = ('mask.npy', 'elevation.npy', 'count.npy', *(f'{name}.npy' for name in columns))
+            column = [
+                tuple(np.load(tile_file(tx, ty, name), mmap_mode='r') for name in names)
+                for ty in range(tiles_y)
+            ]
+            for a in range(0, x1 - x0, batch):
+                b = min(a + batch, x1 - x0)
+                # タイルを Y 方向につなげ、X 方向が外側・Y 方向が内側の順に並べる
+                mask, *values = (
+                    np.concatenate([tile[k][a:b] for tile in column], axis=1).ravel()
+                    for k in range(len(names))
+                )
+                first = domain_chunk is None
+                domain_chunk = gpd.GeoDataFrame(
+                    dict(zip(('elevation', 'pnt_count', *columns), values)),
+                    geometry=_tile_boxes(xs[x0 + a:x0 + b + 1], ys), crs=crs,
+                )
+                domain_chunk.to_file(domain_tmp, mode='w' if first else 'a')
+                if mask.any():
+                    domain_chunk[mask].to_file(basin_tmp, mode='a' if basin_written else 'w')
+                    basin_written = True
+                reporter.advance(b - a)
+            del column
+        if not basin_written:
+            domain_chunk.iloc[:0].to_file(basin_tmp)
+    reporter.end()
+    return basin_out, domain_out
+
+
+def _stitch_ascii(output_path, crs, xs, ys, tile_size, tile_file, nodata, cancel, reporter):
+    """
+    タイルの集計結果（計算領域の標高）を北端の行から順に並べ、ESRI ASCII Grid へ少しずつ書き出す
+    ヘッダと値の丸めは shp_to_ascii（src.shp_to_asc.core）と同じ
+    """
+    nx, ny = len(xs) - 1, len(ys) - 1
+    tiles_x, tiles_y = _tile_count(nx, tile_size), _tile_count(ny, tile_size)
+    header = grid_header((xs[0], ys[0], xs[-1], ys[-1]), nx, ny, nodata)
+    batch = max(1, WRITE_BATCH_CELLS // nx)
+
+    def blocks():
+        for ty in reversed(range(tiles_y)):
+            y0, y1 = _span(ty, tile_size, ny)
+            row = [np.load(tile_file(tx, ty, 'elevation.npy'), mmap_mode='r') for tx in range(tiles_x)]
+            # タイルの配列は (列, 行) の順で行は南から北。北の行から batch 行ずつ (行, 列) にして返す
+            for b in range(y1 - y0, 0, -batch):
+                a = max(0, b - batch)
+                block = np.concatenate([tile[:, a:b] for tile in row], axis=0).T[::-1]
+                yield round_grid_values(block.astype('float32'), nodata)
+            del row
+
+    from pyproj import CRS
+
+    write_ascii_blocks(output_path, blocks(), header, None if crs is None else CRS.from_user_input(crs),
+                       cancel, reporter.nested())
+    return output_path
+
+
+def pipeline_tiled(domain_shp,
+                   basin_shp,
+                   num_cells_x,
+                   num_cells_y,
+                   points_path,
+                   out_dir,
+                   zcol=None,
+                   nodata=None,
+                   tile_size=DEFAULT_TILE_SIZE,
+                   jobs=None,
+                   work_dir=None,
+                   cancel=None,
+                   progress=None,
+                   ascii_path=None,
+                   statistics=(),
+                   median_resolution=DEFAULT_MEDIAN_RESOLUTION):
+    """
+    メッシュ生成と標高付与をタイルに分けて実行し、
+    out_dir/basin_mesh_elev.shp と out_dir/domain_mesh_elev.shp を出力する（pipeline と同じ出力）
+
+    Args:
+        tile_size: タイルの 1 辺のセル数
+        jobs: 同時に実行するプロセス数（省略時は CPU 数。1 ならこのプロセス内で順に実行する）
+        work_dir: タイルの中間ファイルを置くフォルダ（省略時は out_dir 内に一時フォルダを作る）
+        cancel, progress: pipeline と同じ
+        ascii_path: 指定するとシェープファイルの代わりに、計算領域の標高をこの ESRI ASCII Grid (.asc) に出力する
+        statistics, median_resolution: add_elevation.main と同じ（平均と同じ集計で求めて出力する統計量）
+
+    Raises:
+        ValueError: 計算領域のフィーチャが 1 つでない場合、未対応の統計量を指定した場合、
+            ascii_path と statistics を同時に指定した場合
+    """
+    if nodata is None:
+        nodata = DEFAULT_NODATA
+    if tile_size < 1:
+        raise ValueError("タイルのセル数は 1 以上を指定してください")
+    unknown = sorted(set(statistics) - set(STATISTIC_COLUMNS))
+    if unknown:
+        raise ValueError(f"未対応の統計量です: {unknown}（{', '.join(STATISTIC_COLUMNS)} から指定）")
+    if ascii_path and statistics:
+        raise ValueError("ASCII Grid には標高だけを出力するため、統計量は指定できません")
+    statistics = tuple(dict.fromkeys(statistics))
+    jobs = jobs or os.cpu_count() or 1
+    reporter = ProgressReporter(progress, steps=4)
+
+    domain = read_layer(domain_shp)
+    if len(domain) != 1:
+        raise ValueError(
+            f"タイル実行は計算領域のフィーチャが 1 つの場合だけ対応しています（{len(domain)} フィーチャ）"
+        )
+    crs = domain.crs
+    minx, miny, maxx, maxy = domain.geometry.iloc[0].bounds
+    # generate_mesh.build_grid と同じ格子線
+    xs = np.linspace(minx, maxx, num_cells_x + 1)
+    ys = np.linspace(miny, maxy, num_cells_y + 1)
+
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tiles-', dir=work_dir or out_dir)
+
+    def tile_file(tx, ty, name):
+        return os.path.join(tmp_dir, f"{tx}_{ty}_{name}")
+
+    try:
+        _run_tiles(basin_shp, points_path, zcol, nodata, crs, xs, ys, tile_size, jobs, tile_file,
+                   cancel, reporter, statistics, median_resolution)
+        if ascii_path:
+            reporter.begin("ASCII Grid 出力")
+            _stitch_ascii(ascii_path, crs, xs, ys, tile_size, tile_file, nodata, cancel, reporter)
+            reporter.end()
+        else:
+            basin_out, domain_out = _stitch_tiles(out_dir, crs, xs, ys, tile_size, tile_file,
+                                                  cancel, reporter,
+                                                  [STATISTIC_COLUMNS[name] for name in statistics])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if not ascii_path:
+        # 前回の通常実行（流域メッシュ basin_mesh.shp）の集計値は新しい出力と合わず、
+        # --append で使われると誤った値になる
+        sidecar = stats_sidecar_path(out_dir, "basin_mesh.shp")
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+            print(f"[INFO] タイル実行は集計値ファイルを保存しないため、前回の {sidecar} を削除しました"
+                  "（この出力には --append で追記できません）")
+    if ascii_path:
+        print(f"ASCII grid  -> {ascii_path}")
+        return
+    print(f"basin mesh  -> {basin_out}")
+    print(f"domain mesh -> {domain_out}")
@@ -2,8 +2,18 @@ import logging
 import os
 import argparse
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
 from pyproj import Geod
 
+from src.common.accumulator import BLOCK_CELLS, PairSums, accumulator_arrays, add_at
+from src.common.cancel import check_cancel
+from src.common.fileio import atomic_output
+from src.common.grid import cell_lookup, detect_layer_grid
+from src.common.layer_cache import read_layer
+from src.common.progress import ConsoleProgress, ProgressReporter
+
 # ログ設定 - 本番環境ではWARNINGレベルに設定
 logging.basicConfig(
     level=logging.WARNING,  # デフォルトはWARNINGレベルに設定
@@ -13,6 +23,266 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _candidate_pairs(land_bounds, grid, lookup, chunk_pairs, cancel, reporter):
+    """
+    属性ポリゴンのバウンディングボックスが掛かるセルとの組を、chunk_pairs 組程度ずつ返すジェネレータ
+
+    Yields:
+        tuple: (セルのフィーチャ位置, 属性ポリゴンの位置) の配列（フィーチャの無いセルは除く）
+    """
+    x0, y0 = grid['origin']
+    dx, dy = grid['dx'], grid['dy']
+    ncols, nrows = grid['ncols'], grid['nrows']
+
+    # 各属性ポリゴンが掛かる列・行（下端が 0）の範囲。境界の丸め誤差分だけ広めに取る
+    lb = land_bounds
+    eps = 1e-9
+    with np.errstate(invalid='ignore'):
+        c0 = np.clip(np.floor((lb[:, 0] - x0) / dx - eps), 0, None)
+        c1 = np.clip(np.ceil((lb[:, 2] - x0) / dx + eps) - 1, None, ncols - 1)
+        r0 = np.clip(np.floor((lb[:, 1] - y0) / dy - eps), 0, None)
+        r1 = np.clip(np.ceil((lb[:, 3] - y0) / dy + eps) - 1, None, nrows - 1)
+    valid = np.isfinite(lb).all(axis=1) & (c0 <= c1) & (r0 <= r1)
+    widths = np.where(valid, c1 - c0 + 1, 0).astype(np.int64)
+    heights = np.where(valid, r1 - r0 + 1, 0).astype(np.int64)
+    c0 = np.where(valid, c0, 0).astype(np.int64)
+    r0 = np.where(valid, r0, 0).astype(np.int64)
+    pair_counts = widths * heights
+    pair_ends = np.cumsum(pair_counts)
+
+    start = 0
+    while start < len(lb):
+        check_cancel(cancel)
+        # 組数が chunk_pairs を超えない範囲でポリゴンをまとめる（最低 1 ポリゴン）
+        offset = pair_ends[start - 1] if start else 0
+        stop = max(start + 1, int(np.searchsorted(pair_ends, offset + chunk_pairs, side='right')))
+        land_idx = np.repeat(np.arange(start, stop), pair_counts[start:stop])
+        k = np.arange(len(land_idx)) - np.repeat(pair_ends[start:stop] - pair_counts[start:stop] - offset,
+                                                 pair_counts[start:stop])
+        cols = c0[land_idx] + k % widths[land_idx]
+        rows = nrows - 1 - (r0[land_idx] + k // widths[land_idx])
+        base_pos = lookup[rows * ncols + cols]
+        hit = base_pos >= 0
+        yield base_pos[hit], land_idx[hit]
+        reporter.advance(stop - start)
+        start = stop
+
+
+def overlay_on_grid(base_gdf, land_gdf, grid, source_field, chunk_pairs=200_000, cancel=None,
+                    progress=None):
+    """
+    規則格子の基準メッシュと属性ポリゴンの交差部分を求める（gpd.overlay の代替）
+    属性ポリゴンのバウンディングボックスが掛かるセルだけを候補にし、まとめて交差計算する
+
+    Args:
+        base_gdf: 基準メッシュ（mesh_id 列を持つ規則格子）
+        land_gdf: 属性ポリゴン（source_field 列と geometry）
+        grid: detect_regular_grid(base_gdf) の戻り値
+        source_field: 属性フィールド名
+        chunk_pairs: 一度に交差計算する (セル, ポリゴン) の組数
+        cancel: CancelToken（チャンクごとに確認する）
+        progress: 進捗コールバック（属性ポリゴン数を単位に通知する）
+
+    Returns:
+        geopandas.GeoDataFrame: mesh_id, source_field, geometry（面積を持つ交差部分のみ）
+    """
+    base_geoms = base_gdf.geometry.values
+    mesh_ids = base_gdf['mesh_id'].to_numpy()
+    land_geoms = land_gdf.geometry.values
+    land_values = land_gdf[source_field].to_numpy()
+
+    reporter = ProgressReporter(progress)
+    reporter.begin("交差計算", total=len(land_geoms))
+    ids, values, pieces = [], [], []
+    for base_pos, land_idx in _candidate_pairs(land_gdf.geometry.bounds.to_numpy(), grid,
+                                               cell_lookup(grid), chunk_pairs, cancel, reporter):
+        inter = shapely.intersection(base_geoms[base_pos], land_geoms[land_idx])
+        # 接するだけ（線・点）の交差は overlay(keep_geom_type) と同様に除外
+        has_area = shapely.area(inter) > 0
+        ids.append(mesh_ids[base_pos[has_area]])
+        values.append(land_values[land_idx[has_area]])
+        pieces.append(inter[has_area])
+    reporter.end()
+
+    return gpd.GeoDataFrame(
+        {
+            'mesh_id': np.concatenate(ids) if ids else np.array([], dtype=mesh_ids.dtype),
+            source_field: np.concatenate(values) if values else np.array([], dtype=land_values.dtype),
+        },
+        geometry=np.concatenate(pieces) if pieces else np.array([], dtype=object),
+        crs=base_gdf.crs,
+    )
+
+
+def dominant_on_grid(cell_geoms, base_area, land_gdf, grid, source_field, threshold=0.5,
+                     nodata=-9999, accumulator_dir=None, chunk_pairs=200_000, cancel=None,
+                     progress=None):
+    """
+    規則格子の基準メッシュについて、セルごと・属性値ごとの交差面積を集計し、
+    代表値と被覆率を求める（overlay_on_grid と groupby による集計の代替）
+
+    交差部分の GeoDataFrame を作らず、チャンクごとに面積だけを足し込む。属性値ごとの面積は
+    交差のある (セル, 属性値) の組だけを PairSums で集計するため、メモリは属性値の種類数ではなく
+    交差の数に比例する。accumulator_dir を指定するとセル数の大きさの配列（セル番号の引き当て表と
+    被覆面積）をそのフォルダのメモリマップに置く（src.common.accumulator）。
+    判定は assign_dominant_values と同じ（面積の合計は丸め誤差の範囲で一致）。
+
+    Args:
+        cell_geoms: フィーチャ位置の配列を受け取り、そのセルのポリゴンの配列を返す関数
+        base_area: セルの面積（フィーチャ順）
+        land_gdf: 属性ポリゴン（source_field 列と geometry）
+        grid: 基準メッシュの detect_regular_grid の戻り値
+
+    Returns:
+        dict: 以下のキーを持つ辞書
+            - 'cov_area', 'cov_ratio': フィーチャ順の被覆面積と被覆率（交差の無いセルは 0）
+            - 'dominant': フィーチャ順の代表値（閾値未満・交差の無いセルは nodata）
+            - 'pieces': 面積を持つ交差部分の数
+            - 'classes': 交差した属性値の種類数
+    """
+    n = len(grid['rows'])
+    codes, classes = pd.factorize(land_gdf[source_field], sort=True)
+    land_geoms = land_gdf.geometry.values
+    geod = Geod(ellps="WGS84")
+    class_areas = PairSums()
+    pieces = 0
+
+    reporter = ProgressReporter(progress)
+    reporter.begin("交差計算", total=len(land_geoms))
+    specs = {
+        'lookup': (grid['nrows'] * grid['ncols'], 'int64'),
+        'cover': (n, 'float64'),
+    }
+    with accumulator_arrays(specs, accumulator_dir) as acc:
+        lookup = cell_lookup(grid, out=acc['lookup'])
+        for base_pos, land_idx in _candidate_pairs(land_gdf.geometry.bounds.to_numpy(), grid,
+                                                   lookup, chunk_pairs, cancel, reporter):
+            inter = shapely.intersection(cell_geoms(base_pos), land_geoms[land_idx])
+            # 接するだけ（線・点）の交差は overlay(keep_geom_type) と同様に除外
+            has_area = shapely.area(inter) > 0
+            base_pos, land_idx = base_pos[has_area], land_idx[has_area]
+            area = np.array([abs(geod.geometry_area_perimeter(geom)[0]) for geom in inter[has_area]],
+                            dtype='float64')
+            add_at(acc['cover'], base_pos, area)
+            # 属性値が欠損の交差部分は被覆面積には含めるが代表値の候補にはしない（groupby と同じ）
+            code = codes[land_idx]
+            known = code >= 0
+            class_areas.add(base_pos[known], code[known], area[known])
+            pieces += len(base_pos)
+        reporter.end()
+
+        cov_area = np.array(acc['cover'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov_ratio = np.nan_to_num(np.round(cov_area / base_area, 4), nan=0.0)
+    values = classes.to_numpy()
+    numeric = values.dtype.kind in 'iufb'
+    dominant = np.full(n, nodata, dtype='float64' if numeric else object)
+    # 面積が最大の属性値（同じ面積なら属性値の小さい方）
+    best = class_areas.argmax(n)
+    selected = (best >= 0) & (cov_ratio >= threshold)
+    dominant[selected] = values[best[selected]]
+    return {
+        'cov_area': cov_area,
+        'cov_ratio': cov_ratio,
+        'dominant': dominant,
+        'pieces': pieces,
+        'classes': len(np.unique(class_areas.arrays()[1])),
+    }
+
+
+def _coverage(inter, base_gdf):
+    """セルごとの被覆面積 cov_area と被覆率 cov_ratio（交差のあるセルだけ）"""
+    coverage = (
+        inter.groupby('mesh_id')['int_area']
+             .sum()
+             .reset_index(name='cov_area')
+    )
+    coverage = coverage.merge(
+        base_gdf[['mesh_id', 'base_area']],
+        on='mesh_id', how='left'
+    )
+    coverage['cov_ratio'] = (coverage['cov_area'] / coverage['base_area']).round(4)
+    return coverage
+
+
+def _dominant_per_cell(inter, base_gdf, coverage, source_field, threshold, nodata):
+    """
+    セルごとに面積割合が最大の属性値を求め、被覆率が閾値未満なら nodata にする
+
+    Returns:
+        tuple: (mesh_id・dominant_v 列を持つ DataFrame, 属性値の種類数)
+    """
+    grp = (
+        inter.groupby(['mesh_id', source_field])['int_area']
+             .sum()
+             .reset_index(name='tot_area')
+    )
+    grp = grp.merge(base_gdf[['mesh_id', 'base_area']], on='mesh_id', how='left')
+    grp['area_ratio'] = grp['tot_area'] / grp['base_area']
+    unique_values = len(grp[source_field].unique())
+
+    # 最大ratio選択
+    grp_sorted = grp.sort_values(['mesh_id', 'area_ratio'], ascending=[True, False])
+    dominant = grp_sorted.groupby('mesh_id', as_index=False).first()
+
+    # coverage_ratio を dominant にマージして閾値判定
+    dominant = dominant.merge(
+        coverage[['mesh_id', 'cov_area', 'cov_ratio']],
+        on='mesh_id', how='left'
+    )
+    dominant['cov_ratio'] = dominant['cov_ratio'].fillna(0)
+    dominant['dominant_v'] = dominant.apply(
+        lambda row: row[source_field] if row['cov_ratio'] >= threshold else nodata,
+        axis=1
+    )
+    return dominant, unique_values
+
+
+def assign_dominant_grid(mesh, land_path, source_field='landuse', output_field='dominant',
+                         threshold=0.5, nodata=-9999, accumulator_dir=None, cancel=None,
+                         progress=None):
+    """
+    MeshGrid（src.common.mesh_grid）のセルに、面積割合が最大の属性値を配列で付与して返す
+    判定は assign_dominant_values と同じで、シェープファイルは出力しない。
+    セルのポリゴンは交差計算のチャンクごとに作り、面積は dominant_on_grid で集計する
+    （accumulator_dir を指定すると集計配列をディスク上に置く）。
+
+    Returns:
+        MeshGrid: output_field（代表値）と 'cov_ratio'（被覆率）を設定した mesh
+    """
+    reporter = ProgressReporter(progress, steps=3)
+    reporter.begin("ファイル読み込み")
+    land_gdf = read_layer(land_path, encoding='cp932')
+    if mesh.crs is not None and land_gdf.crs != mesh.crs:
+        raise ValueError(f"CRS不一致: base={mesh.crs}, land={land_gdf.crs}")
+    check_cancel(cancel)
+
+    rows, cols = mesh.cell_order()
+    reporter.begin("セル面積計算", total=len(rows))
+    geod = Geod(ellps="WGS84")
+    base_area = np.empty(len(rows), dtype='float64')
+    for start in range(0, len(rows), BLOCK_CELLS):
+        check_cancel(cancel)
+        boxes = mesh.cell_boxes(rows[start:start + BLOCK_CELLS], cols[start:start + BLOCK_CELLS])
+        base_area[start:start + len(boxes)] = [abs(geod.geometry_area_perimeter(geom)[0]) for geom in boxes]
+        reporter.advance(len(boxes))
+
+    reporter.begin("空間オーバーレイ")
+    result = dominant_on_grid(lambda pos: mesh.cell_boxes(rows[pos], cols[pos]), base_area,
+                              land_gdf[[source_field, 'geometry']],
+                              {**mesh.grid, 'rows': rows, 'cols': cols}, source_field, threshold,
+                              nodata, accumulator_dir, cancel=cancel, progress=reporter.nested())
+    reporter.end()
+
+    output = np.full(mesh.shape, nodata, dtype=result['dominant'].dtype)
+    output[rows, cols] = result['dominant']
+    ratio = np.zeros(mesh.shape)
+    ratio[rows, cols] = result['cov_ratio']
+    mesh[output_field] = output
+    mesh['cov_ratio'] = ratio
+    return mesh
+
+
 def assign_dominant_values(
     base_path: str,
     land_path: str,
@@ -20,23 +290,35 @@ def assign_dominant_values(
     output_field: str = 'dominant_value',
     threshold: float = 0.5,
     nodata=-9999,
-    output_path: str = None
+    output_path: str = None,
+    cancel=None,
+    progress=None,
+    accumulator_dir: str = None
 ) -> None:
     """
     基準メッシュと属性メッシュを読み込み、面積割合が最大の属性値を各セルに付与します。
     処理の進行状況を表示します。
+    cancel に CancelToken を渡すと各段階の区切りでキャンセルを確認し、
+    キャンセル時は JobCancelled を送出します（出力ファイルは作成しません）。
+    progress に進捗コールバックを渡すと、5 つの段階の進捗を通知します（src.common.progress）。
+    accumulator_dir を指定すると、基準メッシュが規則格子の場合に交差部分を保持せず、
+    セルごとの被覆面積をそのフォルダのメモリマップに、属性値ごとの面積を交差のある組だけに集計します
+    （dominant_on_grid）。
     """
     print("== メッシュ属性代表値付与処理を開始します ==")
     print(f"基準メッシュ: {base_path}")
     print(f"属性メッシュ: {land_path}")
     print(f"閾値: {threshold}, NoData値: {nodata}")
 
+    reporter = ProgressReporter(progress, steps=5)
+
     # ファイル読み込み
-    print("\n[1/5] ファイルを読み込んでいます...")
-    base_gdf = gpd.read_file(base_path, encoding='cp932')
-    land_gdf = gpd.read_file(land_path, encoding='cp932')
+    reporter.begin("ファイル読み込み")
+    base_gdf = read_layer(base_path, encoding='cp932')
+    land_gdf = read_layer(land_path, encoding='cp932')
     print(f"  基準メッシュ: {len(base_gdf)} メッシュ")
     print(f"  属性メッシュ: {len(land_gdf)} ポリゴン")
+    check_cancel(cancel)
     
     # ログ用の進捗表示
     logger.info(f"処理を開始: 基準メッシュ={base_path}")
@@ -57,37 +339,63 @@ def assign_dominant_values(
     geod = Geod(ellps="WGS84")
     base_gdf['base_area'] = base_gdf.geometry.apply(lambda geom: abs(geod.geometry_area_perimeter(geom)[0]))
 
+    check_cancel(cancel)
+
     # 空間オーバーレイ
-    print("\n[2/5] 空間オーバーレイを実行中...")
+    reporter.begin("空間オーバーレイ")
     land_subset = land_gdf[[source_field, 'geometry']]
-    inter = gpd.overlay(base_gdf, land_subset, how='intersection', keep_geom_type='Polygon')
-    print(f"  オーバーレイ結果: {len(inter)} の交差領域を検出")
+    base_grid = detect_layer_grid(base_gdf)
+    accumulated = None
+    if base_grid is not None and accumulator_dir is not None:
+        print(f"  基準メッシュは規則格子です ({base_grid['ncols']} x {base_grid['nrows']})。"
+              f"面積を {accumulator_dir} の集計配列に足し込みます")
+        base_geoms = base_gdf.geometry.values
+        accumulated = dominant_on_grid(lambda pos: base_geoms[pos], base_gdf['base_area'].to_numpy(),
+                                       land_subset, base_grid, source_field, threshold, nodata,
+                                       accumulator_dir, cancel=cancel, progress=reporter.nested())
+        n_pieces = accumulated['pieces']
+    elif base_grid is not None:
+        # 基準メッシュが規則格子なら、属性ポリゴンの範囲からセル番号で交差候補を求める
+        print(f"  基準メッシュは規則格子です ({base_grid['ncols']} x {base_grid['nrows']})")
+        inter = overlay_on_grid(base_gdf, land_subset, base_grid, source_field, cancel=cancel,
+                                progress=reporter.nested())
+        n_pieces = len(inter)
+    else:
+        inter = gpd.overlay(base_gdf, land_subset, how='intersection', keep_geom_type='Polygon')
+        n_pieces = len(inter)
+    print(f"  オーバーレイ結果: {n_pieces} の交差領域を検出")
+    check_cancel(cancel)
 
-    if inter.empty:
+    if n_pieces == 0:
         # 交差なし → nodata, coverage_ratio は 0
         print("\n[!] 警告: メッシュ間に交差が見つかりませんでした。すべての出力値がNODATAになります。")
         logger.warning("メッシュ間に交差がありません。すべての出力値がNODATAになります。")
         base_gdf['cov_area'] = 0
         base_gdf['cov_ratio'] = 0
         base_gdf[output_field] = nodata
+        reporter.skip(2)
+    elif accumulated is not None:
+        # 面積計算と属性値ごとの面積割合は dominant_on_grid で済んでいる
+        reporter.skip(2)
+        base_gdf['cov_area'] = accumulated['cov_area']
+        base_gdf['cov_ratio'] = accumulated['cov_ratio']
+        covered = accumulated['cov_area'] > 0
+        print(f"  平均被覆率: {base_gdf['cov_ratio'][covered].mean() * 100:.1f}% (閾値: {threshold*100}%)")
+        print(f"  検出された属性値の種類: {accumulated['classes']}種類")
+        base_gdf['dominant_v'] = accumulated['dominant']
     else:
-        print("\n[3/5] 面積計算を実行中...")
+        reporter.begin("面積計算", total=len(inter))
         
         # 1) 面積計算
-        inter['int_area'] = inter.geometry.apply(lambda g: abs(geod.geometry_area_perimeter(g)[0]))
+        def geodesic_area(geom):
+            reporter.advance()
+            return abs(geod.geometry_area_perimeter(geom)[0])
+        inter['int_area'] = inter.geometry.apply(geodesic_area)
+        check_cancel(cancel)
         
         # 2) セル全体の被覆面積 & 被覆率を算出
         print("  各メッシュの被覆率を計算中...")
-        coverage = (
-            inter.groupby('mesh_id')['int_area']
-                 .sum()
-                 .reset_index(name='cov_area')
-        )
-        coverage = coverage.merge(
-            base_gdf[['mesh_id', 'base_area']],
-            on='mesh_id', how='left'
-        )
-        coverage['cov_ratio'] = (coverage['cov_area'] / coverage['base_area']).round(4)
+        coverage = _coverage(inter, base_gdf)
         
         # 進捗表示
         cov_ratio_avg = coverage['cov_ratio'].mean() * 100
@@ -102,34 +410,12 @@ def assign_dominant_values(
         base_gdf['cov_ratio'] = base_gdf['cov_ratio'].round(4)
 
         # 4) landuse ごとの面積合計と割合を計算
-        print("\n[4/5] 属性値ごとの面積割合を計算中...")
-        grp = (
-            inter.groupby(['mesh_id', source_field])['int_area']
-                 .sum()
-                 .reset_index(name='tot_area')
-        )
-        grp = grp.merge(base_gdf[['mesh_id', 'base_area']], on='mesh_id', how='left')
-        grp['area_ratio'] = grp['tot_area'] / grp['base_area']
-        
-        # ユニークな属性値の数を表示
-        unique_values = len(grp[source_field].unique())
+        check_cancel(cancel)
+        reporter.begin("属性値ごとの面積割合")
+        dominant, unique_values = _dominant_per_cell(inter, base_gdf, coverage, source_field,
+                                                     threshold, nodata)
         print(f"  検出された属性値の種類: {unique_values}種類")
 
-        # 最大ratio選択
-        grp_sorted = grp.sort_values(['mesh_id', 'area_ratio'], ascending=[True, False])
-        dominant = grp_sorted.groupby('mesh_id', as_index=False).first()
-
-        # 6) coverage_ratio を dominant にマージして閾値判定
-        dominant = dominant.merge(
-            coverage[['mesh_id', 'cov_area', 'cov_ratio']],
-            on='mesh_id', how='left'
-        )
-        dominant['cov_ratio'] = dominant['cov_ratio'].fillna(0)
-        dominant['dominant_v'] = dominant.apply(
-            lambda row: row[source_field] if row['cov_ratio'] >= threshold else nodata,
-            axis=1
-        )
-
         # 結果をマージ
         base_gdf = base_gdf.merge(
             dominant[['mesh_id', 'dominant_v']],
@@ -138,6 +424,8 @@ def assign_dominant_values(
 
         # ここで欠損（mesh_id が dominant になかった行など）を nodata で埋める
         base_gdf['dominant_v'] = base_gdf['dominant_v'].fillna(nodata)
+
+    if n_pieces:
         # output_field        # 文字列化関数
         def to_str_no_dot0(v):
             try:
@@ -164,8 +452,11 @@ def assign_dominant_values(
     #     base_gdf = base_gdf.drop(columns=columns_to_drop)
     
     # Shapefile書出し
-    print("\n[5/5] 結果を出力中...")
-    base_gdf.to_file(output_path)
+    check_cancel(cancel)
+    reporter.begin("結果出力")
+    with atomic_output(output_path) as tmp_path:
+        base_gdf.to_file(tmp_path)
+    reporter.end()
     
     # 完了メッセージ
     print("\n== 処理が正常に完了しました ==")
@@ -195,6 +486,8 @@ if __name__ == '__main__':
     parser.add_argument('--threshold', type=float, default=0.5, help='面積割合の閾値')
     parser.add_argument('--nodata', default=-9999, help='nodata値')
     parser.add_argument('--output', default=None, help='出力Shapefileパス')
+    parser.add_argument('--accumulator-dir', default=None,
+                        help='セルごとの集計配列をメモリマップとして置くフォルダ（メモリに収まらない大規模メッシュ用）')
     args = parser.parse_args()
 
     assign_dominant_values(
@@ -204,7 +497,9 @@ if __name__ == '__main__':
         output_field=args.output_field,
         threshold=args.threshold,
         nodata=args.nodata,
-        output_path=args.output
+        output_path=args.output,
+        progress=ConsoleProgress(),
+        accumulator_dir=args.accumulator_dir
     )
 
 
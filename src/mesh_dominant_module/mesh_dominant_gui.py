@@ -4,12 +4,14 @@ GUI: tkinter を使用してメッシュ代表値付与処理を実行するイ
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import threading
 import queue
 import tkinter.font as tkFont
+import gc
 import os
 
-from src.mesh_dominant_module.mesh_dominant import assign_dominant_values
+from src.common.metadata import probe_layer_fields, run_probe
+from src.common.progress import format_event, overall_fraction
+from src.common.worker import submit
 
 
 class MeshDominantApp(ttk.Frame):
@@ -22,6 +24,9 @@ class MeshDominantApp(ttk.Frame):
         master.columnconfigure(0, weight=1)
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
+        # 処理の進捗と結果を受け取るキュー
+        self.result_queue = queue.Queue()
+        self.job = None
         # ウィジェットを作成
         self.create_widgets()
         
@@ -111,8 +116,18 @@ class MeshDominantApp(ttk.Frame):
         self.status_var = tk.StringVar()
         ttk.Label(left_frame, textvariable=self.status_var, anchor='w')\
             .grid(row=7, column=0, columnspan=2, sticky='we', padx=PADX, pady=10)
-        self.run_button = ttk.Button(left_frame, text="実行", command=self.run_process, width=BUTTON_WIDTH)
-        self.run_button.grid(row=7, column=2, sticky='e', padx=PADX, pady=10)
+        button_frame = ttk.Frame(left_frame)
+        button_frame.grid(row=7, column=2, sticky='e', padx=PADX, pady=10)
+        self.run_button = ttk.Button(button_frame, text="実行", command=self.run_process, width=BUTTON_WIDTH)
+        self.run_button.pack(side='left')
+        self.cancel_button = ttk.Button(button_frame, text="キャンセル", command=self.cancel_process,
+                                        width=BUTTON_WIDTH, state='disabled')
+        self.cancel_button.pack(side='left', padx=(5, 0))
+
+        # --- 進捗バー ---
+        self.progress_var = tk.DoubleVar(value=0.0)
+        ttk.Progressbar(left_frame, variable=self.progress_var, maximum=100)\
+            .grid(row=8, column=0, columnspan=3, sticky='we', padx=PADX, pady=(0, 10))
         
         # ヘルプパネル生成の直前にフォントを定義
         help_font = tkFont.Font(family='メイリオ', size=10)
@@ -194,19 +209,23 @@ class MeshDominantApp(ttk.Frame):
             self.output_field_var.set(f'{selected_field}')
 
     def update_fields(self, encoding='cp932'):
-        # 属性フィールド一覧を更新
+        # 属性フィールド一覧を更新（スキーマだけをワーカースレッドで読み込む）
         land_path = self.land_var.get()
-        try:
-            import geopandas as gpd
-            gdf = gpd.read_file(land_path, encoding=encoding)
-            fields = [c for c in gdf.columns if c not in gdf.geometry.name]
-            self.source_field_cb['values'] = fields
-            if fields:
-                self.source_field_cb.set(fields[0])
-                # 初期選択時に出力フィールド名も更新
-                self.output_field_var.set(f'{fields[0]}')
-        except Exception as e:
-            print(f"フィールド更新エラー: {e}")
+        run_probe(
+            self, probe_layer_fields, (land_path, encoding),
+            lambda fields: self._apply_fields(land_path, fields),
+            lambda e: print(f"フィールド更新エラー: {e}"),
+        )
+
+    def _apply_fields(self, land_path, fields):
+        # 取得中に別のファイルが選択された場合は古い結果を捨てる
+        if land_path != self.land_var.get():
+            return
+        self.source_field_cb['values'] = fields
+        if fields:
+            self.source_field_cb.set(fields[0])
+            # 初期選択時に出力フィールド名も更新
+            self.output_field_var.set(f'{fields[0]}')
 
     def run_process(self):
         # 入力チェック
@@ -220,22 +239,55 @@ class MeshDominantApp(ttk.Frame):
             'output_field': self.output_field_var.get(),
             'threshold': self.threshold_var.get(),
             'nodata': type(self.nodata_var.get())(self.nodata_var.get()),
-            'output_path': self.output_var.get() or None
+            'output_path': self.output_var.get() or None,
         }
+        self.output_field = params['output_field']
         self.run_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
         self.status_var.set('処理中...')
-        threading.Thread(target=self._worker, args=(params,), daemon=True).start()
+        self.progress_var.set(0.0)
+        # 処理はワーカープロセス（ランチャーから起動した場合）またはスレッドで実行する
+        self.job = submit(
+            'src.mesh_dominant_module.mesh_dominant:assign_dominant_values', params,
+            lambda kind, data: self.result_queue.put((kind, data)),
+        )
+        self.after(100, self.check_queue)
+
+    def cancel_process(self):
+        """実行中の処理にキャンセルを要求する（区切りのよいところで中断される）"""
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_button.config(state='disabled')
+            self.status_var.set('キャンセル中...')
 
-    def _worker(self, params):
+    def check_queue(self):
+        """処理の結果を確認し、終わっていれば画面に反映する"""
         try:
-            assign_dominant_values(**params)
+            result_type, message = self.result_queue.get_nowait()
+            # 進捗は溜まっている分をまとめて反映し、最新の状態だけを表示する
+            while result_type == 'progress':
+                self.progress_var.set(overall_fraction(message) * 100)
+                self.status_var.set(format_event(message))
+                result_type, message = self.result_queue.get_nowait()
+        except queue.Empty:
+            self.after(100, self.check_queue)
+            return
+
+        self.run_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        self.job = None
+        if result_type == 'success':
             self.status_var.set('完了')
-            messagebox.showinfo('完了', f'"{self.output_field_var.get()}" を付与しました。')
-        except Exception as e:
+            self.progress_var.set(100.0)
+            messagebox.showinfo('完了', f'"{self.output_field}" を付与しました。')
+        elif result_type == 'cancelled':
+            # 中断した処理の中間データを解放する
+            gc.collect()
+            self.status_var.set(message)
+            self.progress_var.set(0.0)
+        else:
             self.status_var.set('エラー')
-            messagebox.showerror('エラー', str(e))
-        finally:
-            self.run_button.config(state='normal')
+            messagebox.showerror('エラー', message)
 
 
 def main():
@@ -0,0 +1,81 @@
+"""
+client.py
+ジョブサービス（src.service.server）をスクリプトから使うための補助関数
+
+Usage:
+    from src.service.client import submit_job, wait_job
+
+    job = submit_job('shp_to_ascii', {
+        'shp_path': '/data/out/domain_mesh_elev.shp',
+        'field': 'elevation',
+        'output_path': '/data/asc/domain.asc',
+    })
+    job = wait_job(job['id'])
+    print(job['status'], job['outputs'])
+"""
+import json
+import time
+import urllib.error
+import urllib.request
+
+from src.service.server import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+# wait_job が 1 回の問い合わせで待つ秒数
+_WAIT_CHUNK_SECONDS = 30
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+
+class JobServiceError(Exception):
+    """ジョブサービスがエラーを返した場合の例外"""
+
+
+def _request(method, url, body=None, timeout=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('error', str(e))
+        except ValueError:
+            message = str(e)
+        raise JobServiceError(message) from None
+
+
+def submit_job(operation, params, url=DEFAULT_URL):
+    """ジョブを登録し、ジョブの辞書を返す"""
+    return _request('POST', f"{url}/jobs", {'operation': operation, 'params': params})
+
+
+def get_job(job_id, url=DEFAULT_URL):
+    """ジョブの状態を返す"""
+    return _request('GET', f"{url}/jobs/{job_id}")
+
+
+def cancel_job(job_id, url=DEFAULT_URL):
+    """実行待ちのジョブを取り消す"""
+    return _request('DELETE', f"{url}/jobs/{job_id}")
+
+
+def wait_job(job_id, timeout=None, url=DEFAULT_URL):
+    """
+    ジョブの終了を待ち、終了後のジョブの辞書を返す
+
+    Raises:
+        TimeoutError: timeout 秒を過ぎても終了しない場合
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait = _WAIT_CHUNK_SECONDS
+        if deadline is not None:
+            wait = min(wait, max(deadline - time.monotonic(), 0))
+        job = _request('GET', f"{url}/jobs/{job_id}?wait={wait}", timeout=wait + 10)
+        if job['status'] in FINISHED_STATUSES:
+            return job
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"ジョブ {job_id} が {timeout} 秒以内に終了しませんでした")
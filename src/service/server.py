@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+メッシュ処理のジョブサービス（ヘッドレス）
+
+pipeline / assign_dominant_values / shp_to_ascii / shp_to_flt を localhost の HTTP API で受け付け、
+プロセスプールで並列に実行する。各ワーカープロセスは読み込んだレイヤや点群を
+src.common.layer_cache に保持するため、同じ入力を使うジョブが続く場合は読み込みを省略できる。
+Python と GDAL の読み込みはワーカーの起動時に 1 回だけ行う。
+
+Usage:
+    python -m src.service.server --port 8765 --workers 4
+
+API（リクエスト・レスポンスとも JSON）:
+    POST   /jobs            {"operation": "shp_to_ascii", "params": {...}} → 202 {"id": ..., "status": "queued"}
+    GET    /jobs            ジョブ一覧
+    GET    /jobs/<id>       ジョブの状態（?wait=秒 で終了まで待つ）
+    DELETE /jobs/<id>       実行待ちのジョブを取り消す（実行中のジョブは 409）
+    GET    /health          ワーカー数・実行待ち件数・キャッシュ設定
+
+ジョブの状態は queued / running / succeeded / failed / cancelled。終了したジョブは
+outputs（出力ファイルのパス）、result（処理関数の戻り値）、error、elapsed を持つ。
+params のパスはサービスを起動したフォルダからの相対パスとして扱われるため、絶対パスで指定する。
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from src.common.lazy_import import warm_up
+from src.common.worker import resolve_target
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 各ワーカープロセスが保持するレイヤキャッシュの上限（件数・バイト数）
+CACHE_MAX_ENTRIES = 16
+CACHE_MAX_BYTES = 1024 ** 3
+
+# 保持する終了済みジョブの件数（超えた分は古いものから消す）
+MAX_FINISHED_JOBS = 1000
+
+# GET /jobs/<id>?wait= で待てる最大秒数
+MAX_WAIT_SECONDS = 300
+
+
+def _pipeline_outputs(params):
+    out_dir = params['out_dir']
+    return [os.path.join(out_dir, 'domain_mesh_elev.shp'), os.path.join(out_dir, 'basin_mesh_elev.shp')]
+
+
+def _dominant_outputs(params):
+    output_path = params.get('output_path')
+    if output_path is None:
+        base_path = params['base_path']
+        base_name = os.path.splitext(os.path.basename(base_path))[0]
+        output_path = os.path.join(os.path.dirname(base_path), f"{base_name}_dominant.shp")
+    return [output_path]
+
+
+def _grid_outputs(header_ext):
+    def outputs(params):
+        output_path = params['output_path']
+        base = os.path.splitext(output_path)[0]
+        paths = [output_path]
+        if header_ext:
+            paths.append(base + header_ext)
+        paths.append(base + '.prj')
+        return paths
+    return outputs
+
+
+# 受け付ける処理: 操作名 -> ('モジュール名:関数名', 必須パラメータ, 出力パスを求める関数)
+OPERATIONS = {
+    'pipeline': (
+        'src.make_shp.pipeline:pipeline',
+        ('domain_shp', 'basin_shp', 'num_cells_x', 'num_cells_y', 'points_path', 'out_dir'),
+        _pipeline_outputs,
+    ),
+    'assign_dominant_values': (
+        'src.mesh_dominant_module.mesh_dominant:assign_dominant_values',
+        ('base_path', 'land_path'),
+        _dominant_outputs,
+    ),
+    'shp_to_ascii': (
+        'src.shp_to_asc.core:shp_to_ascii',
+        ('shp_path', 'field', 'output_path'),
+        _grid_outputs(None),
+    ),
+    'shp_to_flt': (
+        'src.shp_to_asc.core:shp_to_flt',
+        ('shp_path', 'field', 'output_path'),
+        _grid_outputs('.hdr'),
+    ),
+}
+
+
+def _init_worker(cache_entries, cache_bytes):
+    """ワーカープロセスの初期化（キャッシュを有効にし、処理モジュールを読み込んでおく）"""
+    from src.common import layer_cache
+
+    layer_cache.enable(cache_entries, cache_bytes)
+    warm_up(sorted({target.split(':')[0] for target, _, _ in OPERATIONS.values()}))
+
+
+def _json_safe(value):
+    """処理関数の戻り値を JSON に変換できる形にする（numpy のスカラーやタプルを含む場合がある）"""
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def execute(target, params, job_id=None, claims=None):
+    """
+    1 件のジョブを実行する（プロセスプールのワーカーから呼ばれる）
+
+    claims（Manager の dict）を渡すと、実行を始める前に claims[job_id] へ開始時刻を記録する。
+    すでに None が入っていれば（実行待ちの間に取り消されていれば）実行しない。
+
+    Returns:
+        dict: result（戻り値）, started, elapsed を持つ辞書。取り消されていた場合は cancelled だけを持つ
+    """
+    started = time.time()
+    if claims is not None and claims.setdefault(job_id, started) is None:
+        return {'cancelled': True}
+    start = time.perf_counter()
+    # 並列実行時に出力が混ざらないよう、処理の標準出力は捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = resolve_target(target)(**params)
+    return {'result': _json_safe(result), 'started': started, 'elapsed': time.perf_counter() - start}
+
+
+class JobService:
+    """ジョブの受け付けと状態管理（HTTP ハンドラから呼ばれる）"""
+
+    def __init__(self, workers=None, cache_entries=CACHE_MAX_ENTRIES, cache_bytes=CACHE_MAX_BYTES):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # ジョブ ID -> ジョブの辞書
+        self._futures = {}
+        self._done_events = {}
+        # ジョブ ID -> ワーカーが実行を始めた時刻（取り消したジョブは None）
+        # ProcessPoolExecutor は呼び出しキューに入れた時点で future を running にするため、
+        # 実際の開始と取り消しはワーカーと共有するこの dict で決める
+        self._manager = multiprocessing.get_context('spawn').Manager()
+        self._claims = self._manager.dict()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # HTTP のスレッドが動いているプロセスから fork しないよう spawn で起動する
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.cache_entries, self.cache_bytes),
+        )
+
+    def submit(self, operation, params):
+        """
+        ジョブを登録する
+
+        Raises:
+            ValueError: 操作名やパラメータが不正な場合
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"不明な operation です: {operation}（{', '.join(OPERATIONS)}）")
+        if not isinstance(params, dict):
+            raise ValueError("params はオブジェクトで指定してください")
+        target, required, outputs = OPERATIONS[operation]
+        missing = [name for name in required if name not in params]
+        if missing:
+            raise ValueError(f"params に {', '.join(missing)} がありません")
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'operation': operation,
+            'params': params,
+            'status': 'queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'elapsed': None,
+            'outputs': outputs(params),
+            'result': None,
+            'error': None,
+        }
+        with self._lock:
+            try:
+                future = self._executor.submit(execute, target, params, job['id'], self._claims)
+            except BrokenProcessPool:
+                # ワーカーが異常終了していればプールを作り直す
+                self._executor = self._new_executor()
+                future = self._executor.submit(execute, target, params, job['id'], self._claims)
+            self._jobs[job['id']] = job
+            self._futures[job['id']] = future
+            self._done_events[job['id']] = threading.Event()
+        future.add_done_callback(lambda f, job_id=job['id']: self._finish(job_id, f))
+        return self.get(job['id'])
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job['status'] == 'cancelled' or future.cancelled():
+                job['status'] = 'cancelled'
+            elif future.exception() is not None:
+                job['status'] = 'failed'
+                job['error'] = str(future.exception())
+            elif future.result().get('cancelled'):
+                job['status'] = 'cancelled'
+            else:
+                value = future.result()
+                job.update(status='succeeded', result=value['result'],
+                           started=value['started'], elapsed=value['elapsed'])
+            if job['finished'] is None:
+                job['finished'] = time.time()
+            del self._futures[job_id]
+            self._done_events.pop(job_id).set()
+            self._trim()
+        self._claims.pop(job_id, None)
+
+    def _trim(self):
+        """終了済みジョブが上限を超えたら古いものから消す（_lock を保持して呼ぶ）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job['finished'] is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id, wait=0.0):
+        """ジョブの状態を返す（存在しなければ None）。wait 秒まで終了を待つ"""
+        with self._lock:
+            event = self._done_events.get(job_id)
+        if event is not None and wait > 0:
+            event.wait(min(wait, MAX_WAIT_SECONDS))
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        if job['status'] == 'queued':
+            started = self._claims.get(job_id)
+            if started is not None:
+                job.update(status='running', started=started)
+        return job
+
+    def list(self):
+        with self._lock:
+            job_ids = list(self._jobs)
+        return [job for job in (self.get(job_id) for job_id in job_ids) if job is not None]
+
+    def cancel(self, job_id):
+        """実行待ちのジョブを取り消す。取り消せたら True、実行中・終了済みなら False"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            future = self._futures.get(job_id)
+        if future is None or job['status'] != 'queued':
+            return False
+        # ワーカーが先に開始時刻を記録していれば実行中
+        if self._claims.setdefault(job_id, None) is not None:
+            return False
+        # プールの中で待っていればすぐに取り消される。呼び出しキューに入っていれば、
+        # ワーカーが取り出したときに実行せずに終わる
+        future.cancel()
+        with self._lock:
+            if job_id in self._jobs:
+                job.update(status='cancelled', finished=time.time())
+            event = self._done_events.get(job_id)
+        if event is not None:
+            event.set()
+        return True
+
+    def health(self):
+        claims = dict(self._claims)
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+            running = sum(job['status'] == 'queued' and claims.get(job_id) is not None
+                          for job_id, job in self._jobs.items())
+        return {
+            'workers': self.workers,
+            'queued': statuses.count('queued') - running,
+            'running': running,
+            'finished': len(statuses) - statuses.count('queued'),
+            'cache_entries': self.cache_entries,
+            'cache_bytes': self.cache_bytes,
+        }
+
+    def shutdown(self):
+        # 呼び出しキューに残ったジョブもワーカーが claims を参照するため、Manager は止めずに
+        # プロセス終了時（プールのスレッドの終了後）の後始末に任せる
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_JOB_PATH = re.compile(r'^/jobs/([0-9a-f]+)$')
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """JobService を HTTP で公開するハンドラ（server.service に JobService を持たせる）"""
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            self._send_json(HTTPStatus.OK, service.health())
+        elif url.path == '/jobs':
+            self._send_json(HTTPStatus.OK, {'jobs': service.list()})
+        elif match := _JOB_PATH.match(url.path):
+            try:
+                wait = float(parse_qs(url.query).get('wait', ['0'])[0])
+            except ValueError:
+                self._send_error(HTTPStatus.BAD_REQUEST, "wait は秒数で指定してください")
+                return
+            job = service.get(match.group(1), wait)
+            if job is None:
+                self._send_error(HTTPStatus.NOT_FOUND, "ジョブが見つかりません")
+            else:
+                self._send_json(HTTPStatus.OK, job)
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "不明なパスです")
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/jobs':
+            self._send_error(HTTPStatus.NOT_FOUND, "不明なパスです")
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            job = self.server.service.submit(body.get('operation'), body.get('params', {}))
+        except (ValueError, AttributeError) as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        self._send_json(HTTPStatus.ACCEPTED, job)
+
+    def do_DELETE(self):
+        match = _JOB_PATH.match(urlsplit(self.path).path)
+        if not match:
+            self._send_error(HTTPStatus.NOT_FOUND, "不明なパスです")
+            return
+        job_id = match.group(1)
+        if self.server.service.get(job_id) is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "ジョブが見つかりません")
+        elif self.server.service.cancel(job_id):
+            self._send_json(HTTPStatus.OK, self.server.service.get(job_id))
+        else:
+            self._send_error(HTTPStatus.CONFLICT, "実行中または終了済みのジョブは取り消せません")
+
+    def log_message(self, format, *args):
+        # ジョブの状態確認は頻繁に来るため、アクセスログは出さない
+        pass
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None,
+          cache_entries=CACHE_MAX_ENTRIES, cache_bytes=CACHE_MAX_BYTES):
+    """ジョブサービスを起動し、Ctrl+C で止めるまで処理を続ける"""
+    service = JobService(workers, cache_entries, cache_bytes)
+    httpd = ThreadingHTTPServer((host, port), JobRequestHandler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    print(f"ジョブサービスを起動しました: http://{host}:{httpd.server_port} (ワーカー {service.workers})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nジョブサービスを停止します")
+    finally:
+        httpd.server_close()
+        service.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='メッシュ処理のジョブサービス（localhost HTTP API）')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='待ち受けるアドレス（既定: 127.0.0.1）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='待ち受けるポート')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数（デフォルト: CPU 数）')
+    parser.add_argument('--cache-entries', type=int, default=CACHE_MAX_ENTRIES,
+                        help='ワーカーごとにキャッシュするレイヤ数')
+    parser.add_argument('--cache-mb', type=int, default=CACHE_MAX_BYTES // 1024 ** 2,
+                        help='ワーカーごとのキャッシュ上限（MB）')
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.cache_entries, args.cache_mb * 1024 ** 2)
+
+
+if __name__ == '__main__':
+    main()
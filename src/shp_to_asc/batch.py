@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+複数のシェープファイルを ASCII Grid (.asc) / バイナリグリッド (.flt) へ一括変換する CLI
+
+ジョブはグロブ（--glob + --field）またはマニフェスト CSV（--manifest）で指定し、
+プロセスプールで並列に実行する。入力の構成ファイル（更新時刻・サイズ）が前回の変換から変わっておらず、
+前回と同じパラメータ（入力・フィールド・NODATA 値）で変換したジョブはスキップする。
+パラメータと入力の状態は出力の横の <出力ファイル名>.job.json に記録する。
+
+Usage:
+    python -m src.shp_to_asc.batch --glob "output/*/domain_mesh_elev.shp" \
+        --field elevation --outdir ./asc --jobs 4
+
+    python -m src.shp_to_asc.batch --manifest jobs.csv --jobs 4
+
+マニフェスト CSV は shapefile,field,output 列（任意で nodata 列）を持つ。
+相対パスはマニフェストのあるフォルダからの相対パスとして扱う。
+"""
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.common.fileio import file_fingerprint
+from src.shp_to_asc.core import shp_to_ascii, shp_to_flt
+from src.shp_to_asc.gui import DEFAULT_NODATA
+
+# ジョブのパラメータを記録するファイルの接尾辞（出力ファイル名の後ろに付ける）
+_JOB_SUFFIX = '.job.json'
+
+
+def load_manifest(manifest_path, nodata=DEFAULT_NODATA):
+    """
+    マニフェスト CSV を読み込み、ジョブのリストを返す
+
+    Returns:
+        list[dict]: shapefile, field, output, nodata を持つ辞書のリスト
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, newline='', encoding='utf-8-sig') as f:
+        for lineno, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                shp, field, output = row['shapefile'], row['field'], row['output']
+            except KeyError as e:
+                raise ValueError(f"マニフェストに {e.args[0]} 列がありません: {manifest_path}") from None
+            if not shp or not field or not output:
+                raise ValueError(f"マニフェスト {lineno} 行目に空の項目があります")
+            job_nodata = row.get('nodata')
+            jobs.append({
+                'shapefile': os.path.join(base_dir, shp),
+                'field': field,
+                'output': os.path.join(base_dir, output),
+                'nodata': float(job_nodata) if job_nodata else nodata,
+            })
+    return jobs
+
+
+def jobs_from_glob(pattern, field, out_dir, fmt='asc', nodata=DEFAULT_NODATA):
+    """
+    グロブに一致するシェープファイルごとにジョブを作る
+    出力名は <out_dir>/<入力ファイル名>.<fmt>。入力名が重複する場合は、一致したファイルに共通する
+    フォルダからの相対パスを '_' でつないだ名前にする（output/200/mesh.shp -> 200_mesh.<fmt>）
+
+    Raises:
+        ValueError: それでも出力名が重複する場合（check_outputs）
+    """
+    paths = sorted(glob.glob(pattern, recursive=True))
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else ''
+    jobs = []
+    for path, stem in zip(paths, stems):
+        if stems.count(stem) > 1:
+            relative = os.path.relpath(os.path.splitext(os.path.abspath(path))[0], base_dir)
+            stem = relative.replace(os.sep, '_')
+        jobs.append({
+            'shapefile': path,
+            'field': field,
+            'output': os.path.join(out_dir, f"{stem}.{fmt}"),
+            'nodata': nodata,
+        })
+    check_outputs(jobs)
+    return jobs
+
+
+def check_outputs(jobs):
+    """
+    複数のジョブが同じ出力に書き込まないか確認する
+    （.prj・.hdr は拡張子を除いた名前で作られるため、拡張子違いの出力も重複とみなす）
+
+    Raises:
+        ValueError: 出力が重複するジョブがある場合
+    """
+    targets = {}
+    for job in jobs:
+        key = os.path.normcase(os.path.splitext(os.path.abspath(job['output']))[0])
+        targets.setdefault(key, []).append(job)
+    duplicates = [group for group in targets.values() if len(group) > 1]
+    if duplicates:
+        lines = [f"  {group[0]['output']} <- " + ', '.join(job['shapefile'] for job in group)
+                 for group in duplicates]
+        raise ValueError("複数のジョブが同じ出力に書き込みます:\n" + '\n'.join(lines))
+
+
+def job_record_path(job):
+    """ジョブのパラメータを記録するファイルのパス"""
+    return job['output'] + _JOB_SUFFIX
+
+
+def _job_params(job):
+    """出力の鮮度の判定に使うジョブのパラメータ"""
+    return {
+        'shapefile': os.path.abspath(job['shapefile']),
+        'field': job['field'],
+        'nodata': float(job['nodata']),
+    }
+
+
+def _input_fingerprint(job):
+    """入力の構成ファイルの (拡張子, 更新時刻, サイズ) を JSON に記録できる形で返す（入力が無ければ None）"""
+    fingerprint = file_fingerprint(job['shapefile'])
+    return [list(part) for part in fingerprint] if fingerprint else None
+
+
+def stale_reason(job):
+    """出力を作り直す理由を返す（出力が最新なら None）"""
+    outputs = [job['output']]
+    if job['output'].lower().endswith('.flt'):
+        outputs.append(os.path.splitext(job['output'])[0] + '.hdr')
+    if not all(os.path.exists(p) for p in outputs):
+        return "出力がありません"
+
+    fingerprint = _input_fingerprint(job)
+    if fingerprint is None:
+        return "入力がありません"
+
+    try:
+        with open(job_record_path(job), encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return "変換時のパラメータの記録がありません"
+    if record.get('input') != fingerprint:
+        return "入力が前回の変換から変わっている"
+    params = _job_params(job)
+    changed = [name for name in params if record.get(name) != params[name]]
+    if changed:
+        return f"パラメータ ({', '.join(changed)}) が前回の変換と異なる"
+    return None
+
+
+def is_up_to_date(job):
+    """出力（.flt の場合は .hdr も）があり、前回と同じ入力・パラメータで変換していれば True"""
+    return stale_reason(job) is None
+
+
+def run_job(job):
+    """
+    1 件のジョブを実行する（プロセスプールのワーカーから呼ばれる）
+
+    Returns:
+        dict: ジョブに status, elapsed, ncols, nrows, message を加えた辞書
+    """
+    result = dict(job)
+    start = time.perf_counter()
+    convert = shp_to_flt if job['output'].lower().endswith('.flt') else shp_to_ascii
+    # 変換中に入力が更新された場合に次回作り直すよう、変換前の状態を記録する
+    fingerprint = _input_fingerprint(job)
+    try:
+        # 並列実行時に出力が混ざらないよう、変換処理の標準出力は捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            ncols, nrows, _, _ = convert(job['shapefile'], job['field'], job['output'], job['nodata'])
+        with open(job_record_path(job), 'w', encoding='utf-8') as f:
+            json.dump(dict(_job_params(job), input=fingerprint), f, ensure_ascii=False)
+        result.update(status='ok', ncols=ncols, nrows=nrows, message='')
+    except Exception as e:
+        result.update(status='error', ncols=None, nrows=None, message=str(e))
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(jobs, max_workers=None, force=False):
+    """
+    ジョブを並列実行し、結果のリストを返す
+
+    Args:
+        jobs: load_manifest / jobs_from_glob が返すジョブのリスト
+        max_workers: 同時実行数（省略時は CPU 数）
+        force: True の場合、出力が新しくても再変換する
+
+    Returns:
+        list[dict]: 各ジョブの結果（status は 'ok' / 'skipped' / 'error'）
+
+    Raises:
+        ValueError: 複数のジョブが同じ出力に書き込む場合（check_outputs）
+    """
+    check_outputs(jobs)
+    results = []
+    pending = []
+    for job in jobs:
+        reason = None if force else stale_reason(job)
+        if not force and reason is None:
+            results.append(dict(job, status='skipped', elapsed=0.0, ncols=None, nrows=None, message=''))
+            print(f"[SKIP] {job['shapefile']} -> {job['output']} (出力が最新)")
+        else:
+            if reason is not None and os.path.exists(job['output']):
+                print(f"[INFO] {job['output']} を再変換します（{reason}）")
+            pending.append(job)
+
+    if not pending:
+        return results
+
+    total = len(pending)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_job, job) for job in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            if result['status'] == 'ok':
+                print(f"[{done}/{total}] OK    {result['elapsed']:8.2f}s  "
+                      f"{result['shapefile']} -> {result['output']} ({result['ncols']} x {result['nrows']})")
+            else:
+                print(f"[{done}/{total}] ERROR {result['elapsed']:8.2f}s  "
+                      f"{result['shapefile']}: {result['message']}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='シェープファイル → ASCII Grid 一括変換')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--glob', help='入力シェープファイルのグロブ（例: "output/*/domain_mesh_elev.shp"）')
+    source.add_argument('--manifest', help='ジョブ一覧 CSV（shapefile,field,output[,nodata] 列）')
+    parser.add_argument('--field', help='焼き込む属性フィールド名（--glob 使用時は必須）')
+    parser.add_argument('--outdir', default='./outputs', help='出力フォルダ（--glob 使用時）')
+    parser.add_argument('--format', choices=('asc', 'flt'), default='asc', help='出力形式（--glob 使用時）')
+    parser.add_argument('--nodata', type=float, default=DEFAULT_NODATA, help='NODATA値')
+    parser.add_argument('--jobs', type=int, default=None, help='同時実行数（デフォルト: CPU 数）')
+    parser.add_argument('--force', action='store_true', help='出力が最新でも再変換する')
+    args = parser.parse_args(argv)
+
+    if args.glob and not args.field:
+        parser.error('--glob を使う場合は --field を指定してください')
+    try:
+        if args.glob:
+            jobs = jobs_from_glob(args.glob, args.field, args.outdir, args.format, args.nodata)
+        else:
+            jobs = load_manifest(args.manifest, args.nodata)
+        check_outputs(jobs)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 2
+
+    if not jobs:
+        print("対象のシェープファイルがありません")
+        return 0
+
+    start = time.perf_counter()
+    results = run_batch(jobs, max_workers=args.jobs, force=args.force)
+    elapsed = time.perf_counter() - start
+
+    counts = {status: sum(r['status'] == status for r in results) for status in ('ok', 'skipped', 'error')}
+    print(f"\n完了: {counts['ok']} 件, スキップ: {counts['skipped']} 件, "
+          f"エラー: {counts['error']} 件 (合計 {elapsed:.2f}s)")
+    return 1 if counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,29 @@
 # core.py
+import copy
+import math
 import os
-import geopandas as gpd
+from functools import lru_cache
 import numpy as np
 import rasterio
-from rasterio.transform import from_bounds
+from rasterio.transform import from_bounds, from_origin
 from rasterio.features import rasterize
+from pyproj import CRS
+
+from src.common.cancel import check_cancel
+from src.common.fileio import atomic_output
+from src.common.grid import detect_layer_grid, detect_regular_grid
+from src.common.layer_cache import read_layer
+from src.common.progress import ProgressReporter
+from src.shp_to_asc.utils import read_shp_bounds
 
 def analyze_grid_structure(shp_path):
     """
     shapefileのグリッド構造を分析して詳細な情報を返す
+    属性（.dbf）は読まず、.shx/.shp のレコードヘッダの bbox だけから計算する。
+    結果はファイルごと（パス・更新時刻・サイズ）にキャッシュされる。
     
     Args:
         shp_path: 入力シェープファイルのパス
-        precision: 数値の丸め桁数
         
     Returns:
         dict: グリッド情報を含む辞書
@@ -24,22 +35,56 @@ def analyze_grid_structure(shp_path):
             - 'cell_size_stats': セルサイズの統計情報
                 - 'min_x', 'max_x', 'mean_x', 'median_x', 'std_x'
                 - 'min_y', 'max_y', 'mean_y', 'median_y', 'std_y'
+            - 'regular': 規則格子（同じ大きさのセルが格子状に並ぶ）かどうか
     """
-    # シェープファイル読み込み
-    gdf = gpd.read_file(shp_path)
-    if gdf.empty:
+    stat = os.stat(shp_path)
+    result = copy.deepcopy(
+        _analyze_grid_cached(os.path.abspath(shp_path), stat.st_mtime_ns, stat.st_size)
+    )
+    ncols, nrows = result['ncols'], result['nrows']
+    cell_size_x, cell_size_y = result['cell_size_x'], result['cell_size_y']
+    minx, miny, maxx, maxy = result['extent']
+    cell_size_stats = result['cell_size_stats']
+    
+    # 結果を表示
+    print("\n=== グリッド情報 ===")
+    print(f"推奨グリッド数: {ncols} (列) x {nrows} (行)")
+    print(f"推奨セルサイズ: dx={cell_size_x:.12f}, dy={cell_size_y:.12f}")
+    print(f"範囲: minx={minx:.12f}, miny={miny:.12f}, maxx={maxx:.12f}, maxy={maxy:.12f}")
+    print(f"規則格子: {'はい' if result['regular'] else 'いいえ'}")
+    
+    print("\n=== セルサイズ統計 (X方向) ===")
+    print(f"最小: {cell_size_stats['x']['min']:.12f}")
+    print(f"最大: {cell_size_stats['x']['max']:.12f}")
+    print(f"平均: {cell_size_stats['x']['mean']:.12f}")
+    print(f"中央値: {cell_size_stats['x']['median']:.12f}")
+    print(f"標準偏差: {cell_size_stats['x']['std']:.12f}")
+    
+    print("\n=== セルサイズ統計 (Y方向) ===")
+    print(f"最小: {cell_size_stats['y']['min']:.12f}")
+    print(f"最大: {cell_size_stats['y']['max']:.12f}")
+    print(f"平均: {cell_size_stats['y']['mean']:.12f}")
+    print(f"中央値: {cell_size_stats['y']['median']:.12f}")
+    print(f"標準偏差: {cell_size_stats['y']['std']:.12f}")
+    
+    return result
+
+
+@lru_cache(maxsize=32)
+def _analyze_grid_cached(shp_path, mtime_ns, size):
+    """analyze_grid_structure の本体（mtime_ns, size はキャッシュキー用）"""
+    # 各フィーチャのバウンディングボックスをまとめて取得
+    bounds = read_shp_bounds(shp_path)
+    if len(bounds) == 0:
         raise RuntimeError("シェープファイルにフィーチャが含まれていません")
     
     # 全体のバウンディングボックスを取得
-    minx, miny, maxx, maxy = gdf.total_bounds
-    
-    # 各フィーチャのバウンディングボックスを取得
-    bounds_list = [geom.bounds for geom in gdf.geometry]
-    minxs, minys, maxxs, maxys = zip(*bounds_list)
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    maxx, maxy = bounds[:, 2].max(), bounds[:, 3].max()
     
     # 各フィーチャの幅と高さを計算
-    widths = np.array([mx - mnx for mnx, mx in zip(minxs, maxxs)])
-    heights = np.array([my - mny for mny, my in zip(minys, maxys)])
+    widths = bounds[:, 2] - bounds[:, 0]
+    heights = bounds[:, 3] - bounds[:, 1]
     
     # セルサイズの統計を計算
     def calc_stats(arr):
@@ -60,45 +105,28 @@ def analyze_grid_structure(shp_path):
     cell_size_x = cell_size_stats['x']['mean']
     cell_size_y = cell_size_stats['y']['mean']
     
-    # グリッド数を計算
-    ncols = max(1, int(round((maxx - minx) / cell_size_x)))
-    nrows = max(1, int(round((maxy - miny) / cell_size_y)))
+    # グリッド数を計算（規則格子ならその列数・行数を使う）
+    grid = detect_regular_grid(bounds)
+    if grid is not None:
+        ncols, nrows = grid['ncols'], grid['nrows']
+    else:
+        ncols = max(1, int(round((maxx - minx) / cell_size_x)))
+        nrows = max(1, int(round((maxy - miny) / cell_size_y)))
     
     # 結果を辞書に格納
-    result = {
+    return {
         'ncols': ncols,
         'nrows': nrows,
         'cell_size_x': cell_size_x,
         'cell_size_y': cell_size_y,
-        'extent': (minx, miny, maxx, maxy),
-        'cell_size_stats': cell_size_stats
+        'extent': (float(minx), float(miny), float(maxx), float(maxy)),
+        'cell_size_stats': cell_size_stats,
+        'regular': grid is not None
     }
-    
-    # 結果を表示
-    print("\n=== グリッド情報 ===")
-    print(f"推奨グリッド数: {ncols} (列) x {nrows} (行)")
-    print(f"推奨セルサイズ: dx={cell_size_x:.12f}, dy={cell_size_y:.12f}")
-    print(f"範囲: minx={minx:.12f}, miny={miny:.12f}, maxx={maxx:.12f}, maxy={maxy:.12f}")
-    
-    print("\n=== セルサイズ統計 (X方向) ===")
-    print(f"最小: {cell_size_stats['x']['min']:.12f}")
-    print(f"最大: {cell_size_stats['x']['max']:.12f}")
-    print(f"平均: {cell_size_stats['x']['mean']:.12f}")
-    print(f"中央値: {cell_size_stats['x']['median']:.12f}")
-    print(f"標準偏差: {cell_size_stats['x']['std']:.12f}")
-    
-    print("\n=== セルサイズ統計 (Y方向) ===")
-    print(f"最小: {cell_size_stats['y']['min']:.12f}")
-    print(f"最大: {cell_size_stats['y']['max']:.12f}")
-    print(f"平均: {cell_size_stats['y']['mean']:.12f}")
-    print(f"中央値: {cell_size_stats['y']['median']:.12f}")
-    print(f"標準偏差: {cell_size_stats['y']['std']:.12f}")
-    
-    return result
 
 
 
-def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
+def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None, cancel=None, progress=None):
     """
     ShapefileをESRI ASCII Grid形式(.asc)に変換
     グリッド数は入力シェープファイルのフィーチャに基づいて自動設定される
@@ -109,42 +137,88 @@ def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
         nodata: NoData値
         output_path: 出力ファイルパス (.asc)
         bounds: (minx, miny, maxx, maxy) を指定すると範囲を上書き
+        cancel: CancelToken（キャンセルされると JobCancelled を送出し、出力は残さない）
+        progress: 進捗コールバック（ラスタ化・書き出しの 2 段階を通知する）
+    """
+    reporter = ProgressReporter(progress, steps=2)
+    reporter.begin("ラスタ化")
+    raster, header, crs = _rasterize_shp(shp_path, field, nodata, bounds, cancel)
+    reporter.begin("書き出し")
+    write_ascii_grid(output_path, raster, header, crs, cancel, reporter.nested())
+    reporter.end()
+
+    # 実際のグリッド数を返す
+    return header['ncols'], header['nrows'], header['dx'], header['dy']
+
+
+def shp_to_flt(shp_path, field, output_path, nodata=None, bounds=None, cancel=None, progress=None):
+    """
+    ShapefileをESRI バイナリグリッド形式(.flt + .hdr)に変換
+    グリッドの決め方・ヘッダ項目は shp_to_ascii と共通で、値は float32 のまま書き出す
+
+    Parameters:
+        shp_path: 入力シェープファイルパス
+        field: 属性フィールド名
+        nodata: NoData値
+        output_path: 出力ファイルパス (.flt)
+        bounds: (minx, miny, maxx, maxy) を指定すると範囲を上書き
+        cancel: CancelToken（キャンセルされると JobCancelled を送出し、出力は残さない）
+        progress: 進捗コールバック（ラスタ化・書き出しの 2 段階を通知する）
     """
-    gdf = gpd.read_file(shp_path)
+    reporter = ProgressReporter(progress, steps=2)
+    reporter.begin("ラスタ化")
+    raster, header, crs = _rasterize_shp(shp_path, field, nodata, bounds, cancel)
+    reporter.begin("書き出し")
+    write_flt_grid(output_path, raster, header, crs, cancel, reporter.nested())
+    reporter.end()
+
+    return header['ncols'], header['nrows'], header['dx'], header['dy']
+
+
+def _rasterize_shp(shp_path, field, nodata=None, bounds=None, cancel=None):
+    """
+    シェープファイルをラスタ化し、(raster, header, crs) を返す
+    header は ncols, nrows, xllcorner, yllcorner, dx, dy, NODATA_value を持つ辞書
+    """
+    gdf = read_layer(shp_path)
     if gdf.empty:
         raise RuntimeError("シェープファイルにフィーチャが含まれていません")
+    check_cancel(cancel)
     
-    # boundsが渡されれば上書き、なければシェープの範囲を使用
-    if bounds:
-        minx, miny, maxx, maxy = bounds
+    # 範囲の上書きがなく、入力が規則格子メッシュなら格子の原点・セルサイズ・行列数をそのまま使う
+    grid = None if bounds else detect_layer_grid(gdf)
+    if grid is not None:
+        minx, miny, maxx, maxy = grid['extent']
+        ncols, nrows = grid['ncols'], grid['nrows']
     else:
-        minx, miny, maxx, maxy = gdf.total_bounds
-    
-    # 各フィーチャのバウンディングボックスを取得
-    bounds_list = [geom.bounds for geom in gdf.geometry]
-    minxs, minys, maxxs, maxys = zip(*bounds_list)
-    
-    # グリッドのセル数を計算（各フィーチャのグリッド数を考慮）
-    ncols = max(1, int(round((maxx - minx) / min(maxx - minx, min(maxxs) - min(minxs)))))
-    nrows = max(1, int(round((maxy - miny) / min(maxy - miny, min(maxys) - min(minys)))))
-    
-    # セルサイズを計算（範囲を正確にカバーするように調整）
-    dx = (maxx - minx) / ncols
-    dy = (maxy - miny) / nrows
-    
-    # グリッドの実際の範囲（シェープの範囲と完全に一致）
-    grid_width = ncols * dx
-    grid_height = nrows * dy
-    
-    # グリッドの中心をシェープの中心に合わせる
-    shape_center_x = (minx + maxx) / 2
-    shape_center_y = (miny + maxy) / 2
+        # boundsが渡されれば上書き、なければシェープの範囲を使用
+        feature_bounds = gdf.geometry.bounds.to_numpy()
+        if bounds:
+            minx, miny, maxx, maxy = bounds
+        else:
+            minx, miny, maxx, maxy = gdf.total_bounds
+        minxs, minys, maxxs, maxys = feature_bounds.T
+
+        # グリッドのセル数を計算（各フィーチャのグリッド数を考慮）
+        ncols = max(1, int(round((maxx - minx) / min(maxx - minx, maxxs.min() - minxs.min()))))
+        nrows = max(1, int(round((maxy - miny) / min(maxy - miny, maxys.min() - minys.min()))))
     
-    # グリッドの範囲を再計算
-    grid_minx = shape_center_x - grid_width / 2
-    grid_maxx = shape_center_x + grid_width / 2
-    grid_miny = shape_center_y - grid_height / 2
-    grid_maxy = shape_center_y + grid_height / 2
+    if grid is not None:
+        header = {
+            'ncols': ncols,
+            'nrows': nrows,
+            'xllcorner': grid['origin'][0],
+            'yllcorner': grid['origin'][1],
+            'dx': grid['dx'],
+            'dy': grid['dy'],
+            'NODATA_value': nodata,
+        }
+    else:
+        header = grid_header((minx, miny, maxx, maxy), ncols, nrows, nodata)
+    dx, dy = header['dx'], header['dy']
+    grid_minx, grid_miny = header['xllcorner'], header['yllcorner']
+    grid_maxx = (minx + maxx) / 2 + ncols * dx / 2
+    grid_maxy = (miny + maxy) / 2 + nrows * dy / 2
     
     print(f"セル数: {ncols} x {nrows}")
     print(f"セルサイズ: dx={dx:.12f}, dy={dy:.12f}")
@@ -154,24 +228,169 @@ def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
     if ncols <= 0 or nrows <= 0:
         raise ValueError("計算されたncolsまたはnrowsが0以下です。セルサイズと範囲を確認してください")
     
-    # グリッドの範囲を使用して変換行列を作成
-    transform = from_bounds(grid_minx, grid_miny, grid_maxx, grid_maxy, ncols, nrows)
-    shapes = ((geom, float(val)) for geom, val in zip(gdf.geometry, gdf[field]))
-    raster = rasterize(
-        shapes,
-        out_shape=(nrows, ncols),
-        fill=nodata,
-        transform=transform,
-        dtype='float32'
-    )
+    check_cancel(cancel)
+
+    if grid is not None and nodata is not None:
+        # 規則格子ならセル番号へ直接値を入れる
+        raster = np.full((nrows, ncols), nodata, dtype='float32')
+        raster[grid['rows'], grid['cols']] = gdf[field].to_numpy(dtype='float64')
+    else:
+        # グリッドの範囲を使用して変換行列を作成
+        transform = from_bounds(grid_minx, grid_miny, grid_maxx, grid_maxy, ncols, nrows)
+        shapes = ((geom, float(val)) for geom, val in zip(gdf.geometry, gdf[field]))
+        raster = rasterize(
+            shapes,
+            out_shape=(nrows, ncols),
+            fill=nodata,
+            transform=transform,
+            dtype='float32'
+        )
 
-    # NoData以外の値を小数点以下4桁に丸める
+    check_cancel(cancel)
+
+    round_grid_values(raster, nodata)
+    return raster, header, gdf.crs
+
+
+def grid_header(bounds, ncols, nrows, nodata=None):
+    """
+    範囲 (minx, miny, maxx, maxy) を ncols x nrows に分けたグリッドのヘッダ辞書を返す
+    （ncols, nrows, xllcorner, yllcorner, dx, dy, NODATA_value。グリッドの中心を範囲の中心に合わせる）
+    """
+    minx, miny, maxx, maxy = bounds
+    # セルサイズを計算（範囲を正確にカバーするように調整）
+    dx = (maxx - minx) / ncols
+    dy = (maxy - miny) / nrows
+    # グリッドの中心をシェープの中心に合わせる
+    return {
+        'ncols': ncols,
+        'nrows': nrows,
+        'xllcorner': (minx + maxx) / 2 - ncols * dx / 2,
+        'yllcorner': (miny + maxy) / 2 - nrows * dy / 2,
+        'dx': dx,
+        'dy': dy,
+        'NODATA_value': nodata,
+    }
+
+
+def round_grid_values(raster, nodata):
+    """float32 の配列のうち NoData 以外の値を小数点以下 3 桁に丸める（その場で書き換える）"""
     raster[raster != nodata] = np.round(raster[raster != nodata], 3)
-    # 1. rasterioで一度ファイルを出力する（.prjファイルも自動生成される）
-    out_dir = os.path.dirname(output_path)
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
+    return raster
+
+
+def _format_grid_header(header):
+    """ASCII Grid のヘッダ行を組み立てる（セルサイズは本プロジェクトの dx/dy で書く）"""
+    return (
+        f"ncols {header['ncols']}\n"
+        f"nrows {header['nrows']}\n"
+        f"xllcorner {header['xllcorner']}\n"
+        f"yllcorner {header['yllcorner']}\n"
+        f"dx {header['dx']}\n"
+        f"dy {header['dy']}\n"
+        f"NODATA_value {header['NODATA_value']}\n"
+    )
+
+
+def _format_hdr_header(header):
+    """
+    .flt に添える .hdr のヘッダ行を組み立てる
+    GDAL の EHdr ドライバ・ArcGIS は dx/dy を読まないため、セルが正方形なら cellsize、
+    そうでなければ xdim/ydim で書く
+    """
+    if math.isclose(header['dx'], header['dy'], rel_tol=1e-9):
+        cell = f"cellsize {header['dx']}\n"
+    else:
+        cell = f"xdim {header['dx']}\nydim {header['dy']}\n"
+    return (
+        f"ncols {header['ncols']}\n"
+        f"nrows {header['nrows']}\n"
+        f"xllcorner {header['xllcorner']}\n"
+        f"yllcorner {header['yllcorner']}\n"
+        + cell +
+        f"NODATA_value {header['NODATA_value']}\n"
+        "byteorder LSBFIRST\n"
+    )
+
+
+def _parse_grid_header(lines):
+    """
+    ASCII Grid / .hdr のヘッダ行を解析して辞書を返す
+    標準の cellsize・.hdr の xdim/ydim と本プロジェクトの dx/dy、xllcenter/yllcenter に対応する
+    """
+    raw = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2:
+            raw[parts[0].lower()] = parts[1]
 
+    try:
+        ncols = int(raw['ncols'])
+        nrows = int(raw['nrows'])
+    except KeyError as e:
+        raise ValueError(f"グリッドヘッダに {e.args[0]} がありません") from None
+    if 'dx' in raw and 'dy' in raw:
+        dx, dy = float(raw['dx']), float(raw['dy'])
+    elif 'xdim' in raw and 'ydim' in raw:
+        dx, dy = float(raw['xdim']), float(raw['ydim'])
+    elif 'cellsize' in raw:
+        dx = dy = float(raw['cellsize'])
+    else:
+        raise ValueError("グリッドヘッダに cellsize・dx/dy・xdim/ydim のいずれもありません")
+
+    if 'xllcorner' in raw:
+        xll = float(raw['xllcorner'])
+    else:
+        xll = float(raw['xllcenter']) - dx / 2
+    if 'yllcorner' in raw:
+        yll = float(raw['yllcorner'])
+    else:
+        yll = float(raw['yllcenter']) - dy / 2
+
+    nodata = raw.get('nodata_value', raw.get('nodata'))
+    return {
+        'ncols': ncols,
+        'nrows': nrows,
+        'xllcorner': xll,
+        'yllcorner': yll,
+        'dx': dx,
+        'dy': dy,
+        'NODATA_value': float(nodata) if nodata is not None else None,
+        'byteorder': raw.get('byteorder', 'lsbfirst').upper(),
+        # 先頭行（北端）を基準にした rasterio 互換の変換行列
+        'transform': from_origin(xll, yll + nrows * dy, dx, dy),
+    }
+
+
+def _write_prj(output_path, crs):
+    """出力グリッドと同名の .prj を書き出す（ESRI WKT）"""
+    if crs is None:
+        return
+    prj_path = os.path.splitext(output_path)[0] + '.prj'
+    with open(prj_path, 'w') as f:
+        f.write(crs.to_wkt(version='WKT1_ESRI'))
+
+
+def write_ascii_grid(output_path, raster, header, crs=None, cancel=None, progress=None):
+    """
+    2 次元配列を ESRI ASCII Grid (.asc, dx/dy ヘッダ) として書き出す
+    一時ファイルへ書いてから置き換えるため、失敗・キャンセル時に書きかけの出力は残らない
+
+    Parameters:
+        output_path: 出力ファイルパス (.asc)
+        raster: (nrows, ncols) の配列（先頭行が北端）
+        header: _rasterize_shp が返すヘッダ辞書
+        crs: 座標参照系（指定すると .prj も出力）
+        cancel: CancelToken（行ブロックごとに確認する）
+        progress: 進捗コールバック（行数を単位に通知する）
+    """
+    ncols, nrows = header['ncols'], header['nrows']
+    nodata = header['NODATA_value']
+
+    transform = from_origin(
+        header['xllcorner'], header['yllcorner'] + nrows * header['dy'],
+        header['dx'], header['dy']
+    )
     profile = {
         'driver': 'AAIGrid',
         'height': nrows,
@@ -180,25 +399,492 @@ def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
         'dtype': 'float32',
         'transform': transform,
         'nodata': nodata,
-        'crs': gdf.crs
+        'crs': crs
     }
-    with rasterio.open(output_path, 'w', **profile) as dst:
-        dst.write(raster, 1)
-
-    # 2. 出力した.ascファイルを整形して上書きする
-    header = (
-        f"ncols {ncols}\n"
-        f"nrows {nrows}\n"
-        f"xllcorner {grid_minx}\n"
-        f"yllcorner {grid_miny}\n"
-        f"dx {dx}\n"
-        f"dy {dy}\n"
-        f"NODATA_value {nodata}\n"
+    with atomic_output(output_path) as tmp_path:
+        # 1. rasterioで一度ファイルを出力する（.prjファイルも自動生成される）
+        with rasterio.open(tmp_path, 'w', **profile) as dst:
+            dst.write(raster, 1)
+
+        # 2. 出力した.ascファイルを整形して上書きする
+        reporter = ProgressReporter(progress)
+        reporter.begin("ASCII Grid 書き出し", total=nrows)
+        with open(tmp_path, 'w') as f:
+            f.write(_format_grid_header(header))
+            for start in range(0, nrows, _WRITE_BLOCK_ROWS):
+                check_cancel(cancel)
+                block = raster[start:start + _WRITE_BLOCK_ROWS]
+                np.savetxt(f, block, fmt='%12.3f')
+                reporter.advance(len(block))
+        reporter.end()
+
+
+def write_ascii_blocks(output_path, blocks, header, crs=None, cancel=None, progress=None):
+    """
+    北端から順に並んだ行ブロック（(行数, ncols) の配列）を受け取り、ESRI ASCII Grid として書き出す
+    グリッド全体をメモリに載せずに書けるため、タイルごとに集計した結果の出力に使う。
+    値の書式は write_ascii_grid と同じ。crs を指定すると .prj も出力する
+
+    Parameters:
+        blocks: 行ブロックの iterable（行数の合計が header['nrows'] と一致すること）
+        その他: write_ascii_grid と同じ
+    """
+    ncols, nrows = header['ncols'], header['nrows']
+    with atomic_output(output_path) as tmp_path:
+        reporter = ProgressReporter(progress)
+        reporter.begin("ASCII Grid 書き出し", total=nrows)
+        written = 0
+        with open(tmp_path, 'w') as f:
+            f.write(_format_grid_header(header))
+            for block in blocks:
+                check_cancel(cancel)
+                if block.ndim != 2 or block.shape[1] != ncols:
+                    raise ValueError(f"行ブロックの形状 {block.shape} の列数がヘッダ ({ncols}) と一致しません")
+                np.savetxt(f, block, fmt='%12.3f')
+                written += len(block)
+                reporter.advance(len(block))
+        if written != nrows:
+            raise ValueError(f"書き出した行数 ({written}) がヘッダ ({nrows}) と一致しません")
+        _write_prj(tmp_path, crs)
+        reporter.end()
+
+
+def write_flt_grid(output_path, raster, header, crs=None, cancel=None, progress=None):
+    """
+    2 次元配列を ESRI バイナリグリッド (.flt + .hdr) として書き出す
+    値は float32 (リトルエンディアン) のまま tofile で書くため、文字列化のコストがない
+
+    Parameters:
+        output_path: 出力ファイルパス (.flt)
+        raster: (nrows, ncols) の配列（先頭行が北端）
+        header: _rasterize_shp が返すヘッダ辞書
+        crs: 座標参照系（指定すると .prj も出力）
+        cancel: CancelToken（行ブロックごとに確認する）
+        progress: 進捗コールバック（行数を単位に通知する）
+    """
+    data = np.ascontiguousarray(raster, dtype='<f4')
+    if data.shape != (header['nrows'], header['ncols']):
+        raise ValueError(
+            f"配列の形状 {data.shape} がヘッダ ({header['nrows']}, {header['ncols']}) と一致しません"
+        )
+
+    with atomic_output(output_path) as tmp_path:
+        reporter = ProgressReporter(progress)
+        reporter.begin("バイナリグリッド書き出し", total=header['nrows'])
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, header['nrows'], _WRITE_BLOCK_ROWS):
+                check_cancel(cancel)
+                block = data[start:start + _WRITE_BLOCK_ROWS]
+                block.tofile(f)
+                reporter.advance(len(block))
+        reporter.end()
+
+        hdr_path = os.path.splitext(tmp_path)[0] + '.hdr'
+        with open(hdr_path, 'w') as f:
+            f.write(_format_hdr_header(header))
+        _write_prj(tmp_path, crs)
+
+
+def read_flt_grid(flt_path, mode='r'):
+    """
+    ESRI バイナリグリッド (.flt + .hdr) をメモリマップで開く
+    データはコピーせずに参照するため、巨大なグリッドでもディスク速度で読める
+
+    Parameters:
+        flt_path: 入力ファイルパス (.flt)
+        mode: np.memmap のモード ('r' 読み取り専用, 'r+' 書き込み可, 'c' コピーオンライト)
+
+    Returns:
+        tuple: (numpy.memmap (nrows, ncols), ヘッダ辞書（'transform' を含む）)
+    """
+    hdr_path = os.path.splitext(flt_path)[0] + '.hdr'
+    with open(hdr_path) as f:
+        header = _parse_grid_header(f)
+
+    dtype = '>f4' if header['byteorder'] == 'MSBFIRST' else '<f4'
+    expected = header['nrows'] * header['ncols'] * 4
+    actual = os.path.getsize(flt_path)
+    if actual != expected:
+        raise ValueError(
+            f"{flt_path} のサイズ ({actual} バイト) がヘッダから計算したサイズ ({expected} バイト) と一致しません"
+        )
+    raster = np.memmap(flt_path, dtype=dtype, mode=mode,
+                       shape=(header['nrows'], header['ncols']))
+    return raster, header
+
+
+# ASCII Grid のデータ部を一度に読むバイト数
+_ASC_CHUNK_BYTES = 64 * 1024 * 1024
+# 固定幅のデータ部を一度に数値化する値の数（作業配列が CPU キャッシュに収まる大きさ）
+_FIXED_BLOCK_VALUES = 32 * 1024
+# 書き出し時にキャンセルを確認する行数
+_WRITE_BLOCK_ROWS = 1024
+_GRID_HEADER_KEYS = (
+    b'ncols', b'nrows', b'xllcorner', b'yllcorner', b'xllcenter', b'yllcenter',
+    b'cellsize', b'dx', b'dy', b'nodata_value',
+)
+
+
+def read_ascii_grid(asc_path, dtype='float32', chunk_bytes=_ASC_CHUNK_BYTES):
+    """
+    ESRI ASCII Grid (.asc) を読み込む
+    データ部はチャンク単位でまとめて数値化するため、巨大なグリッドでもメモリを圧迫しない
+    write_ascii_grid の '%12.3f' のような固定幅の書式はバイト列のまま一括で数値化し
+    （_read_grid_fixed）、固定幅でないファイルだけを行単位（np.loadtxt）で読む
+    ヘッダは標準の cellsize と本プロジェクトの dx/dy の両方に対応する
+
+    Parameters:
+        asc_path: 入力ファイルパス (.asc)
+        dtype: 返す配列の型
+        chunk_bytes: 1 回に読み込むおおよそのバイト数
+
+    Returns:
+        tuple: (numpy.ndarray (nrows, ncols), ヘッダ辞書（'transform' を含む）)
+    """
+    with open(asc_path, 'rb') as f:
+        # ヘッダ行（キーワードで始まる行）を読み取る
+        header_lines = []
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            key = line.split(maxsplit=1)[0].lower() if line.strip() else b''
+            if key not in _GRID_HEADER_KEYS:
+                f.seek(pos)
+                break
+            header_lines.append(line.decode('ascii'))
+        header = _parse_grid_header(header_lines)
+
+        data_start = f.tell()
+        try:
+            raster = _read_grid_fixed(f, header, dtype, chunk_bytes)
+        except ValueError:
+            # 固定幅でない（値ごとに桁数が異なる・指数表記を含むなど）ファイルは行単位のチャンクで読む
+            f.seek(data_start)
+            try:
+                raster = _read_grid_rows(f, header, dtype, chunk_bytes)
+            except ValueError:
+                # 行の折り返しが異なるファイルは数値の並びとして読み直す
+                f.seek(data_start)
+                raster = _read_grid_tokens(f, header, dtype, chunk_bytes)
+
+    return raster, header
+
+
+def _fixed_width_layout(line, ncols):
+    """
+    データ部の 1 行目から、値が同じ幅で 1 文字の空白区切りに並ぶ書式のレイアウトを求める
+    （'%12.3f' なら幅 12・小数点は 9 文字目）。その書式でなければ None
+    """
+    content = line.rstrip(b'\r\n')
+    terminator = line[len(content):]
+    if not terminator or ncols <= 0 or (len(content) + 1) % ncols:
+        return None
+    stride = (len(content) + 1) // ncols
+    width = stride - 1
+    dot = content[:width].find(b'.')
+    n_int = width if dot < 0 else dot
+    n_frac = 0 if dot < 0 else width - 1 - dot
+    # 整数部・小数部とも 8 バイトの語 1 つに収まる場合だけ扱う（合計 15 桁以内なら float64 で正確）
+    if not 1 <= n_int <= 8 or n_frac > 7:
+        return None
+    return {
+        'row_bytes': len(line),
+        'stride': stride,
+        'dot': None if dot < 0 else dot,
+        'n_int': n_int,
+        'n_frac': n_frac,
+        'terminator': np.frombuffer(terminator, dtype=np.uint8),
+    }
+
+
+def _bytes_of(value):
+    """8 バイトすべてが value の uint64"""
+    return np.uint64(0x0101010101010101 * value)
+
+
+def _combine_digits(d):
+    """8 バイトの各バイトの数字（0〜9、先頭の文字が下位バイト）を 8 桁の整数にする（d を書き換える）"""
+    t = d >> np.uint64(8)
+    d *= np.uint64(10)
+    d += t
+    d &= np.uint64(0x00FF00FF00FF00FF)
+    t = d >> np.uint64(16)
+    d *= np.uint64(100)
+    d += t
+    d &= np.uint64(0x0000FFFF0000FFFF)
+    t = d >> np.uint64(32)
+    d *= np.uint64(10000)
+    d += t
+    d &= np.uint64(0xFFFFFFFF)
+    return d
+
+
+def _parse_fixed_rows(buf, first_row, nrows, ncols, layout):
+    """
+    前後に 8 バイトの空白を足したバイト列 buf の first_row 行目から nrows 行を数値化する
+    各値の整数部・小数部を 8 バイトの語として読み、語単位のビット演算で書式を検査して数値にする
+    （書式が崩れた値があれば ValueError）
+
+    Returns:
+        numpy.ndarray: (nrows, ncols) の float64 配列（float(文字列) と同じ値）
+    """
+    row_bytes, stride = layout['row_bytes'], layout['stride']
+    dot, n_int, n_frac = layout['dot'], layout['n_int'], layout['n_frac']
+    base = 8 + first_row * row_bytes
+    rows = buf[base:base + nrows * row_bytes].reshape(nrows, row_bytes)
+    if ncols > 1 and not (rows[:, stride - 1:ncols * stride - 1:stride] == 32).all():
+        raise ValueError("値の区切りが固定幅ではありません")
+    if not (rows[:, ncols * stride - 1:] == layout['terminator']).all():
+        raise ValueError("行末が固定幅ではありません")
+
+    def words(offset, dtype='<u8'):
+        return np.ndarray((nrows, ncols), dtype=dtype, buffer=buf, offset=base + offset,
+                          strides=(row_bytes, stride)).ravel()
+
+    # 整数部（右詰め）の末尾までの 8 バイト。値の前にはみ出した部分は空白とみなす
+    v = words(n_int - 8)
+    if n_int < 8:
+        keep = np.uint64(0xFFFFFFFFFFFFFFFF) << np.uint64(8 * (8 - n_int))
+        v &= keep
+        v |= _bytes_of(0x20) & ~keep
+    # 0x20〜0x3F 以外のバイトを含む値は不正
+    bad = (v & _bytes_of(0xE0)) != _bytes_of(0x20)
+    # 数字のバイトを 0xFF にしたマスク（0x3A〜0x3F は +6 で 0x10 のビットが落ちるので除く）
+    digits = v >> np.uint64(4)
+    digits &= _bytes_of(0x01)
+    digits *= np.uint64(0xFF)
+    t = v + _bytes_of(0x06)
+    t &= digits
+    t &= _bytes_of(0x10)
+    bad |= t != (digits & _bytes_of(0x10))
+    # 整数部は「空白、'-'（省略可）、1 桁以上の数字」の並び
+    bad |= (digits >> np.uint64(56)) != np.uint64(0xFF)
+    t = digits << np.uint64(8)
+    t &= ~digits
+    bad |= t != 0
+    rest = v & ~digits
+    rest &= _bytes_of(0x0F)
+    sign = digits >> np.uint64(8)
+    sign &= ~digits
+    sign &= _bytes_of(0x0D)
+    negative = rest != 0
+    bad |= negative & (rest != sign)
+    v &= digits
+    v &= _bytes_of(0x0F)
+    mantissa = _combine_digits(v).view(np.int64)
+
+    if dot is not None:
+        bad |= words(dot, 'u1') != ord('.')
+    if n_frac:
+        # 小数部は小数点の次から n_frac 桁の数字。語の残りは '0' で埋めて 8 桁として組み立てる
+        f = words(dot + 1)
+        keep = (np.uint64(1) << np.uint64(8 * n_frac)) - np.uint64(1)
+        f &= keep
+        f |= _bytes_of(0x30) & ~keep
+        bad |= (f & _bytes_of(0xF0)) != _bytes_of(0x30)
+        t = f + _bytes_of(0x06)
+        t &= _bytes_of(0xF0)
+        bad |= t != _bytes_of(0x30)
+        f &= _bytes_of(0x0F)
+        fraction = _combine_digits(f)
+        fraction //= np.uint64(10 ** (8 - n_frac))
+        mantissa *= 10 ** n_frac
+        mantissa += fraction.view(np.int64)
+    if bad.any():
+        raise ValueError("固定幅の書式に合わない値があります")
+
+    # 15 桁以内の整数を 10 のべき乗で割るため、文字列から変換した場合と同じ値になる
+    values = mantissa / 10.0 ** n_frac
+    np.negative(values, out=values, where=negative)
+    return values.reshape(nrows, ncols)
+
+
+def _read_grid_fixed(f, header, dtype, chunk_bytes):
+    """
+    固定幅の書式（_fixed_width_layout）のデータ部を、バイト列のまま一括で数値化する
+    固定幅でない・書式が崩れた値がある場合は ValueError
+    """
+    nrows, ncols = header['nrows'], header['ncols']
+    start = f.tell()
+    layout = _fixed_width_layout(f.readline(), ncols)
+    if layout is None:
+        raise ValueError("データ部が固定幅ではありません")
+    f.seek(start)
+    row_bytes = layout['row_bytes']
+    raster = np.empty((nrows, ncols), dtype=dtype)
+    rows_per_read = max(1, chunk_bytes // row_bytes)
+    rows_per_block = max(1, _FIXED_BLOCK_VALUES // ncols)
+    for first in range(0, nrows, rows_per_read):
+        n = min(rows_per_read, nrows - first)
+        data = f.read(n * row_bytes)
+        if first + n == nrows and len(data) == n * row_bytes - len(layout['terminator']):
+            # 最終行に改行が無いファイル
+            data += layout['terminator'].tobytes()
+        if len(data) != n * row_bytes:
+            raise ValueError("行数がヘッダと一致しません")
+        # 語単位で読むときにバイト列の前後にはみ出すため、8 バイトずつ空白を足す
+        buf = np.full(len(data) + 16, 32, dtype=np.uint8)
+        buf[8:-8] = np.frombuffer(data, dtype=np.uint8)
+        for row in range(0, n, rows_per_block):
+            m = min(rows_per_block, n - row)
+            raster[first + row:first + row + m] = _parse_fixed_rows(buf, row, m, ncols, layout)
+    if f.read().strip():
+        raise ValueError("行数がヘッダと一致しません")
+    return raster
+
+
+def _read_grid_rows(f, header, dtype, chunk_bytes):
+    """データ部を行単位のチャンクで読む（列数が揃っていない場合は ValueError）"""
+    nrows, ncols = header['nrows'], header['ncols']
+    raster = np.empty((nrows, ncols), dtype=dtype)
+    # 1 値あたり 13 バイト程度（'%12.3f' + 区切り）として 1 チャンクの行数を決める
+    rows_per_chunk = max(1, chunk_bytes // (13 * ncols))
+    filled = 0
+    while filled < nrows:
+        block = np.loadtxt(f, dtype=dtype, max_rows=min(rows_per_chunk, nrows - filled), ndmin=2)
+        if block.size == 0:
+            break
+        if block.shape[1] != ncols:
+            raise ValueError("列数がヘッダと一致しません")
+        raster[filled:filled + len(block)] = block
+        filled += len(block)
+    if filled != nrows or f.read().strip():
+        raise ValueError("行数がヘッダと一致しません")
+    return raster
+
+
+def _read_grid_tokens(f, header, dtype, chunk_bytes):
+    """データ部を空白区切りの数値の並びとしてチャンク単位で読む"""
+    total = header['nrows'] * header['ncols']
+    values = np.empty(total, dtype=dtype)
+    filled = 0
+    remainder = b''
+    while True:
+        block = f.read(chunk_bytes)
+        if not block:
+            text = remainder
+            remainder = b''
+        else:
+            # 数値の途中で切れないよう、最後の空白までを今回の処理範囲にする
+            block = remainder + block
+            cut = max(block.rfind(b' '), block.rfind(b'\n'), block.rfind(b'\t'))
+            if cut < 0:
+                remainder = block
+                continue
+            text, remainder = block[:cut], block[cut:]
+        # 空白だけの断片は np.fromstring が不正な値を返すため読み飛ばす
+        if text.strip():
+            parsed = np.fromstring(text.decode('ascii'), sep=' ')
+            if filled + len(parsed) > total:
+                raise ValueError(
+                    f"データ数がヘッダ ({header['nrows']} x {header['ncols']}) より多いです"
+                )
+            values[filled:filled + len(parsed)] = parsed
+            filled += len(parsed)
+        if not block:
+            break
+
+    if filled != total:
+        raise ValueError(
+            f"データ数 ({filled}) がヘッダ ({header['nrows']} x {header['ncols']}) と一致しません"
+        )
+    return values.reshape(header['nrows'], header['ncols'])
+
+
+def mesh_to_ascii(mesh, field, output_path, nodata=-9999, cancel=None, progress=None):
+    """
+    MeshGrid（src.common.mesh_grid）の属性を ESRI ASCII Grid (.asc) として書き出す
+    配列をそのまま書くためラスタ化は行わない（セルの無い位置と NaN は nodata）。
+    ヘッダと値の丸めは shp_to_ascii と同じ。mesh.crs があれば .prj も出力する
+
+    Returns:
+        tuple: (ncols, nrows, dx, dy)
+    """
+    header = grid_header(mesh.bounds, mesh.ncols, mesh.nrows, nodata)
+    raster = np.array(mesh[field], dtype='float32')
+    raster[~mesh.cell_mask | np.isnan(raster)] = nodata
+    round_grid_values(raster, nodata)
+    crs = None if mesh.crs is None else CRS.from_user_input(mesh.crs)
+    write_ascii_blocks(output_path, [raster], header, crs, cancel, progress)
+    return header['ncols'], header['nrows'], header['dx'], header['dy']
+
+
+def read_ascii_mesh(asc_path, field='value', drop_nodata=False, crs=None):
+    """
+    ESRI ASCII Grid (.asc) を MeshGrid（src.common.mesh_grid）として読み込む（ポリゴンは作らない）
+    格子線は ascii_to_mesh と同じ。drop_nodata=True なら NODATA のセルを mask で除く
+
+    Returns:
+        MeshGrid: field に値（float32）を持つメッシュ
+    """
+    from src.common.mesh_grid import MeshGrid
+
+    raster, header = read_ascii_grid(asc_path)
+    if crs is None:
+        prj_path = os.path.splitext(asc_path)[0] + '.prj'
+        if os.path.exists(prj_path):
+            with open(prj_path) as f:
+                crs = CRS.from_user_input(f.read())
+    extent = (
+        header['xllcorner'],
+        header['yllcorner'],
+        header['xllcorner'] + header['ncols'] * header['dx'],
+        header['yllcorner'] + header['nrows'] * header['dy'],
     )
-    with open(output_path, 'w') as f:
-        f.write(header)
-        np.savetxt(f, raster, fmt='%12.3f')
+    mesh = MeshGrid.from_bounds(extent, header['ncols'], header['nrows'], crs)
+    mesh[field] = raster
+    nodata = header['NODATA_value']
+    if drop_nodata and nodata is not None:
+        mesh.mask = raster != nodata
+    return mesh
 
-    # 実際のグリッド数を返す
-    return ncols, nrows, dx, dy
 
+def ascii_to_mesh(asc_path, output_path=None, field='value', drop_nodata=False, crs=None):
+    """
+    ESRI ASCII Grid (.asc) からセルごとのメッシュ（ポリゴン）を再構築する
+    メッシュは generate_mesh.build_grid で生成するため、セルの並びはメッシュ生成と同じになる
+
+    Parameters:
+        asc_path: 入力ファイルパス (.asc)
+        output_path: 出力シェープファイルパス（省略時は書き出さない）
+        field: 値を格納する属性フィールド名
+        drop_nodata: True の場合 NODATA のセルを出力しない
+        crs: 座標参照系（省略時は同名の .prj から読み取る）
+
+    Returns:
+        geopandas.GeoDataFrame: セルメッシュ
+    """
+    # 循環 import を避けるためここで読み込む
+    from src.make_shp.generate_mesh import build_grid
+
+    raster, header = read_ascii_grid(asc_path)
+    ncols, nrows = header['ncols'], header['nrows']
+
+    if crs is None:
+        prj_path = os.path.splitext(asc_path)[0] + '.prj'
+        if os.path.exists(prj_path):
+            with open(prj_path) as f:
+                crs = CRS.from_user_input(f.read())
+
+    extent = (
+        header['xllcorner'],
+        header['yllcorner'],
+        header['xllcorner'] + ncols * header['dx'],
+        header['yllcorner'] + nrows * header['dy'],
+    )
+    mesh = build_grid(extent, ncols, nrows, crs)
+    # build_grid は X 方向が外側・Y 方向（下から上）が内側の順で並ぶ
+    mesh[field] = raster[::-1, :].T.ravel()
+
+    nodata = header['NODATA_value']
+    if drop_nodata and nodata is not None:
+        mesh = mesh[mesh[field] != nodata].reset_index(drop=True)
+
+    if output_path:
+        out_dir = os.path.dirname(output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        mesh.to_file(output_path)
+    return mesh
@@ -1,12 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import fiona
+import gc
 import os
 import threading
 import queue
 
 # 絶対インポートに変更
-from src.shp_to_asc.core import analyze_grid_structure, shp_to_ascii
+from src.common.metadata import probe_layer_fields, run_probe
+from src.common.progress import format_event, overall_fraction
+from src.common.worker import submit
+from src.shp_to_asc.core import analyze_grid_structure
 
 # デフォルトのNODATA値
 DEFAULT_NODATA = -9999
@@ -24,6 +27,7 @@ class ShpToAscApp(ttk.Frame):
         
         # メッセージキューを初期化
         self.message_queue = queue.Queue()
+        self.job = None
         
         # ウィジェットを作成
         self.create_widgets()
@@ -84,21 +88,47 @@ class ShpToAscApp(ttk.Frame):
         self.status_var = tk.StringVar()
         ttk.Label(self, textvariable=self.status_var, anchor='w').grid(row=6, column=0, columnspan=2, sticky='we', padx=5, pady=10)
 
-        self.run_button = ttk.Button(self, text="実行", command=self.run_conversion, width=BUTTON_WIDTH)
-        self.run_button.grid(row=6, column=2, sticky='e', padx=5, pady=10)
+        button_frame = ttk.Frame(self)
+        button_frame.grid(row=6, column=2, sticky='e', padx=5, pady=10)
+        self.run_button = ttk.Button(button_frame, text="実行", command=self.run_conversion, width=BUTTON_WIDTH)
+        self.run_button.pack(side='left')
+        self.cancel_button = ttk.Button(button_frame, text="キャンセル", command=self.cancel_conversion,
+                                        width=BUTTON_WIDTH, state='disabled')
+        self.cancel_button.pack(side='left', padx=(5, 0))
+
+        # --- 進捗バー ---
+        self.progress_var = tk.DoubleVar(value=0.0)
+        ttk.Progressbar(self, variable=self.progress_var, maximum=100)\
+            .grid(row=7, column=0, columnspan=3, sticky='we', padx=5, pady=(0, 10))
 
     def select_input(self):
         path = filedialog.askopenfilename(filetypes=[("Shapefile", "*.shp")])
         if not path:
             return
         self.input_path_var.set(path)
-        try:
-            with fiona.open(path) as src:
-                fields = list(src.schema['properties'].keys())
-            self.field_cb['values'] = fields
-        except Exception as e:
-            messagebox.showerror("エラー", f"シェープファイル読み込み失敗:\n{e}")
+        # フィールド一覧はスキーマだけをワーカースレッドで読み込む
+        run_probe(
+            self, probe_layer_fields, (path,),
+            lambda fields: self._apply_fields(path, fields),
+            lambda e: self._fields_failed(path, e),
+        )
+
+    def _apply_fields(self, path, fields):
+        # 取得中に別のファイルが選択された場合は古い結果を捨てる
+        if path != self.input_path_var.get():
             return
+        self.field_cb['values'] = fields
+        # グリッド解析は大きなメッシュだと時間がかかるためバックグラウンドで実行
+        self.grid_info_var.set("グリッド情報を解析中...")
+        threading.Thread(target=self._analyze_grid, args=(path,), daemon=True).start()
+
+    def _fields_failed(self, path, e):
+        if path != self.input_path_var.get():
+            return
+        messagebox.showerror("エラー", f"シェープファイル読み込み失敗:\n{e}")
+
+    def _analyze_grid(self, path):
+        """グリッド構造を解析し、結果をキュー経由でUIへ渡す内部メソッド"""
         try:
             grid_info = analyze_grid_structure(path)
             info_text = (
@@ -107,10 +137,9 @@ class ShpToAscApp(ttk.Frame):
                 f"範囲: X={grid_info['extent'][0]:.6f}〜{grid_info['extent'][2]:.6f}, "
                 f"Y={grid_info['extent'][1]:.6f}〜{grid_info['extent'][3]:.6f}"
             )
-            self.grid_info_var.set(info_text)
+            self.message_queue.put(('grid_info', path, info_text))
         except Exception as e:
-            self.grid_info_var.set("グリッド情報取得エラー")
-            messagebox.showwarning("警告", f"セルサイズ自動計算失敗:\n{e}")
+            self.message_queue.put(('grid_error', path, str(e)))
 
     def select_output_file(self):
         input_shp = self.input_path_var.get()
@@ -133,12 +162,39 @@ class ShpToAscApp(ttk.Frame):
                 message = self.message_queue.get_nowait()
                 if message[0] == 'status':
                     self.status_var.set(message[1])
-                elif message[0] == 'enable_button':
-                    self.run_button.config(state='normal')
+                elif message[0] == 'progress':
+                    self.progress_var.set(overall_fraction(message[1]) * 100)
+                    self.status_var.set(format_event(message[1]))
+                elif message[0] == 'success':
+                    self._finish_conversion()
+                    self.status_var.set("完了")
+                    self.progress_var.set(100.0)
+                    ncols, nrows, dx, dy = message[1]
+                    messagebox.showinfo(
+                        "完了",
+                        f"変換が完了しました。\n\n"
+                        f"出力先: {self.conversion_output}\n"
+                        f"セル数: {ncols} × {nrows}\n"
+                        f"セルサイズ: dx={dx:.12f}, dy={dy:.12f}"
+                    )
                 elif message[0] == 'error':
-                    messagebox.showerror("エラー", message[1])
-                    self.run_button.config(state='normal')
+                    messagebox.showerror("エラー", f"変換中にエラーが発生しました:\n{message[1]}")
+                    self._finish_conversion()
                     self.status_var.set("エラーが発生しました")
+                elif message[0] == 'cancelled':
+                    self._finish_conversion()
+                    # 中断した処理の中間データを解放する
+                    gc.collect()
+                    self.status_var.set(message[1])
+                    self.progress_var.set(0.0)
+                elif message[0] in ('grid_info', 'grid_error'):
+                    # 解析中に別のファイルが選択された場合は古い結果を捨てる
+                    if message[1] == self.input_path_var.get():
+                        if message[0] == 'grid_info':
+                            self.grid_info_var.set(message[2])
+                        else:
+                            self.grid_info_var.set("グリッド情報取得エラー")
+                            messagebox.showwarning("警告", f"セルサイズ自動計算失敗:\n{message[2]}")
                 
                 self.message_queue.task_done()
         except queue.Empty:
@@ -176,15 +232,18 @@ class ShpToAscApp(ttk.Frame):
             
             # ボタンを無効化して処理中状態に
             self.run_button.config(state='disabled')
+            self.cancel_button.config(state='normal')
             self.status_var.set("処理中...")
+            self.progress_var.set(0.0)
             self.update()  # UIを即時更新
 
-            # バックグラウンドで実行
-            threading.Thread(
-                target=self._run_conversion,
-                args=(shp_path, field, output_path, nodata),
-                daemon=True
-            ).start()
+            # 変換はワーカープロセス（ランチャーから起動した場合）またはスレッドで実行する
+            self.conversion_output = output_path
+            self.job = submit(
+                'src.shp_to_asc.core:shp_to_ascii',
+                dict(shp_path=shp_path, field=field, output_path=output_path, nodata=nodata),
+                lambda kind, data: self.message_queue.put((kind, data)),
+            )
 
         except ValueError as e:
             self.status_var.set("エラー: NoData値が無効です")
@@ -195,32 +254,18 @@ class ShpToAscApp(ttk.Frame):
             messagebox.showerror("エラー", f"予期せぬエラーが発生しました: {e}")
             self.run_button.config(state='normal')
 
-    def _run_conversion(self, shp_path, field, output_path, nodata):
-        """変換を実行する内部メソッド"""
-        try:
-            self.update_status("処理中...")
-            # グリッド情報を取得
-            grid_info = analyze_grid_structure(shp_path)
-            
-            self.update_status("処理中...")
-            # 変換を実行
-            ncols, nrows, dx, dy = shp_to_ascii(shp_path, field, output_path, nodata)
-            
-            # 完了メッセージをキューに追加
-            self.message_queue.put(('status', '完了'))
-            self.message_queue.put(('enable_button', True))
-            
-            # 結果を表示
-            messagebox.showinfo(
-                "完了",
-                f"変換が完了しました。\n\n"
-                f"出力先: {output_path}\n"
-                f"セル数: {ncols} × {nrows}\n"
-                f"セルサイズ: dx={dx:.12f}, dy={dy:.12f}"
-            )
-            
-        except Exception as e:
-            self.message_queue.put(('error', f"変換中にエラーが発生しました:\n{str(e)}"))
+    def cancel_conversion(self):
+        """実行中の変換にキャンセルを要求する（区切りのよいところで中断される）"""
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_button.config(state='disabled')
+            self.status_var.set("キャンセル中...")
+
+    def _finish_conversion(self):
+        """変換終了時にボタンの状態を元に戻す"""
+        self.run_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        self.job = None
 
     def _check_queue(self):
         """キューをチェックしてGUIを更新する"""
@@ -1,6 +1,7 @@
 # utils.py
 import os
 import fiona
+import numpy as np
 from pyproj import CRS
 
 def get_available_filename(directory, basename, ext):
@@ -51,3 +52,54 @@ def read_crs(shp_path):
         # 最終フォールバック: WKTの1行目だけ返す
         raw = src.crs_wkt or str(src.crs)
         return raw.split('\n')[0]
+
+
+# .shp のシェイプタイプ（Null / Point 系 / bbox を持つ系）
+_SHP_NULL = 0
+_SHP_POINT_TYPES = (1, 11, 21)
+# 1 度に gather するレコード数（インデックス配列が大きくなりすぎないように）
+_SHP_CHUNK = 65536
+
+
+def read_shp_bounds(shp_path):
+    """
+    シェープファイルの各フィーチャのバウンディングボックスを一括で返す。
+    .shx のオフセットと .shp のレコードヘッダ（bbox）だけを読み、
+    属性（.dbf）やジオメトリ本体はデコードしない。
+
+    Args:
+        shp_path: 入力シェープファイルのパス
+
+    Returns:
+        numpy.ndarray: (N, 4) の配列 [minx, miny, maxx, maxy]。Null シェイプは除外。
+    """
+    shx_path = os.path.splitext(shp_path)[0] + '.shx'
+    if not shp_path.lower().endswith('.shp') or not os.path.exists(shx_path):
+        # .shx が無い / シェープファイル以外は geopandas でジオメトリのみ読む
+        import geopandas as gpd
+        gdf = gpd.read_file(shp_path, columns=[])
+        return gdf.geometry.bounds.to_numpy(dtype='float64')
+
+    # .shx: 100 バイトのヘッダの後に (offset, content length) が big-endian int32、16bit ワード単位で並ぶ
+    index = np.fromfile(shx_path, dtype='>i4', offset=100).reshape(-1, 2)
+    offsets = index[:, 0].astype(np.int64) * 2
+
+    data = np.memmap(shp_path, dtype=np.uint8, mode='r')
+    try:
+        # レコードヘッダ 8 バイトの直後: シェイプタイプ (int32 LE) → bbox (double LE x4)
+        type_cols = np.arange(4)
+        box_cols = np.arange(32)
+        types = np.empty(len(offsets), dtype='<i4')
+        bounds = np.empty((len(offsets), 4), dtype='<f8')
+        for start in range(0, len(offsets), _SHP_CHUNK):
+            chunk = offsets[start:start + _SHP_CHUNK, None] + 8
+            types[start:start + len(chunk)] = data[chunk + type_cols].view('<i4')[:, 0]
+            is_point = np.isin(types[start:start + len(chunk)], _SHP_POINT_TYPES)
+            # Point 系は bbox を持たないので x, y を読んで (x, y, x, y) とする
+            raw = data[np.minimum(chunk + 4 + box_cols, len(data) - 1)].view('<f8')
+            raw[is_point, 2:] = raw[is_point, :2]
+            bounds[start:start + len(chunk)] = raw
+    finally:
+        del data
+
+    return np.ascontiguousarray(bounds[types != _SHP_NULL], dtype='float64')
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+ランチャーの起動時間チェック
+
+ランチャー（src/app.py, src/app2.py）のインポートにかかる時間を別プロセスで計測し、
+重いモジュール（geopandas など）が起動時に読み込まれていないこと、
+インポート時間が予算内であることを確認する。問題があれば終了コード 1 を返す。
+
+使用方法:
+    python tests/check_startup.py [--budget 秒] [--repeat 回数]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# プロジェクトのルートディレクトリ
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+LAUNCHER_MODULES = ('src.app', 'src.app2')
+
+# ランチャーの起動時に読み込まれてはいけないモジュール
+HEAVY_MODULES = ('geopandas', 'rasterio', 'fiona', 'pyproj', 'pandas', 'shapely')
+
+# 子プロセスで実行する計測スクリプト
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+loaded = sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy!r}))
+print(json.dumps({{'elapsed': elapsed, 'loaded': loaded}}))
+"""
+
+
+def measure_startup(modules=LAUNCHER_MODULES, heavy=HEAVY_MODULES):
+    """新しいプロセスでモジュールをインポートし、所要時間と読み込まれた重いモジュールを返す"""
+    code = _PROBE.format(modules=tuple(modules), heavy=tuple(heavy))
+    proc = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=project_root, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ランチャーの起動時間チェック')
+    parser.add_argument('--budget', type=float, default=0.5, help='インポート時間の上限（秒、デフォルト: 0.5）')
+    parser.add_argument('--repeat', type=int, default=3, help='計測回数（最小値で判定、デフォルト: 3）')
+    args = parser.parse_args(argv)
+
+    results = [measure_startup() for _ in range(max(args.repeat, 1))]
+    best = min(r['elapsed'] for r in results)
+    loaded = sorted({m for r in results for m in r['loaded']})
+
+    print(f"インポート時間: {best:.3f}s (予算 {args.budget:.3f}s)")
+    ok = True
+    if loaded:
+        print(f"NG: 起動時に重いモジュールが読み込まれています: {', '.join(loaded)}")
+        ok = False
+    if best > args.budget:
+        print("NG: インポート時間が予算を超えています")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+pytest の共通設定
+テストから src パッケージを読み込めるよう、プロジェクトのルートを sys.path に加える
+"""
+import os
+import sys
+
+# プロジェクトのルートディレクトリ
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
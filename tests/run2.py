@@ -16,6 +16,7 @@
 import argparse
 import sys
 import os
+from src.common.progress import ConsoleProgress
 from src.shp_to_asc.core import shp_to_ascii
 
 def parse_args():
@@ -88,7 +89,7 @@ def main():
             print(f"  範囲: {kwargs['bounds']}")
         
         # 変換を実行
-        ncols, nrows, dx, dy = shp_to_ascii(**kwargs)
+        ncols, nrows, dx, dy = shp_to_ascii(**kwargs, progress=ConsoleProgress())
         
         print(f"変換が完了しました。")
         print(f"  グリッドサイズ: {ncols} × {nrows} セル")
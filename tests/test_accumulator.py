@@ -0,0 +1,78 @@
+"""
+QuantileSketch（src.common.accumulator）の分位点を np.quantile と比べるテスト
+
+スケッチの分位点の誤差は resolution / 2 以内になる。値を何回かに分けて加えた場合・
+別のスケッチと合わせた場合・保存した配列から作り直した場合も同じ誤差に収まることを確認する。
+
+使用方法:
+    python -m pytest tests/test_accumulator.py
+"""
+import numpy as np
+import pytest
+
+from src.common.accumulator import QuantileSketch
+
+RESOLUTION = 0.01
+# セルの数（最後の 2 セルには値を入れない）
+N_CELLS = 50
+QUANTILES = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+
+
+def _values(seed=0, n=20_000):
+    """セルごとに値の範囲と個数が異なる (セル番号, 値) を返す"""
+    rng = np.random.default_rng(seed)
+    cells = rng.integers(0, N_CELLS - 2, n)
+    values = rng.normal(100.0 * cells - 2000.0, 1.0 + cells, n)
+    # 区間の境界ちょうどの値と、同じ値の重複も含める
+    values[:500] = np.round(values[:500], 2)
+    values[500:700] = values[0]
+    # 値が 1 つだけのセル・2 つだけのセル
+    cells[cells == 0] = 1
+    cells[:1], values[:1] = 0, 12.345
+    cells[cells == N_CELLS - 3] = 1
+    cells[1:3], values[1:3] = N_CELLS - 3, [-5.0, 7.5]
+    return cells, values
+
+
+def _assert_within_bound(sketch, cells, values):
+    for q in QUANTILES:
+        result = sketch.quantile(q, N_CELLS)
+        for cell in range(N_CELLS):
+            cell_values = values[cells == cell]
+            if len(cell_values) == 0:
+                assert np.isnan(result[cell])
+                continue
+            expected = np.quantile(cell_values, q)
+            assert abs(result[cell] - expected) <= RESOLUTION / 2 + 1e-9, (q, cell)
+
+
+def test_quantile_within_half_resolution():
+    cells, values = _values()
+    sketch = QuantileSketch(RESOLUTION)
+    sketch.add(cells, values)
+    _assert_within_bound(sketch, cells, values)
+
+
+def test_quantile_with_chunked_adds_and_merge():
+    cells, values = _values(seed=1)
+    order = np.random.default_rng(2).permutation(len(cells))
+    first, second = QuantileSketch(RESOLUTION), QuantileSketch(RESOLUTION)
+    for chunk in np.array_split(order, 7):
+        target = first if chunk[0] % 2 else second
+        target.add(cells[chunk], values[chunk])
+    first.merge(second)
+    _assert_within_bound(first, cells, values)
+
+    # 保存した配列から作り直しても同じ分位点になる
+    restored = QuantileSketch(RESOLUTION, *first.arrays())
+    for q in QUANTILES:
+        np.testing.assert_array_equal(restored.quantile(q, N_CELLS), first.quantile(q, N_CELLS))
+
+
+def test_merge_rejects_different_resolution():
+    with pytest.raises(ValueError):
+        QuantileSketch(RESOLUTION).merge(QuantileSketch(RESOLUTION * 2))
+
+
+def test_empty_sketch_is_nan():
+    assert np.isnan(QuantileSketch(RESOLUTION).quantile(0.5, 3)).all()
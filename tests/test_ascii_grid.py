@@ -0,0 +1,169 @@
+"""
+read_ascii_grid（src.shp_to_asc.core）のデータ部の読み込みを np.loadtxt と比べるテスト
+
+固定幅の書式はバイト列のまま数値化し（_parse_fixed_rows）、それ以外は行単位（np.loadtxt）・
+数値の並び（_read_grid_tokens）の順に読み直す。どの経路でも np.loadtxt と同じ値になることを確認する。
+
+使用方法:
+    python -m pytest tests/test_ascii_grid.py
+"""
+import io
+
+import numpy as np
+import pytest
+
+from src.shp_to_asc import core
+
+NODATA = -9999
+
+
+def _write_grid(path, body, ncols, nrows, newline='\n'):
+    """ヘッダとデータ部 body（改行は '\\n'）を newline の改行で書き出す"""
+    header = (f"ncols {ncols}\nnrows {nrows}\nxllcorner 0.0\nyllcorner 0.0\n"
+              f"cellsize 1.0\nNODATA_value {NODATA}\n")
+    path.write_bytes((header + body).replace('\n', newline).encode('ascii'))
+    return path
+
+
+def _format_rows(values, fmt):
+    """write_ascii_grid と同じく、値を fmt で 1 文字の空白区切りに並べた行にする"""
+    return ''.join(' '.join(fmt % v for v in row) + '\n' for row in values)
+
+
+def _signed_values(nrows, ncols, scale=1000.0, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(-scale, scale, (nrows, ncols))
+    # 0 付近の負の値（'-0.123' のように整数部が '-0' になる値）と 0 も含める
+    values[0, :3] = [-0.123, 0.0, 0.5]
+    return values
+
+
+@pytest.fixture
+def fixed_only(monkeypatch):
+    """固定幅の経路だけで読めること（行単位・数値の並びの経路を使わないこと）を確認する"""
+    def fail(*args, **kwargs):
+        raise AssertionError("固定幅の経路で読めていません")
+    monkeypatch.setattr(core, '_read_grid_rows', fail)
+    monkeypatch.setattr(core, '_read_grid_tokens', fail)
+
+
+@pytest.mark.parametrize('fmt', ['%12.3f', '%10.1f', '%16.7f', '%8.0f'])
+def test_fixed_width_signed_values(tmp_path, fixed_only, fmt):
+    body = _format_rows(_signed_values(23, 17), fmt)
+    path = _write_grid(tmp_path / 'grid.asc', body, 17, 23)
+    raster, header = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+    assert header['ncols'] == 17 and header['nrows'] == 23
+
+
+def test_fixed_width_float32_matches_loadtxt(tmp_path, fixed_only):
+    body = _format_rows(_signed_values(11, 9), '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body, 9, 11)
+    raster, _ = core.read_ascii_grid(path)
+    assert raster.dtype == np.float32
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), dtype='float32', ndmin=2))
+
+
+def test_fixed_width_chunk_and_block_boundaries(tmp_path, fixed_only, monkeypatch):
+    # 読み込みのチャンクと数値化のブロックが行の途中・端数で切れる大きさにする
+    monkeypatch.setattr(core, '_FIXED_BLOCK_VALUES', 7)
+    body = _format_rows(_signed_values(37, 5), '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body, 5, 37)
+    raster, _ = core.read_ascii_grid(path, dtype='float64', chunk_bytes=200)
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_missing_final_newline(tmp_path, fixed_only, newline):
+    body = _format_rows(_signed_values(6, 4), '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body.rstrip('\n'), 4, 6, newline)
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+
+
+def test_crlf_line_endings(tmp_path, fixed_only):
+    body = _format_rows(_signed_values(8, 6), '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body, 6, 8, '\r\n')
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+
+
+def test_exponent_values_fall_back(tmp_path):
+    body = _format_rows(_signed_values(5, 4, scale=1e6), '%12.3e')
+    path = _write_grid(tmp_path / 'grid.asc', body, 4, 5)
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+
+
+def test_free_format_values_fall_back(tmp_path):
+    body = "1 -2.5 3e2\n-0.001 +4 5.25\n"
+    path = _write_grid(tmp_path / 'grid.asc', body, 3, 2)
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+
+
+def test_nan_tokens_fall_back(tmp_path):
+    values = _signed_values(4, 5)
+    values[1, 2] = values[3, 0] = np.nan
+    body = _format_rows(values, '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body, 5, 4)
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+    assert np.isnan(raster[1, 2]) and np.isnan(raster[3, 0])
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_wrapped_rows_fall_back(tmp_path, newline):
+    values = _signed_values(3, 7)
+    tokens = ['%.3f' % v for v in values.ravel()]
+    # 1 行 4 値で折り返す（行の区切りがグリッドの行と一致しない）
+    body = ''.join(' '.join(tokens[i:i + 4]) + '\n' for i in range(0, len(tokens), 4))
+    path = _write_grid(tmp_path / 'grid.asc', body, 7, 3, newline)
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    expected = np.loadtxt(io.StringIO(' '.join(tokens)), ndmin=2).reshape(3, 7)
+    np.testing.assert_array_equal(raster, expected)
+
+
+def test_nodata_in_fixed_width(tmp_path, fixed_only):
+    values = _signed_values(4, 6)
+    values[values < -500] = NODATA
+    body = _format_rows(values, '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body, 6, 4)
+    raster, header = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+    assert header['NODATA_value'] == NODATA
+    assert (raster == NODATA).sum() == (values == NODATA).sum()
+
+
+def test_nodata_written_short_falls_back(tmp_path):
+    # NODATA だけ '-9999' のように小数部なしで書かれたファイルは固定幅ではないため読み直す
+    values = _signed_values(4, 6)
+    values[values < -500] = NODATA
+    body = ''.join(
+        ' '.join(str(NODATA) if v == NODATA else '%12.3f' % v for v in row) + '\n'
+        for row in values
+    )
+    path = _write_grid(tmp_path / 'grid.asc', body, 6, 4)
+    raster, _ = core.read_ascii_grid(path, dtype='float64')
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), ndmin=2))
+    assert (raster == NODATA).sum() == (values == NODATA).sum()
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_row_count_mismatch_raises(tmp_path):
+    body = _format_rows(_signed_values(3, 4), '%12.3f')
+    path = _write_grid(tmp_path / 'grid.asc', body, 4, 5)
+    with pytest.raises(ValueError):
+        core.read_ascii_grid(path)
+
+
+def test_round_trip_with_write_ascii_grid(tmp_path, fixed_only):
+    values = _signed_values(9, 13).astype('float32')
+    header = {'ncols': 13, 'nrows': 9, 'xllcorner': 0.0, 'yllcorner': 0.0,
+              'dx': 1.0, 'dy': 1.0, 'NODATA_value': NODATA}
+    path = tmp_path / 'grid.asc'
+    core.write_ascii_grid(str(path), core.round_grid_values(values.copy(), NODATA), header)
+    raster, _ = core.read_ascii_grid(path)
+    lines = path.read_text(encoding='ascii').splitlines(keepends=True)
+    body = ''.join(lines[len(core._format_grid_header(header).splitlines()):])
+    np.testing.assert_array_equal(raster, np.loadtxt(io.StringIO(body), dtype='float32', ndmin=2))
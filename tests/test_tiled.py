@@ -0,0 +1,176 @@
+"""
+タイル実行（src.make_shp.tiled.pipeline_tiled）の出力が、タイルに分けない pipeline と同じになることを確認するテスト
+
+合成データ（src.benchmark.synthetic）に、格子線上にちょうど乗る点と標高が欠損の点を加えて、
+セル数を割り切らないタイルの大きさで実行する。点群の索引（src.make_shp.point_tiles）を入力にしても、
+CSV を入力にした pipeline と同じ出力になることも確認する。
+
+使用方法:
+    python -m pytest tests/test_tiled.py
+"""
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmark.synthetic import generate_dataset
+from src.make_shp.pipeline import pipeline
+from src.make_shp.tiled import pipeline_tiled
+
+# 計算領域の分割数（TILE_SIZE で割り切れない数）
+CELLS = 23
+TILE_SIZE = 10
+# セルの大きさが整数になる範囲（格子線上の座標が CSV に書いても丸められないようにする）
+EXTENT = (0.0, 0.0, 23_000.0, 23_000.0)
+STATISTICS = ['min', 'max', 'std', 'median']
+OUTPUT_FIELDS = ['elevation', 'pnt_count', 'elev_min', 'elev_max', 'elev_std', 'elev_med']
+
+
+def _quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    """合成データに格子線上の点を加えた点群を作る"""
+    root = tmp_path_factory.mktemp('tiled')
+    paths = generate_dataset(str(root / 'data'), cells=CELLS, n_points=20_000, n_landuse=10,
+                             extent=EXTENT)
+    minx, miny, maxx, maxy = EXTENT
+    xs = np.linspace(minx, maxx, CELLS + 1)
+    ys = np.linspace(miny, maxy, CELLS + 1)
+    rng = np.random.default_rng(1)
+    # 縦の格子線上・横の格子線上・格子点上の点（どのセルにも含まれない）
+    n = 300
+    edge_x = np.concatenate([rng.choice(xs, n), rng.uniform(minx, maxx, n), rng.choice(xs, n)])
+    edge_y = np.concatenate([rng.uniform(miny, maxy, n), rng.choice(ys, n), rng.choice(ys, n)])
+    edges = pd.DataFrame({'x': edge_x, 'y': edge_y, 'elevation': rng.uniform(0, 1000, 3 * n)})
+    points = pd.read_csv(paths['points'])
+    points.loc[rng.random(len(points)) < 0.02, 'elevation'] = np.nan
+    points = pd.concat([points, edges], ignore_index=True)
+    points.to_csv(paths['points'], index=False)
+    paths['root'] = root
+    return paths
+
+
+@pytest.fixture(scope='module')
+def reference(dataset):
+    """タイルに分けない pipeline の出力フォルダ"""
+    out_dir = str(dataset['root'] / 'reference')
+    _quiet(pipeline, dataset['domain'], dataset['basin'], CELLS, CELLS, dataset['points'], out_dir,
+           statistics=STATISTICS)
+    return out_dir
+
+
+def _read_outputs(out_dir):
+    import geopandas as gpd
+
+    return [gpd.read_file(os.path.join(out_dir, f'{name}_mesh_elev.shp')) for name in ('basin', 'domain')]
+
+
+def _assert_same_outputs(out_dir, reference, exact=True):
+    for actual, expected in zip(_read_outputs(out_dir), _read_outputs(reference)):
+        assert list(actual.columns) == list(expected.columns)
+        assert len(actual) == len(expected)
+        np.testing.assert_array_equal(actual.geometry.bounds.to_numpy(),
+                                      expected.geometry.bounds.to_numpy())
+        np.testing.assert_array_equal(actual['pnt_count'], expected['pnt_count'])
+        for name in OUTPUT_FIELDS:
+            if exact:
+                np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+            else:
+                np.testing.assert_allclose(actual[name], expected[name], rtol=0, atol=1e-9,
+                                           err_msg=name)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_tiled_matches_pipeline(dataset, reference, tmp_path, jobs):
+    _quiet(pipeline_tiled, dataset['domain'], dataset['basin'], CELLS, CELLS, dataset['points'],
+           str(tmp_path), tile_size=TILE_SIZE, jobs=jobs, statistics=STATISTICS)
+    _assert_same_outputs(str(tmp_path), reference)
+
+
+def test_points_on_cell_edges_are_not_counted(dataset, reference):
+    """格子線上の点は gpd.sjoin(predicate='within') と同じくどのセルにも含まれない"""
+    import geopandas as gpd
+
+    _, domain = _read_outputs(reference)
+    points = pd.read_csv(dataset['points'])
+    points = gpd.GeoDataFrame(points, geometry=gpd.points_from_xy(points['x'], points['y']),
+                              crs=domain.crs)
+    joined = gpd.sjoin(points, domain[['geometry']], predicate='within', how='inner')
+    expected = np.bincount(joined['index_right'], minlength=len(domain))
+    # 流域外のセルの点数は 0
+    expected[domain['elevation'].to_numpy() == -9999] = 0
+    counted = domain['pnt_count'].to_numpy()
+    np.testing.assert_array_equal(counted[counted > 0], expected[counted > 0])
+    cell = (EXTENT[2] - EXTENT[0]) / CELLS
+    on_edge = (points['x'] % cell == 0) | (points['y'] % cell == 0)
+    assert on_edge.sum() >= 900
+    assert not joined.index.isin(points.index[on_edge]).any()
+
+
+def test_tiled_ascii_matches_pipeline(dataset, reference, tmp_path):
+    from src.shp_to_asc.core import read_ascii_grid
+
+    ascii_path = str(tmp_path / 'domain.asc')
+    _quiet(pipeline_tiled, dataset['domain'], dataset['basin'], CELLS, CELLS, dataset['points'],
+           str(tmp_path), tile_size=TILE_SIZE, jobs=1, ascii_path=ascii_path)
+    raster, _ = read_ascii_grid(ascii_path, dtype='float64')
+    _, domain = _read_outputs(reference)
+    # 計算領域のフィーチャは X 方向が外側・Y 方向が内側（南から北）の順
+    expected = domain['elevation'].to_numpy().reshape(CELLS, CELLS).T[::-1]
+    np.testing.assert_allclose(raster, np.round(expected.astype('float32'), 3), rtol=0, atol=1e-3)
+
+
+def test_tiled_rejects_statistics_with_ascii(dataset, tmp_path):
+    with pytest.raises(ValueError):
+        pipeline_tiled(dataset['domain'], dataset['basin'], CELLS, CELLS, dataset['points'],
+                       str(tmp_path), tile_size=TILE_SIZE, jobs=1, ascii_path=str(tmp_path / 'a.asc'),
+                       statistics=['min'])
+
+
+@pytest.fixture(scope='module')
+def point_index(dataset):
+    """点群の索引（タイルの大きさはセルの大きさで割り切れない）"""
+    from src.make_shp.point_tiles import partition_points
+
+    index_dir = str(dataset['root'] / 'points_index')
+    _quiet(partition_points, dataset['points'], index_dir, tile_size=1500.0, cells_per_tile=8)
+    return index_dir
+
+
+def test_pipeline_with_point_index_matches_csv(dataset, reference, point_index, tmp_path):
+    # 索引では点の順序がタイル順になるため、和の誤差の分だけ平均・標準偏差がずれうる
+    _quiet(pipeline, dataset['domain'], dataset['basin'], CELLS, CELLS, point_index, str(tmp_path),
+           statistics=STATISTICS)
+    _assert_same_outputs(str(tmp_path), reference, exact=False)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_tiled_with_point_index_matches_csv(dataset, reference, point_index, tmp_path, jobs):
+    _quiet(pipeline_tiled, dataset['domain'], dataset['basin'], CELLS, CELLS, point_index,
+           str(tmp_path), tile_size=TILE_SIZE, jobs=jobs, statistics=STATISTICS)
+    _assert_same_outputs(str(tmp_path), reference, exact=False)
+
+
+def test_median_within_half_resolution(dataset, reference):
+    """elev_med は点の標高の中央値との差が分解能の半分以内"""
+    import geopandas as gpd
+    from src.make_shp.add_elevation import DEFAULT_MEDIAN_RESOLUTION
+
+    _, domain = _read_outputs(reference)
+    points = pd.read_csv(dataset['points']).dropna(subset=['elevation'])
+    points = gpd.GeoDataFrame(points, geometry=gpd.points_from_xy(points['x'], points['y']),
+                              crs=domain.crs)
+    joined = gpd.sjoin(points, domain[['geometry']], predicate='within', how='inner')
+    medians = joined.groupby('index_right')['elevation'].median()
+    actual = domain['elev_med'].to_numpy()[medians.index]
+    measured = actual != -9999
+    assert measured.sum() > 100
+    np.testing.assert_allclose(actual[measured], medians.to_numpy()[measured], rtol=0,
+                               atol=DEFAULT_MEDIAN_RESOLUTION / 2 + 1e-9)